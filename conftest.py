@@ -0,0 +1,23 @@
+# makes `module` importable in tests run from a checkout, without installing anything
+from pathlib import Path
+import shutil
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent
+
+@pytest.fixture
+def checkout(tmp_path):
+  """
+  copy the project to `tmp_path/<name>`, processes keep their layers under their working directory
+  """
+
+  def make(name: str) -> Path:
+    target = tmp_path / name
+    target.mkdir()
+    shutil.copy2(ROOT / 'main.py', target / 'main.py')
+    for directory in ['module', 'patch', 'support']:
+      shutil.copytree(ROOT / directory, target / directory, ignore = shutil.ignore_patterns('__pycache__'))
+    return target
+
+  return make
@@ -4,38 +4,66 @@ import argparse
 import logging
 import os
 from pathlib import Path
+import re
 import shutil
 import subprocess
 from subprocess import PIPE
 from typing import Dict, List
 
+from module import autoconf_cache, ccache, cmake_cache, disk_usage, hooks, metrics, prometheus, steplog, timing
+from module.distributed import Coordinator, parse_address, run_worker
+from module.fingerprint import step_fingerprints, template_fingerprints
 from module.path import ProjectPaths
 from module.prepare_source import prepare_source
-from module.profile import BRANCHES, PROFILES, resolve_profile
-from module.util import ensure, overlayfs_ro
+from module.profile import BRANCHES, PROFILES, BranchProfile, resolve_profile
+from module.runner import Build, Journal, Task, list_steps, make_tasks, needed_sources, print_plan, run_tasks
+from module.sampler import ResourceSampler
+from module.step import Step, function_inputs
+from module.store import remove_linked
+from module.util import ensure, overlayfs_ro, package_layers
+from module.watch import watch
+from module.whatif import report_what_if
+from module.workspace import DiskMonitor, mount_tmpfs
 
-from module.host_lib import build_host_lib
-from module.cross_toolchain import build_cross_toolchain
-from module.target_lib import build_target_lib
+from module.host_lib import host_lib_steps
+from module.cross_toolchain import cross_toolchain_steps
+from module.target_lib import target_lib_steps
 
 def get_gcc_triplet():
   result = subprocess.run(['gcc', '-dumpmachine'], stdout = PIPE, stderr = PIPE, check = True)
   return result.stdout.decode('utf-8').strip()
 
+def arch_list(value: str) -> List[str]:
+  result = value.split(',')
+  for arch in result:
+    if arch not in PROFILES:
+      raise argparse.ArgumentTypeError(f'invalid arch: {arch} (choose from {", ".join(PROFILES.keys())})')
+  return result
+
+def branch_list(value: str) -> List[str]:
+  result = value.split(',')
+  for branch in result:
+    if branch not in BRANCHES:
+      raise argparse.ArgumentTypeError(f'invalid branch: {branch} (choose from {", ".join(BRANCHES.keys())})')
+  return result
+
+def tmpfs_size(value: str) -> str:
+  if not re.fullmatch(r'[0-9]+[kKmMgG%]?', value):
+    raise argparse.ArgumentTypeError(f'invalid size: {value}')
+  return value
+
 def parse_args() -> argparse.Namespace:
   parser = argparse.ArgumentParser()
   parser.add_argument(
     '-a', '--arch', '--architecture',
-    type = str,
-    choices = PROFILES.keys(),
-    required = True,
+    type = arch_list,
+    help = 'Comma-separated list of architectures to build in one batch',
   )
   parser.add_argument(
     '-b', '--branch',
-    type = str,
-    choices = BRANCHES.keys(),
-    default = 'main',
-    help = 'Qt branch to build',
+    type = branch_list,
+    default = ['main'],
+    help = 'Comma-separated list of Qt branches to build, layers with identical inputs are shared',
   )
 
   gcc_triplet = get_gcc_triplet()
@@ -56,11 +84,203 @@ def parse_args() -> argparse.Namespace:
     type = int,
     default = os.cpu_count(),
   )
+  parser.add_argument(
+    '-p', '--parallel-steps',
+    type = int,
+    help = 'Number of steps to run concurrently, sharing --jobs (default: number of arch/branch builds)',
+  )
   parser.add_argument(
     '--download-only',
     action = 'store_true',
     help = 'Download sources only',
   )
+  parser.add_argument(
+    '--build-root',
+    type = Path,
+    default = Path('/tmp/build'),
+    help = 'Directory for source trees and build dirs (default: /tmp/build)',
+  )
+  parser.add_argument(
+    '--tmpfs',
+    type = tmpfs_size,
+    metavar = 'SIZE',
+    help = 'Mount a tmpfs of SIZE (e.g. 48G) on the build root; source trees are freed, or moved to --spill-dir, once no remaining step needs them',
+  )
+  parser.add_argument(
+    '--spill-dir',
+    type = Path,
+    help = 'With --tmpfs, keep finished source trees on disk here instead of freeing them',
+  )
+  parser.add_argument(
+    '--gc',
+    action = 'store_true',
+    help = 'Delete source trees and build dirs as soon as no remaining step needs them',
+  )
+  parser.add_argument(
+    '--check-free',
+    action = 'store_true',
+    help = 'Before building, fail if the disk usage recorded by the previous run does not fit into the free space',
+  )
+  parser.add_argument(
+    '--ccache',
+    action = 'store_true',
+    help = 'Compile through ccache, sharing one cache between arches and branches',
+  )
+  parser.add_argument(
+    '--autoconf-cache',
+    action = 'store_true',
+    help = 'Share toolchain results of cross configure runs, per target and toolchain',
+  )
+  parser.add_argument(
+    '--cmake-cache',
+    action = 'store_true',
+    help = 'Preseed Qt configure with the check results of its previous configure',
+  )
+  parser.add_argument(
+    '--multi-target-binutils',
+    action = 'store_true',
+    help = 'Build libbfd and opcodes once for all arches, with as and ld of every arch linked against them',
+  )
+  parser.add_argument(
+    '--coordinator',
+    type = parse_address,
+    metavar = '[HOST:]PORT',
+    help = 'Listen for workers and build layers on them, linking and packaging locally',
+  )
+  parser.add_argument(
+    '--worker',
+    type = parse_address,
+    metavar = 'HOST:PORT',
+    help = 'Build steps handed out by the coordinator at HOST:PORT until it finishes',
+  )
+  parser.add_argument(
+    '--status-file',
+    type = Path,
+    metavar = 'FILE',
+    help = 'Keep a JSON status of done, running and pending steps and the ETA in FILE, for dashboards',
+  )
+  parser.add_argument(
+    '--step-logs',
+    action = 'store_true',
+    help = 'Write the output of each step to a zstd-compressed log in layer/log, printing one line per step and the tail of the log of a failed step',
+  )
+  parser.add_argument(
+    '--log-tail',
+    type = int,
+    default = 50,
+    metavar = 'N',
+    help = 'With --step-logs, print the last N lines of the log of a failed step (default: 50)',
+  )
+  parser.add_argument(
+    '--logs',
+    nargs = '?',
+    const = '',
+    metavar = '[RUN/]STEP',
+    help = 'List runs with step logs, or print the log of STEP (from RUN, or the latest run that has it), then exit',
+  )
+  parser.add_argument(
+    '--timing',
+    type = Path,
+    metavar = 'DIR',
+    help = 'Record wall time, CPU time and peak RSS of each step and its phases to DIR/timing.json and a Chrome trace DIR/trace.json',
+  )
+  parser.add_argument(
+    '--sample-interval',
+    type = float,
+    metavar = 'SECONDS',
+    help = 'With --timing, sample CPU, run queue, memory, disk I/O and compiler processes every SECONDS into the trace',
+  )
+  parser.add_argument(
+    '--plugin',
+    type = str,
+    action = 'append',
+    default = [],
+    metavar = 'MODULE|FILE.py',
+    help = 'Load a plugin whose setup(config) registers handlers for step, subprocess, layer and package events (can be repeated)',
+  )
+  parser.add_argument(
+    '--prometheus-textfile',
+    type = Path,
+    metavar = 'FILE',
+    help = 'Keep step durations, cache hits and misses, downloads, peak RSS and package sizes in FILE in Prometheus text format, for the node exporter textfile collector',
+  )
+  parser.add_argument(
+    '--simulate',
+    action = 'store_true',
+    help = 'Do not build: each step sleeps for its recorded duration and writes a synthetic layer, kept in simulate/',
+  )
+  parser.add_argument(
+    '--simulate-scale',
+    type = float,
+    default = 1.0,
+    metavar = 'FACTOR',
+    help = 'With --simulate, multiply recorded durations by FACTOR (default: 1)',
+  )
+  parser.add_argument(
+    '--simulate-duration',
+    type = float,
+    default = 1.0,
+    metavar = 'SECONDS',
+    help = 'With --simulate, duration of steps without a recorded duration (default: 1)',
+  )
+  parser.add_argument(
+    '--from-step',
+    type = str,
+    metavar = 'STEP',
+    help = 'Rebuild STEP and the steps depending on it, ignoring completed steps',
+  )
+  parser.add_argument(
+    '--only',
+    type = str,
+    action = 'append',
+    metavar = 'STEP[,STEP...]',
+    help = 'Build only the given steps (can be repeated)',
+  )
+  parser.add_argument(
+    '--package',
+    type = str,
+    action = 'append',
+    metavar = 'STEP[,STEP...]',
+    help = 'Build the given steps and the steps they depend on (can be repeated)',
+  )
+  parser.add_argument(
+    '--watch',
+    action = 'store_true',
+    help = 'After building, rebuild the steps affected by changes to patch/ and support/ until interrupted',
+  )
+  parser.add_argument(
+    '--plan',
+    action = 'store_true',
+    help = 'Print the steps to run and an estimated duration, then exit',
+  )
+  parser.add_argument(
+    '--what-if',
+    action = 'store_true',
+    help = 'From recorded durations, print the critical path, the simulated makespan for --cores and --parallel-steps, and the steps worth speeding up, then exit',
+  )
+  parser.add_argument(
+    '--cores',
+    type = int,
+    metavar = 'N',
+    help = 'With --what-if, the number of cores to simulate (default: --jobs)',
+  )
+  parser.add_argument(
+    '--metrics-compare',
+    action = 'store_true',
+    help = 'Compare the latest recorded run of each arch and branch with the median of its previous runs, fail on regressions, then exit',
+  )
+  parser.add_argument(
+    '--metrics-threshold',
+    type = float,
+    default = 20.0,
+    metavar = 'PERCENT',
+    help = 'With --metrics-compare, the slowdown or growth counted as regression (default: 20)',
+  )
+  parser.add_argument(
+    '--list-steps',
+    action = 'store_true',
+    help = 'List build steps and their status',
+  )
   parser.add_argument(
     '-v', '--verbose',
     action = 'count',
@@ -69,9 +289,21 @@ def parse_args() -> argparse.Namespace:
   )
 
   result = parser.parse_args()
+  if result.sample_interval and not result.timing:
+    parser.error('--sample-interval requires --timing')
+  if result.worker:
+    # the coordinator sends the branch and arch of each step
+    result.arch = result.arch or []
+  elif not result.arch:
+    parser.error('the following arguments are required: -a/--arch/--architecture')
+  if result.parallel_steps is None:
+    result.parallel_steps = len(result.arch) * len(result.branch)
   return result
 
 def clean(config: argparse.Namespace, paths: ProjectPaths):
+  remove_linked(paths)
+  if paths.source_dir.exists():
+    shutil.rmtree(paths.source_dir)
   if paths.build_dir.exists():
     shutil.rmtree(paths.build_dir)
   if paths.layer_dir.exists():
@@ -102,26 +334,47 @@ def check_file_collision(layers: list[Path]):
   if not ok:
     raise Exception('file collision')
 
-def package(paths: ProjectPaths):
-  layers = []
-  for layer_group in (paths.layer_host, paths.layer_x, paths.layer_target):
-    for k, v in layer_group._asdict().items():
-      if k in ('prefix', 'stub', 'freetype_decycle'):
-        continue
-      layers.append(v)
-
+def package(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
+  layers = package_layers(paths, build_steps(ver, config))
   check_file_collision(layers)
 
   with overlayfs_ro('/usr/local', [
     *map(lambda layer: layer / 'usr/local', layers),
-  ]):
+  ]), timing.span('package'):
     subprocess.run([
       'tar',
       '-C', '/usr/local',
       '-c', '.',
-      '-f', paths.container_dir / 'qt.tar',
+      '-f', paths.package_file,
     ], check = True)
 
+def build_steps(ver: BranchProfile, config: argparse.Namespace) -> List[Step]:
+  return [
+    *host_lib_steps(ver),
+    *cross_toolchain_steps(ver, config),
+    *target_lib_steps(ver),
+    Step('package', package),
+  ]
+
+def make_build(config: argparse.Namespace, branch: str, arch: str) -> Build:
+  ver = resolve_profile(branch, arch)
+  paths = ProjectPaths(config, ver)
+  steps = build_steps(ver, config)
+  fingerprints = step_fingerprints(steps, ver, paths, config)
+  templates = template_fingerprints(steps, ver, paths, config)
+  return Build(ver, paths, steps, Journal(paths.journal_file), fingerprints, templates)
+
+def make_builds(config: argparse.Namespace) -> List[Build]:
+  return [make_build(config, branch, arch) for branch in config.branch for arch in config.arch]
+
+def enable_caches(config: argparse.Namespace, paths: ProjectPaths):
+  if config.autoconf_cache:
+    autoconf_cache.enable(paths)
+  if config.cmake_cache:
+    cmake_cache.enable(paths)
+  if config.ccache:
+    ccache.enable(paths)
+
 def main():
   config = parse_args()
 
@@ -132,26 +385,118 @@ def main():
   else:
     logging.basicConfig(level = logging.ERROR)
 
-  ver = resolve_profile(config)
-  paths = ProjectPaths(config, ver)
+  for plugin in config.plugin:
+    hooks.load_plugin(plugin, config)
+  if config.prometheus_textfile:
+    prometheus.setup(config)
+
+  if config.worker:
+    def prepare_worker_task(task: Task, task_config: argparse.Namespace):
+      build = task.build
+      enable_caches(config, build.paths)
+      if config.step_logs and not steplog.enabled():
+        steplog.enable(steplog.new_run_dir(build.paths.log_dir), config.log_tail)
+      prepare_dirs(build.paths)
+      if not task_config.simulate:
+        with hooks.running(build.ver.branch, build.ver.arch, 'prepare'):
+          prepare_source(build.ver, build.paths, False, function_inputs(task.step.func).sources)
+
+    run_worker(config.worker, config, make_build, prepare_worker_task)
+    return
+
+  builds = make_builds(config)
+
+  if config.list_steps:
+    for build in builds:
+      if len(builds) > 1:
+        print(f'# {build.ver.branch}/{build.ver.arch}')
+      list_steps(build)
+    return
+
+  if config.plan:
+    print_plan(make_tasks(builds, config))
+    return
+
+  if config.logs is not None:
+    for build in builds:
+      if not config.logs:
+        steplog.list_runs(build.paths.log_dir, build.ver.branch, build.ver.arch)
+        continue
+      log = steplog.find_log(build.paths.log_dir, build.ver.branch, build.ver.arch, config.logs)
+      if log is None:
+        raise Exception(f'no log of {config.logs} for {build.ver.branch}/{build.ver.arch}')
+      print(steplog.read_log(log), end = '')
+    return
+
+  if config.what_if:
+    report_what_if(builds, config)
+    return
+
+  if config.metrics_compare:
+    regressions = sum(metrics.compare(build.paths, build.ver, config.metrics_threshold / 100) for build in builds)
+    if regressions:
+      raise SystemExit(1)
+    return
 
   if config.clean:
-    clean(config, paths)
+    for build in builds:
+      clean(config, build.paths)
+    # reload, --clean removes the journal
+    builds = make_builds(config)
+
+  if config.tmpfs and not config.download_only:
+    mount_tmpfs(config.build_root, config.tmpfs)
 
-  prepare_dirs(paths)
+  if config.timing:
+    timing.enable(config.timing)
+  if config.step_logs:
+    steplog.enable(steplog.new_run_dir(builds[0].paths.log_dir), config.log_tail)
 
-  prepare_source(ver, paths, config.download_only)
+  # trees of completed steps are neither extracted nor cloned
+  tasks = make_tasks(builds, config)
+  for build in builds:
+    prepare_dirs(build.paths)
+    if not config.simulate:
+      with timing.span(f'{build.ver.branch}/{build.ver.arch}:prepare', 'prepare'), hooks.running(build.ver.branch, build.ver.arch, 'prepare'):
+        prepare_source(build.ver, build.paths, config.download_only, needed_sources(tasks, build))
 
   if config.download_only:
     return
 
-  build_host_lib(ver, paths, config)
+  enable_caches(config, builds[0].paths)
+  if config.ccache:
+    ccache_stats = ccache.stats()
 
-  build_cross_toolchain(ver, paths, config)
+  coordinator = None
+  if config.coordinator:
+    coordinator = Coordinator(config.coordinator, builds[0].paths.blob_cache_dir)
 
-  build_target_lib(ver, paths, config)
+  disk = DiskMonitor(config.build_root)
+  disk.start()
+  sampler = None
+  if config.sample_interval:
+    sampler = ResourceSampler(config.timing, config.sample_interval)
+    sampler.start()
+  try:
+    run_tasks(tasks, config, coordinator)
+  except Exception as e:
+    if not config.watch:
+      raise
+    logging.critical('Build failed: %s' % e)
+  finally:
+    disk.stop()
+    disk.report()
+    disk_usage.report(builds[0].paths.root_dir)
+    if sampler is not None:
+      sampler.stop()
+    timing.write_report()
+    metrics.save()
+    hooks.emit('run_end')
+    if config.ccache:
+      ccache.report(ccache_stats)
 
-  package(paths)
+  if config.watch:
+    watch(builds, make_builds, config)
 
 if __name__ == "__main__":
   main()
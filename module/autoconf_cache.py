@@ -0,0 +1,105 @@
+import fcntl
+import logging
+import os
+from pathlib import Path
+import re
+import shutil
+from typing import Dict, List, Optional
+
+from module.path import ProjectPaths
+
+# set by `enable`
+_cache_dir: Optional[Path] = None
+# set by `select` for the running step
+_cache_file: Optional[Path] = None
+
+# results that only depend on the toolchain, never on the dependency layers a step mounts.
+# function, type, system and libtool checks are left out: they see each package's LIBS,
+# CPPFLAGS and includes
+SHARED_PREFIXES = [
+  'ac_cv_alignof_',
+  'ac_cv_build',
+  'ac_cv_c_',
+  'ac_cv_exeext',
+  'ac_cv_host',
+  'ac_cv_objext',
+  'ac_cv_path_EGREP',
+  'ac_cv_path_FGREP',
+  'ac_cv_path_GREP',
+  'ac_cv_path_SED',
+  'ac_cv_sizeof_',
+]
+
+_ENTRY = re.compile(r'^(?:test "\$\{(\w+)\+set\}" = set \|\| )?(\w+)=')
+
+def enable(paths: ProjectPaths):
+  global _cache_dir
+  _cache_dir = paths.autoconf_cache_dir
+  _cache_dir.mkdir(parents = True, exist_ok = True)
+
+def enabled() -> bool:
+  return _cache_dir is not None
+
+def select(triplet: str, toolchain_fingerprint: str):
+  """
+  use the cache of a toolchain, a changed toolchain starts over with a new file
+  """
+
+  global _cache_file
+  if enabled():
+    _cache_file = _cache_dir / f'{triplet}-{toolchain_fingerprint[:16]}.cache'
+
+def _entries(path: Path) -> Dict[str, str]:
+  result = {}
+  if path.exists():
+    for line in path.read_text().splitlines():
+      match = _ENTRY.match(line)
+      if match:
+        result[match.group(1) or match.group(2)] = line
+  return result
+
+def _is_shared(name: str) -> bool:
+  return any(name.startswith(prefix) for prefix in SHARED_PREFIXES)
+
+def configure_args(cwd: Path, args: List[str]) -> List[str]:
+  """
+  seed a private cache file from the shared one, for cross configures of autoconf packages
+  """
+
+  if _cache_file is None or not any(arg.startswith('--host=') for arg in args):
+    return []
+  if not (cwd.parent / 'configure.ac').exists():
+    return []
+  private = cwd / 'config.cache'
+  if _cache_file.exists():
+    shutil.copyfile(_cache_file, private)
+  elif private.exists():
+    private.unlink()
+  return [f'--cache-file={private}']
+
+def merge(cwd: Path, args: List[str]):
+  """
+  add the toolchain results of a successful configure to the shared cache
+
+  concurrent steps serialize on a lock file, the cache is replaced atomically so that
+  readers never see a partial file.
+  """
+
+  private = cwd / 'config.cache'
+  if _cache_file is None or f'--cache-file={private}' not in args or not private.exists():
+    return
+  new = {name: line for name, line in _entries(private).items() if _is_shared(name)}
+
+  lock = _cache_file.with_name(_cache_file.name + '.lock')
+  with open(lock, 'w') as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    entries = _entries(_cache_file)
+    added = [name for name in new if name not in entries]
+    if not added:
+      return
+    for name in added:
+      entries[name] = new[name]
+    temp = _cache_file.with_name(f'{_cache_file.name}.{os.getpid()}')
+    temp.write_text(''.join(f'{entries[name]}\n' for name in sorted(entries)))
+    os.replace(temp, _cache_file)
+  logging.info('Added %d results to %s' % (len(added), _cache_file.name))
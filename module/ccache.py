@@ -0,0 +1,140 @@
+import logging
+import os
+from pathlib import Path
+import shutil
+import subprocess
+from typing import Dict, List, Optional
+
+from module import cmake_cache
+from module.path import ProjectPaths
+from module.profile import PROFILES
+
+# wrapper directory, set by `enable`
+_wrapper_dir: Optional[Path] = None
+
+STATS_HIT = ['direct_cache_hit', 'preprocessed_cache_hit']
+STATS_MISS = ['cache_miss']
+
+def enabled() -> bool:
+  return _wrapper_dir is not None
+
+def _compilers() -> List[str]:
+  result = ['gcc', 'g++']
+  for target in sorted({info.target for info in PROFILES.values()}):
+    result += [f'{target}-gcc', f'{target}-g++']
+  return result
+
+def enable(paths: ProjectPaths):
+  """
+  compile through ccache, with one cache directory shared by all arches and branches
+
+  wrappers live outside the layers, so that enabling the cache does not change any
+  layer fingerprint. the wrapped compiler is looked up in PATH when the wrapper runs,
+  i.e. in the toolchain layers mounted on /usr/local.
+  """
+
+  global _wrapper_dir
+
+  if shutil.which('ccache') is None:
+    raise Exception('ccache not found, install it or drop --ccache')
+
+  os.environ['CCACHE_DIR'] = str(paths.ccache_dir)
+  # arch and branch build trees differ only by this prefix
+  os.environ['CCACHE_BASEDIR'] = str(paths.build_root)
+  # compilers are rebuilt into new store entries, their mtime says nothing
+  os.environ['CCACHE_COMPILERCHECK'] = 'content'
+
+  wrapper_dir = paths.ccache_dir / 'bin'
+  wrapper_dir.mkdir(parents = True, exist_ok = True)
+  for compiler in _compilers():
+    wrapper = wrapper_dir / compiler
+    content = f'#!/bin/sh\nexec ccache {compiler} "$@"\n'
+    if not wrapper.exists() or wrapper.read_text() != content:
+      wrapper.write_text(content)
+      wrapper.chmod(0o755)
+
+  meson_dir = paths.ccache_dir / 'meson'
+  meson_dir.mkdir(parents = True, exist_ok = True)
+  for target in sorted({info.target for info in PROFILES.values()}):
+    (meson_dir / f'{target}.txt').write_text(
+      '[binaries]\n'
+      f"c = ['ccache', '{target}-gcc']\n"
+      f"cpp = ['ccache', '{target}-g++']\n"
+    )
+
+  _wrapper_dir = wrapper_dir
+
+def wrapper(compiler: str) -> str:
+  return str(_wrapper_dir / compiler)
+
+def configure_env(cwd: Path, args: List[str]) -> Dict[str, str]:
+  """
+  CC and CXX for autotools configure, cross compilers when `--host` is given
+
+  hand-written configure scripts (musl, zlib) derive the cross compiler from the target
+  themselves and are left alone.
+  """
+
+  if not enabled():
+    return {}
+  if cmake_cache.is_qt_configure(cwd):
+    # Qt's configure drives CMake, which picks up the launcher instead
+    return cmake_launcher_env()
+  if not (cwd.parent / 'configure.ac').exists():
+    return {}
+  prefix = ''
+  for arg in args:
+    if arg.startswith('--host='):
+      prefix = arg[len('--host='):] + '-'
+  return {'CC': wrapper(f'{prefix}gcc'), 'CXX': wrapper(f'{prefix}g++')}
+
+def cmake_launcher_env() -> Dict[str, str]:
+  if not enabled():
+    return {}
+  return {'CMAKE_C_COMPILER_LAUNCHER': 'ccache', 'CMAKE_CXX_COMPILER_LAUNCHER': 'ccache'}
+
+def cmake_args() -> List[str]:
+  if not enabled():
+    return []
+  return [f'-D{k}={v}' for k, v in cmake_launcher_env().items()]
+
+def meson_args(extra_args: List[str]) -> List[str]:
+  """
+  a second cross file overriding the compilers, meson merges cross files in order
+  """
+
+  if not enabled():
+    return []
+  for i, arg in enumerate(extra_args[:-1]):
+    if arg == '--cross-file':
+      target = Path(extra_args[i + 1]).stem
+      return ['--cross-file', str(_wrapper_dir.parent / 'meson' / f'{target}.txt')]
+  return []
+
+def meson_env() -> Dict[str, str]:
+  # native compilers, the build machine's in cross builds
+  if not enabled():
+    return {}
+  return {'CC': wrapper('gcc'), 'CXX': wrapper('g++')}
+
+def stats() -> Dict[str, int]:
+  res = subprocess.run(['ccache', '--print-stats'], capture_output = True, text = True)
+  if res.returncode != 0:
+    logging.warning('ccache --print-stats failed: %s' % res.stderr.strip())
+    return {}
+  result = {}
+  for line in res.stdout.splitlines():
+    key, _, value = line.partition('\t')
+    if value.isdigit():
+      result[key] = int(value)
+  return result
+
+def report(before: Dict[str, int]):
+  after = stats()
+  hits = sum(after.get(k, 0) - before.get(k, 0) for k in STATS_HIT)
+  misses = sum(after.get(k, 0) - before.get(k, 0) for k in STATS_MISS)
+  total = hits + misses
+  if total:
+    print(f'ccache: {hits}/{total} hits ({hits * 100 / total:.1f}%), {misses} misses')
+  else:
+    print('ccache: no cacheable compilations')
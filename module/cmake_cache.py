@@ -0,0 +1,66 @@
+import logging
+import os
+from pathlib import Path
+import re
+from typing import List, Optional
+
+from module.path import ProjectPaths
+
+# set by `enable`
+_cache_dir: Optional[Path] = None
+# set by `select` for the running step
+_cache_file: Optional[Path] = None
+
+# results of check_*() and Qt's compile tests, CMake skips a check whose variable is set
+_RESULT = re.compile(r'^((?:CMAKE_)?HAVE_\w+|TEST_\w+|QT_COMPILER_SUPPORTS_\w+):(\w+)=(.*)$')
+
+def enable(paths: ProjectPaths):
+  global _cache_dir
+  _cache_dir = paths.cmake_cache_dir
+  _cache_dir.mkdir(parents = True, exist_ok = True)
+
+def enabled() -> bool:
+  return _cache_dir is not None
+
+def select(key: str):
+  """
+  use the initial cache of a step, `key` covers the toolchain and the dependency layers
+  """
+
+  global _cache_file
+  if enabled():
+    _cache_file = _cache_dir / f'{key[:32]}.cmake'
+
+def is_qt_configure(cwd: Path) -> bool:
+  return (cwd.parent / 'configure.cmake').exists()
+
+def configure_args() -> List[str]:
+  """
+  CMake arguments for Qt's configure or qt-configure-module, following `--`
+  """
+
+  if _cache_file is None or not _cache_file.exists():
+    return []
+  logging.info('Preseeding configure results from %s' % _cache_file.name)
+  return ['--', '-C', str(_cache_file)]
+
+def capture(build_dir: Path):
+  """
+  keep the check results of a successful configure as an initial cache
+  """
+
+  cache = build_dir / 'CMakeCache.txt'
+  if _cache_file is None or not cache.exists():
+    return
+  lines = []
+  for line in cache.read_text().splitlines():
+    match = _RESULT.match(line)
+    if match:
+      name, kind, value = match.groups()
+      value = value.replace('\\', '\\\\').replace('"', '\\"')
+      lines.append(f'set({name} "{value}" CACHE {kind} "")\n')
+  if not lines:
+    return
+  temp = _cache_file.with_name(f'{_cache_file.name}.{os.getpid()}')
+  temp.write_text(''.join(sorted(lines)))
+  os.replace(temp, _cache_file)
@@ -4,10 +4,12 @@ import os
 from packaging.version import Version
 import shutil
 import subprocess
+from typing import List
 
 from module.debug import shell_here
 from module.path import ProjectPaths
-from module.profile import BranchProfile
+from module.profile import PROFILES, BranchProfile
+from module.step import Step
 from module.util import ensure, overlayfs_ro
 from module.util import cflags_host, cflags_target, configure, make_custom, make_default, make_destdir_install
 from module.util import cmake_build, cmake_config, cmake_destdir_install
@@ -20,12 +22,29 @@ def _cmake(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
 
 def _linux_headers(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
   prefix = paths.layer_x.linux / f'usr/local/{ver.target}'
-
-  make_custom(paths.src_dir.linux, [
-    'headers_install',
-    f'ARCH={ver.kernel_arch}',
-    f'INSTALL_HDR_PATH={prefix}',
-  ], config.jobs)
+  cache = paths.linux_headers_cache
+
+  if not (cache / '.complete').exists():
+    # arches sharing a kernel_arch may fill the cache concurrently, the first rename wins
+    temp = cache.with_name(f'{cache.name}.{os.getpid()}')
+    ensure(cache.parent)
+    if temp.exists():
+      shutil.rmtree(temp)
+    make_custom(paths.src_dir.linux, [
+      'headers_install',
+      f'ARCH={ver.kernel_arch}',
+      f'INSTALL_HDR_PATH={temp}',
+    ], config.jobs)
+    (temp / '.complete').touch()
+    try:
+      os.rename(temp, cache)
+    except OSError:
+      shutil.rmtree(temp)
+  else:
+    logging.info('Using cached Linux headers %s' % cache.name)
+
+  ensure(prefix)
+  subprocess.run(['cp', '-al', cache / 'include', prefix], check = True)
 
 def _stub(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
   limits_h = paths.layer_x.stub / f'usr/local/{ver.target}/sys-include/limits.h'
@@ -52,6 +71,80 @@ def _binutils(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespac
   make_default(build_dir, config.jobs)
   make_destdir_install(build_dir, paths.layer_x.binutils)
 
+# tools that have no target-specific code besides libbfd and opcodes
+BINUTILS_SHARED_TOOLS = [
+  'addr2line', 'ar', 'c++filt', 'elfedit', 'nm', 'objcopy', 'objdump',
+  'ranlib', 'readelf', 'size', 'strings', 'strip',
+]
+
+# tools with a default target, tooldir and search path, built per target
+BINUTILS_TARGET_TOOLS = ['as', 'ld', 'ld.bfd']
+
+def _binutils_multi(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
+  targets = sorted({info.target for info in PROFILES.values()})
+  build_dir = paths.src_dir.binutils / 'build-multi'
+  ensure(build_dir)
+
+  configure(build_dir, [
+    '--prefix=/usr/local',
+    f'--target={targets[0]}',
+    f'--enable-targets={",".join(targets)}',
+    '--enable-64-bit-bfd',
+    # static build
+    '--disable-shared',
+    '--enable-static',
+    # features
+    '--disable-gas',
+    '--disable-gprof',
+    '--disable-gprofng',
+    '--disable-install-libbfd',
+    '--disable-ld',
+    '--disable-multilib',
+    '--disable-nls',
+    *cflags_host(),
+  ])
+  make_default(build_dir, config.jobs)
+  make_destdir_install(build_dir, paths.layer_x.binutils_multi)
+
+  # gas and ld of each target, linked against the libbfd and opcodes built above, which
+  # their build dirs find as siblings (`../bfd`, `../opcodes`)
+  for target in targets:
+    for tool in ['gas', 'ld']:
+      tool_dir = build_dir / f'{tool}-{target}'
+      ensure(tool_dir)
+      configure(tool_dir, [
+        '--prefix=/usr/local',
+        f'--target={target}',
+        # static build
+        '--disable-shared',
+        '--enable-static',
+        # features
+        '--disable-nls',
+        *cflags_host(),
+      ], script = paths.src_dir.binutils / tool / 'configure')
+      make_default(tool_dir, config.jobs)
+      make_destdir_install(tool_dir, paths.layer_x.binutils_multi)
+
+def _binutils_shared(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
+  multi = paths.layer_x.binutils_multi / 'usr/local'
+  primary = sorted({info.target for info in PROFILES.values()})[0]
+  prefix = paths.layer_x.binutils / 'usr/local'
+  ensure(prefix / 'bin')
+  ensure(prefix / f'{ver.target}/bin')
+
+  # as and ld built for this target, with its tooldir and ldscripts
+  for tool in BINUTILS_TARGET_TOOLS:
+    shutil.copy2(multi / f'bin/{ver.target}-{tool}', prefix / f'bin/{ver.target}-{tool}')
+    shutil.copy2(multi / f'{ver.target}/bin/{tool}', prefix / f'{ver.target}/bin/{tool}')
+  shutil.copytree(multi / f'{ver.target}/lib/ldscripts', prefix / f'{ver.target}/lib/ldscripts', dirs_exist_ok = True)
+
+  # the rest from the multi-target build, under this target's names
+  for tool in BINUTILS_SHARED_TOOLS:
+    shutil.copy2(multi / f'bin/{primary}-{tool}', prefix / f'bin/{ver.target}-{tool}')
+    tool_dir_bin = multi / f'{primary}/bin/{tool}'
+    if tool_dir_bin.exists():
+      shutil.copy2(tool_dir_bin, prefix / f'{ver.target}/bin/{tool}')
+
 def _gcc(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
   build_dir = paths.src_dir.gcc / 'build-x'
   ensure(build_dir)
@@ -207,14 +300,10 @@ def _pkgconf(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace
     os.remove(alias)
   os.symlink(f'../{ver.target}/bin/pkgconf', bin_dir / f'{ver.target}-pkg-config')
 
-def build_cross_toolchain(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
-  _cmake(ver, paths, config)
-
-  _linux_headers(ver, paths, config)
-
-  _stub(ver, paths, config)
-
-  _binutils(ver, paths, config)
+def _bootstrap(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
+  """
+  gcc and musl depend on each other, build them in interleaved stages
+  """
 
   gcc = _gcc(ver, paths, config)
   gcc.__next__()
@@ -228,6 +317,27 @@ def build_cross_toolchain(ver: BranchProfile, paths: ProjectPaths, config: argpa
 
   gcc.__next__()
 
-  _mimalloc(ver, paths, config)
+def cross_toolchain_steps(ver: BranchProfile, config: argparse.Namespace) -> List[Step]:
+  if config.multi_target_binutils:
+    binutils = [
+      Step('x.binutils_multi', _binutils_multi),
+      Step('x.binutils', _binutils_shared),
+    ]
+  else:
+    binutils = [Step('x.binutils', _binutils)]
+
+  return [
+    Step('x.cmake', _cmake),
+
+    Step('x.linux', _linux_headers),
+
+    Step('x.stub', _stub),
+
+    *binutils,
+
+    Step('x.gcc', _bootstrap, outputs = ('x.musl',)),
+
+    Step('x.mimalloc', _mimalloc),
 
-  _pkgconf(ver, paths, config)
+    Step('x.pkgconf', _pkgconf),
+  ]
@@ -0,0 +1,150 @@
+import os
+from pathlib import Path
+import shutil
+from typing import Dict, List, NamedTuple, Tuple
+
+from module.workspace import format_size
+
+# items shown in the report
+REPORT_ITEMS = 20
+
+class _Tree(NamedTuple):
+  # apparent and allocated bytes of files with a single link
+  apparent: int
+  allocated: int
+  # apparent and allocated bytes of hard-linked files, by (device, inode)
+  linked: Dict[Tuple[int, int], Tuple[int, int]]
+
+  def size(self) -> Tuple[int, int]:
+    return (
+      self.apparent + sum(apparent for apparent, _ in self.linked.values()),
+      self.allocated + sum(allocated for _, allocated in self.linked.values()),
+    )
+
+# each measured tree as of its last measurement, in the order they were first measured
+_trees: Dict[Path, _Tree] = {}
+# what a tree is, for trees whose path does not tell
+_labels: Dict[Path, str] = {}
+_peak_total = 0
+_peak_sizes: Dict[Path, Tuple[int, int]] = {}
+
+def _measure(path: Path) -> _Tree:
+  apparent = 0
+  allocated = 0
+  linked: Dict[Tuple[int, int], Tuple[int, int]] = {}
+  if not os.path.lexists(path):
+    return _Tree(0, 0, linked)
+
+  def add(file: str):
+    nonlocal apparent, allocated
+    try:
+      stat = os.lstat(file)
+    except FileNotFoundError:
+      # removed since it was listed, e.g. a conftest file of a step sharing the tree
+      return
+    if stat.st_nlink > 1:
+      linked[(stat.st_dev, stat.st_ino)] = (stat.st_size, stat.st_blocks * 512)
+    else:
+      apparent += stat.st_size
+      allocated += stat.st_blocks * 512
+
+  if not os.path.isdir(path) or os.path.islink(path):
+    add(str(path))
+  else:
+    for root, dirs, files in os.walk(path):
+      for name in dirs + files:
+        add(os.path.join(root, name))
+  return _Tree(apparent, allocated, linked)
+
+def tree_size(path: Path) -> Tuple[int, int]:
+  """
+  apparent and allocated bytes of a file or tree, counting hard-linked files once
+  """
+
+  return _measure(path).size()
+
+def _charged() -> Dict[Path, Tuple[int, int]]:
+  """
+  apparent and allocated bytes of each tree, a hard-linked file counting for the first tree
+  measured with it, so that `cp -al` clones of a source tree only count what they add
+  """
+
+  seen = set()
+  result = {}
+  for path, tree in _trees.items():
+    apparent, allocated = tree.apparent, tree.allocated
+    for key, (linked_apparent, linked_allocated) in tree.linked.items():
+      if key not in seen:
+        seen.add(key)
+        apparent += linked_apparent
+        allocated += linked_allocated
+    result[path] = (apparent, allocated)
+  return result
+
+def account(trees: Dict[Path, str]):
+  """
+  measure trees a step wrote to, forget trees that were removed since, and track the peak
+
+  `trees` maps each tree to a label, or to '' where the path says enough.
+  """
+
+  global _peak_total, _peak_sizes
+  for tree, label in trees.items():
+    _trees[tree] = _measure(tree)
+    if label:
+      _labels[tree] = label
+  for tree in [tree for tree in _trees if not os.path.lexists(tree)]:
+    del _trees[tree]
+  sizes = _charged()
+  total = sum(allocated for _, allocated in sizes.values())
+  if total > _peak_total:
+    _peak_total = total
+    _peak_sizes = sizes
+
+def allocated(tree: Path) -> int:
+  """
+  allocated bytes of the whole tree, including files shared with other trees
+  """
+
+  return _trees[tree].size()[1] if tree in _trees else 0
+
+def report(root: Path):
+  if not _peak_sizes:
+    return
+  print(f'peak disk usage of source trees, layers and packages: {format_size(_peak_total)}, largest at the time:')
+  items = sorted(_peak_sizes.items(), key = lambda item: -item[1][1])
+  for tree, (apparent, used) in items[:REPORT_ITEMS]:
+    name = _labels.get(tree) or (tree.relative_to(root) if tree.is_relative_to(root) else tree)
+    print(f'  {format_size(used):>12} {format_size(apparent):>12}  {name}')
+  if len(items) > REPORT_ITEMS:
+    print(f'  ({len(items) - REPORT_ITEMS} more)')
+  print('  (allocated, apparent)')
+
+def _device(path: Path) -> int:
+  while not path.exists():
+    path = path.parent
+  return path.stat().st_dev
+
+def check_free(needs: List[Tuple[Path, int, str]]):
+  """
+  fail if the projected growth of some filesystem exceeds its free space
+
+  `needs` are (path, bytes, description), grouped by the filesystem the path is on.
+  """
+
+  devices: Dict[int, List[Tuple[Path, int, str]]] = {}
+  for need in needs:
+    devices.setdefault(_device(need[0]), []).append(need)
+  for items in devices.values():
+    path = items[0][0]
+    while not path.exists():
+      path = path.parent
+    total = sum(size for _, size, _ in items)
+    free = shutil.disk_usage(path).free
+    if total > free:
+      detail = ', '.join(f'{format_size(size)} of {description}' for _, size, description in items if size)
+      raise Exception(
+        f'projected disk usage exceeds free space on the filesystem of {path}: '
+        f'{format_size(total)} needed ({detail}), {format_size(free)} free. '
+        f'free up space, or use --gc, --tmpfs or another --build-root'
+      )
@@ -0,0 +1,293 @@
+import argparse
+from copy import copy
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import socket
+import struct
+import tarfile
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import module.store as store
+from module.runner import Build, Task, execute_process
+from module.step import Step, step_dependencies, step_outputs
+
+# options that describe the worker's machine, or what the coordinator does in this run,
+# rather than the build
+LOCAL_OPTIONS = {
+  'autoconf_cache', 'build_root', 'ccache', 'check_free', 'clean', 'cmake_cache', 'coordinator',
+  'cores', 'download_only', 'from_step', 'gc', 'jobs', 'list_steps', 'log_tail', 'logs',
+  'metrics_compare', 'metrics_threshold', 'only', 'package', 'parallel_steps', 'plan', 'plugin',
+  'prometheus_textfile', 'sample_interval', 'spill_dir', 'status_file', 'step_logs', 'timing', 'tmpfs',
+  'verbose', 'watch', 'what_if', 'worker',
+}
+
+def parse_address(value: str) -> Tuple[str, int]:
+  host, _, port = value.rpartition(':')
+  return (host or '0.0.0.0', int(port))
+
+# framing: 4-byte length, JSON header, then `header['blob']` bytes of payload
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+  chunks = []
+  while size:
+    chunk = sock.recv(min(size, 1 << 20))
+    if not chunk:
+      raise ConnectionError('connection closed')
+    chunks.append(chunk)
+    size -= len(chunk)
+  return b''.join(chunks)
+
+def send_message(sock: socket.socket, header: dict, blob: Optional[Path] = None):
+  header = {**header, 'blob': blob.stat().st_size if blob else 0}
+  data = json.dumps(header).encode()
+  sock.sendall(struct.pack('!I', len(data)) + data)
+  if blob:
+    with open(blob, 'rb') as f:
+      sock.sendfile(f)
+
+def recv_message(sock: socket.socket, blob_dir: Optional[Path] = None) -> Tuple[dict, Optional[Path]]:
+  size, = struct.unpack('!I', _recv_exact(sock, 4))
+  header = json.loads(_recv_exact(sock, size))
+  if not header['blob']:
+    return header, None
+  fd, name = tempfile.mkstemp(suffix = '.tar.gz', dir = blob_dir)
+  remaining = header['blob']
+  with os.fdopen(fd, 'wb') as f:
+    while remaining:
+      chunk = sock.recv(min(remaining, 1 << 20))
+      if not chunk:
+        raise ConnectionError('connection closed')
+      f.write(chunk)
+      remaining -= len(chunk)
+  return header, Path(name)
+
+def pack_entry(entry: Path, blob: Path):
+  temp = blob.with_name(f'{blob.name}.{os.getpid()}')
+  with tarfile.open(temp, 'w:gz', compresslevel = 1) as tar:
+    tar.add(entry, arcname = '.')
+  os.replace(temp, blob)
+
+def unpack_entry(blob: Path, entry: Path):
+  if entry.exists():
+    shutil.rmtree(entry)
+  entry.mkdir(parents = True)
+  with tarfile.open(blob, 'r:gz') as tar:
+    if hasattr(tarfile, 'tar_filter'):
+      tar.extractall(entry, filter = 'tar')
+    else:
+      tar.extractall(entry)
+
+def _direct_deps(task: Task) -> List[Tuple[Step, str]]:
+  steps = {step.name: step for step in task.build.steps}
+  deps = step_dependencies(task.build.steps)[task.step.name]
+  return [(steps[name], task.build.fingerprints[name]) for name in deps if step_outputs(steps[name])]
+
+def _options(config: argparse.Namespace) -> dict:
+  return {
+    k: (str(v) if isinstance(v, Path) else v)
+    for k, v in vars(config).items()
+    if k not in LOCAL_OPTIONS
+  }
+
+class RemoteRun:
+  """
+  a task running on a worker, waitable on the worker's socket
+  """
+
+  def __init__(self, coordinator: 'Coordinator', worker: socket.socket, task: Task):
+    self.coordinator = coordinator
+    self.worker = worker
+    self.task = task
+    self.start = time.monotonic()
+
+  def fileno(self) -> int:
+    return self.worker.fileno()
+
+  def result(self) -> Optional[bool]:
+    """
+    True on success, False on failure, None when the worker is lost and the task should be retried
+    """
+
+    task = self.task
+    try:
+      header, blob = recv_message(self.worker, self.coordinator.blob_dir)
+    except (ConnectionError, OSError) as e:
+      logging.warning('Lost worker %s running %s: %s' % (self.coordinator.names[self.worker], task.name, e))
+      self.coordinator.drop(self.worker)
+      return None
+
+    self.coordinator.idle.append(self.worker)
+    if header['type'] != 'done':
+      logging.critical('Step %s failed on %s: %s' % (task.name, self.coordinator.names[self.worker], header.get('error')))
+      return False
+    unpack_entry(blob, store.entry_dir(task.build.paths, task.fingerprint))
+    blob.unlink()
+    store.link(task.step, task.build.paths, task.fingerprint)
+    return True
+
+class Coordinator:
+  """
+  accepts workers and hands them tasks with the dependency layers they are missing
+  """
+
+  def __init__(self, address: Tuple[str, int], blob_dir: Path):
+    self.listener = socket.create_server(address, reuse_port = False)
+    self.blob_dir = blob_dir
+    self.blob_dir.mkdir(parents = True, exist_ok = True)
+    self.idle: List[socket.socket] = []
+    self.names: Dict[socket.socket, str] = {}
+    print(f'Coordinator listening on {address[0]}:{self.listener.getsockname()[1]}')
+
+  def waitables(self) -> List[socket.socket]:
+    return [self.listener, *self.idle]
+
+  def has_workers(self) -> bool:
+    return bool(self.names)
+
+  def drop(self, worker: socket.socket):
+    if worker in self.idle:
+      self.idle.remove(worker)
+    self.names.pop(worker, None)
+    worker.close()
+
+  def handle(self, ready: socket.socket):
+    """
+    accept a new worker, or notice that an idle one went away
+    """
+
+    if ready is self.listener:
+      worker, address = self.listener.accept()
+      header, _ = recv_message(worker)
+      self.names[worker] = f'{header.get("name", "?")}@{address[0]}'
+      self.idle.append(worker)
+      logging.info('Worker %s joined' % self.names[worker])
+    else:
+      logging.warning('Worker %s went away' % self.names.get(ready))
+      self.drop(ready)
+
+  def _blob(self, build: Build, fingerprint: str) -> Path:
+    blob = self.blob_dir / f'{fingerprint}.tar.gz'
+    if not blob.exists():
+      pack_entry(store.entry_dir(build.paths, fingerprint), blob)
+    return blob
+
+  def dispatch(self, task: Task, config: argparse.Namespace) -> Optional[RemoteRun]:
+    worker = self.idle.pop(0)
+    deps = _direct_deps(task)
+    try:
+      send_message(worker, {
+        'type': 'task',
+        'branch': task.build.ver.branch,
+        'arch': task.build.ver.arch,
+        'step': task.step.name,
+        'fingerprint': task.fingerprint,
+        'options': _options(config),
+        'deps': [[step.name, fingerprint] for step, fingerprint in deps],
+      })
+      header, _ = recv_message(worker)
+      for fingerprint in header['need']:
+        send_message(worker, {'type': 'layer', 'fingerprint': fingerprint}, self._blob(task.build, fingerprint))
+    except (ConnectionError, OSError) as e:
+      logging.warning('Lost worker %s: %s' % (self.names[worker], e))
+      self.drop(worker)
+      return None
+    logging.info('Running step %s on %s' % (task.name, self.names[worker]))
+    return RemoteRun(self, worker, task)
+
+def _worker_task(
+  header: dict,
+  config: argparse.Namespace,
+  builds: Dict[Tuple[str, str], Build],
+  make_build: Callable[[argparse.Namespace, str, str], Build],
+) -> Tuple[Task, argparse.Namespace]:
+  task_config = copy(config)
+  for k, v in header['options'].items():
+    setattr(task_config, k, v)
+  key = (header['branch'], header['arch'])
+  if key not in builds:
+    builds[key] = make_build(task_config, *key)
+  build = builds[key]
+  steps = [step for step in build.steps if step.name == header['step']]
+  if not steps:
+    raise Exception(f'unknown step {header["step"]}, the worker runs different code or options')
+  build.paths.layer_store.mkdir(parents = True, exist_ok = True)
+  return Task(build, steps[0], True), task_config
+
+def _run_task(sock: socket.socket, header: dict, task: Task, task_config: argparse.Namespace, blobs: List[Tuple[dict, Path]]):
+  build = task.build
+  for layer, blob in blobs:
+    unpack_entry(blob, store.entry_dir(build.paths, layer['fingerprint']))
+    store.complete(build.paths, layer['fingerprint'])
+  steps = {step.name: step for step in build.steps}
+  for name, fingerprint in header['deps']:
+    store.link(steps[name], build.paths, fingerprint)
+
+  if task.fingerprint != header['fingerprint']:
+    send_message(sock, {'type': 'failed', 'error': 'fingerprint mismatch, the worker runs different code or options'})
+    return
+
+  logging.info('Running step %s' % task.name)
+  store.prepare(task.step, build.paths, task.fingerprint)
+  if not execute_process(task, task_config):
+    send_message(sock, {'type': 'failed', 'error': 'step failed, see the worker log'})
+    return
+  store.complete(build.paths, task.fingerprint)
+  blob = build.paths.layer_store / f'{task.fingerprint}.tar.gz'
+  pack_entry(store.entry_dir(build.paths, task.fingerprint), blob)
+  send_message(sock, {'type': 'done'}, blob)
+  blob.unlink()
+
+def run_worker(
+  address: Tuple[str, int],
+  config: argparse.Namespace,
+  make_build: Callable[[argparse.Namespace, str, str], Build],
+  prepare: Callable[[Task, argparse.Namespace], None],
+):
+  """
+  build steps handed out by a coordinator until it closes the connection
+
+  the coordinator waits for the reply listing the missing layers, so sources are prepared
+  (`prepare`) only after it, while the coordinator serves other workers. a task that fails
+  here is reported as failed instead of ending the worker, otherwise the coordinator would
+  hand it to the next worker and lose that one too.
+  """
+
+  sock = socket.create_connection(address)
+  send_message(sock, {'type': 'hello', 'name': socket.gethostname(), 'jobs': config.jobs})
+  print(f'Connected to coordinator {address[0]}:{address[1]}')
+  builds: Dict[Tuple[str, str], Build] = {}
+
+  while True:
+    try:
+      header, _ = recv_message(sock)
+    except ConnectionError:
+      print('Coordinator closed the connection')
+      return
+
+    try:
+      task, task_config = _worker_task(header, config, builds, make_build)
+    except Exception as e:
+      logging.exception('Cannot run step %s' % header['step'])
+      # the coordinator waits for the layers we need before the result
+      send_message(sock, {'type': 'need', 'need': []})
+      send_message(sock, {'type': 'failed', 'error': f'{type(e).__name__}: {e}'})
+      continue
+
+    need = [fp for _, fp in header['deps'] if not store.is_complete(task.build.paths, fp)]
+    send_message(sock, {'type': 'need', 'need': need})
+    blobs = [recv_message(sock, task.build.paths.layer_store) for _ in need]
+    try:
+      prepare(task, task_config)
+      _run_task(sock, header, task, task_config, [(layer, blob) for layer, blob in blobs if blob is not None])
+    except Exception as e:
+      logging.exception('Step %s failed' % task.name)
+      send_message(sock, {'type': 'failed', 'error': f'{type(e).__name__}: {e}'})
+    finally:
+      for _, blob in blobs:
+        if blob is not None and blob.exists():
+          blob.unlink()
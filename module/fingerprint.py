@@ -0,0 +1,186 @@
+import argparse
+import ast
+from hashlib import sha256
+import inspect
+import json
+from pathlib import Path
+import textwrap
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from module.checksum import CHECKSUMS
+from module.path import ProjectPaths
+from module.profile import BranchProfile, ProfileInfo
+from module.step import Step, function_inputs, step_dependencies, step_outputs
+from module.util import toolchain_layers
+
+# options that do not change what a step installs
+IGNORED_OPTIONS = {'jobs', 'verbose'}
+
+# profile attributes that differ between arches of a branch
+ARCH_ATTRS = set(ProfileInfo.__annotations__)
+
+class FunctionFacts(NamedTuple):
+  code: List[str]
+  ver_attrs: Set[str]
+  config_attrs: Set[str]
+  paths_attrs: Set[str]
+  strings: Set[str]
+  # module-level data (e.g. `PROFILES`), serialized
+  data: Dict[str, str]
+
+_facts_cache: Dict[Callable, FunctionFacts] = {}
+
+def function_facts(func: Callable) -> FunctionFacts:
+  """
+  collect what a function's output may depend on: its own code and that of the module
+  functions it calls, the `ver.*` and `config.*` attributes, module-level data and string
+  constants it uses
+  """
+
+  if func in _facts_cache:
+    return _facts_cache[func]
+
+  tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+  result = FunctionFacts([ast.dump(tree)], set(), set(), set(), set(), {})
+  _facts_cache[func] = result
+
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+      if node.value.id == 'ver':
+        result.ver_attrs.add(node.attr)
+      elif node.value.id == 'config' and node.attr not in IGNORED_OPTIONS:
+        result.config_attrs.add(node.attr)
+      elif node.value.id == 'paths':
+        result.paths_attrs.add(node.attr)
+    elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+      result.strings.add(node.value)
+    elif isinstance(node, ast.Name):
+      callee = func.__globals__.get(node.id)
+      if inspect.isfunction(callee) and callee.__module__.startswith('module.') and callee is not func:
+        inner = function_facts(callee)
+        for code in inner.code:
+          if code not in result.code:
+            result.code.append(code)
+        result.ver_attrs.update(inner.ver_attrs)
+        result.config_attrs.update(inner.config_attrs)
+        result.paths_attrs.update(inner.paths_attrs)
+        result.strings.update(inner.strings)
+        result.data.update(inner.data)
+      elif isinstance(callee, (dict, list, tuple, str, int)):
+        result.data[node.id] = json.dumps(callee, sort_keys = True, default = lambda o: getattr(o, '__dict__', str(o)))
+
+  return result
+
+def _file_digest(path: Path) -> str:
+  with open(path, 'rb') as f:
+    return sha256(f.read()).hexdigest()
+
+def _support_files(facts: FunctionFacts, paths: ProjectPaths) -> Dict[str, str]:
+  result = {}
+  for string in sorted(facts.strings):
+    if string.startswith('support/') or string.endswith('.patch'):
+      for candidate in (paths.root_dir / string, paths.patch_dir / string):
+        if candidate.is_file():
+          result[string] = _file_digest(candidate)
+  return result
+
+def _digest(value: dict) -> str:
+  return sha256(json.dumps(value, sort_keys = True, default = str).encode()).hexdigest()
+
+def source_fingerprint(name: str, ver: BranchProfile, paths: ProjectPaths) -> str:
+  from module import prepare_source
+
+  facts = function_facts(getattr(prepare_source, f'_{name}'))
+  return _digest({
+    'archive': CHECKSUMS.get(getattr(paths.src_arx, name).name),
+    'code': facts.code,
+    'ver': {attr: getattr(ver, attr) for attr in facts.ver_attrs},
+    'files': _support_files(facts, paths),
+  })
+
+def _fingerprints(
+  steps: List[Step],
+  ver: BranchProfile,
+  paths: ProjectPaths,
+  config: argparse.Namespace,
+  templates: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+  # without templates, leave out everything that differs between arches
+  neutral = templates is None
+  deps = step_dependencies(steps)
+  result: Dict[str, str] = {}
+  for step in steps:
+    if not neutral and step.arch_independent:
+      result[step.name] = _digest({'template': templates[step.name], 'prefix': f'/usr/local/{ver.target}'})
+      continue
+    facts = function_facts(step.func)
+    inputs = function_inputs(step.func)
+    ver_attrs = facts.ver_attrs - ARCH_ATTRS if neutral else facts.ver_attrs
+    files = _support_files(facts, paths)
+    if not neutral:
+      for attr in ('cmake_cross_file', 'meson_cross_file'):
+        if attr in facts.paths_attrs:
+          files[attr] = _file_digest(getattr(paths, attr))
+    result[step.name] = _digest({
+      'step': step.name,
+      'code': facts.code,
+      'data': facts.data,
+      'env': step.env,
+      'ver': {attr: getattr(ver, attr) for attr in ver_attrs},
+      'config': {attr: getattr(config, attr, None) for attr in facts.config_attrs},
+      'sources': {name: source_fingerprint(name, ver, paths) for name in sorted(inputs.sources)},
+      'files': files,
+      'deps': {dep: result[dep] for dep in deps[step.name]},
+    })
+  return result
+
+def template_fingerprints(
+  steps: List[Step],
+  ver: BranchProfile,
+  paths: ProjectPaths,
+  config: argparse.Namespace,
+) -> Dict[str, str]:
+  """
+  fingerprint of arch-independent steps with the arch left out, identical for every arch
+  """
+
+  neutral = _fingerprints(steps, ver, paths, config)
+  return {step.name: neutral[step.name] for step in steps if step.arch_independent}
+
+def step_fingerprints(
+  steps: List[Step],
+  ver: BranchProfile,
+  paths: ProjectPaths,
+  config: argparse.Namespace,
+) -> Dict[str, str]:
+  """
+  fingerprint of everything a step's layers are built from, identical fingerprints mean
+  identical layers, no matter which arch or branch they were built for
+
+  an arch-independent step only differs between arches by its install prefix.
+  """
+
+  templates = template_fingerprints(steps, ver, paths, config)
+  return _fingerprints(steps, ver, paths, config, templates)
+
+def toolchain_fingerprint(steps: List[Step], fingerprints: Dict[str, str]) -> str:
+  """
+  combined fingerprint of the steps installing the layers in `toolchain_layers`
+  """
+
+  layers = function_inputs(toolchain_layers).layers
+  names = sorted(step.name for step in steps if any(output in layers for output in step_outputs(step)))
+  return _digest({name: fingerprints[name] for name in names})
+
+def configure_cache_key(step: Step, steps: List[Step], fingerprints: Dict[str, str]) -> str:
+  """
+  key of a step's configure results: the toolchain and the layers it depends on, but not
+  the step itself, so that a changed step reuses the probes of its previous configure
+  """
+
+  deps = step_dependencies(steps)[step.name]
+  return _digest({
+    'step': step.name,
+    'toolchain': toolchain_fingerprint(steps, fingerprints),
+    'deps': {dep: fingerprints[dep] for dep in deps},
+  })
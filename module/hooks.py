@@ -0,0 +1,98 @@
+import argparse
+from contextlib import contextmanager
+import importlib
+import importlib.util
+from pathlib import Path
+import sys
+from typing import Callable, Dict, Iterator, List
+
+# events and the keyword arguments their handlers are called with
+EVENTS = {
+  # in the scheduling process, as the step starts here, in a forked process or on a worker
+  'step_start': ['branch', 'arch', 'step', 'time'],
+  # in the scheduling process, `duration` in seconds, `ok` false for a failed step
+  'step_end': ['branch', 'arch', 'step', 'time', 'duration', 'ok'],
+  # in the process running the step, for every process it starts
+  'subprocess_spawn': ['branch', 'arch', 'step', 'args', 'cwd'],
+  # in the scheduling process, for each layer of a step built or linked from the store
+  'layer_installed': ['branch', 'arch', 'step', 'path', 'fingerprint', 'reused'],
+  # in the scheduling process, `size` of the package file in bytes
+  'package_done': ['branch', 'arch', 'step', 'path', 'size'],
+  # while preparing sources (`step` is 'prepare'), for each archive, `cached` if it was
+  # already downloaded, otherwise `size` in bytes and `duration` in seconds
+  'download_done': ['branch', 'arch', 'step', 'path', 'url', 'cached', 'size', 'duration'],
+  # once, after all steps ran or the build failed
+  'run_end': [],
+}
+
+# only events with handlers have an entry
+_handlers: Dict[str, List[Callable[..., None]]] = {}
+# the step running in this process, for `subprocess_spawn`
+_step: Dict[str, str] = {}
+_audit_installed = False
+
+def register(event: str, handler: Callable[..., None]):
+  """
+  call `handler(**fields)` on `event`, handlers should accept `**_` for fields added later
+  """
+
+  if event not in EVENTS:
+    raise Exception(f'unknown hook event: {event} (choose from {", ".join(EVENTS)})')
+  if event == 'subprocess_spawn':
+    _install_audit_hook()
+  _handlers.setdefault(event, []).append(handler)
+
+def active(event: str) -> bool:
+  return event in _handlers
+
+def emit(event: str, **fields):
+  for handler in _handlers.get(event, ()):
+    handler(**fields)
+
+@contextmanager
+def running(branch: str, arch: str, step: str) -> Iterator[None]:
+  _step.update(branch = branch, arch = arch, step = step)
+  try:
+    yield
+  finally:
+    _step.clear()
+
+def current() -> Dict[str, str]:
+  """
+  branch, arch and step running in this process, empty outside of steps
+  """
+  return dict(_step)
+
+def _audit(event: str, args: tuple):
+  if event == 'subprocess.Popen' and _step:
+    _, argv, cwd, _ = args
+    argv = [argv] if isinstance(argv, (str, bytes, Path)) else argv
+    emit('subprocess_spawn', **_step, args = [str(arg) for arg in argv], cwd = str(cwd or Path.cwd()))
+
+def _install_audit_hook():
+  """
+  audit hooks cannot be removed, so only install one once a handler needs it
+  """
+
+  global _audit_installed
+  if not _audit_installed:
+    sys.addaudithook(_audit)
+    _audit_installed = True
+
+def load_plugin(spec: str, config: argparse.Namespace):
+  """
+  import a plugin by module name or file path and call its `setup(config)`, which registers handlers
+  """
+
+  if spec.endswith('.py'):
+    path = Path(spec)
+    module_spec = importlib.util.spec_from_file_location(f'plugin_{path.stem}', path)
+    if module_spec is None or module_spec.loader is None:
+      raise Exception(f'cannot load plugin: {spec}')
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+  else:
+    module = importlib.import_module(spec)
+  if not hasattr(module, 'setup'):
+    raise Exception(f'plugin {spec} has no setup(config)')
+  module.setup(config)
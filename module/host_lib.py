@@ -1,13 +1,14 @@
 import argparse
 import logging
-import os
 from packaging.version import Version
 from shutil import copyfile
 import subprocess
+from typing import List
 
 from module.debug import shell_here
 from module.path import ProjectPaths
 from module.profile import BranchProfile
+from module.step import Step
 from module.util import cmake_config, ensure, overlayfs_ro, pkgconf_remove_flags
 from module.util import cflags_host, configure, make_default, make_destdir_install
 from module.util import cmake_build, cmake_destdir_install, qt_configure_module
@@ -225,33 +226,34 @@ def _qtwayland(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespa
     cmake_build(build_dir, config.jobs)
     cmake_destdir_install(build_dir, paths.layer_host.qtwayland)
 
-def build_host_lib(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
-  v_qt = Version(ver.qt)
+def _qtwayland_merged(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
+  # merged into qtbase since Qt 6.10, keep an empty layer
+  ensure(paths.layer_host.qtwayland / 'usr/local')
 
-  os.environ['PKG_CONFIG_PATH'] = '/usr/local/lib/pkgconfig'
+def host_lib_steps(ver: BranchProfile) -> List[Step]:
+  v_qt = Version(ver.qt)
 
-  # host meson
-  _meson(ver, paths, config)
+  env = {'PKG_CONFIG_PATH': '/usr/local/lib/pkgconfig'}
 
-  # toolchain
-  _gmp(ver, paths, config)
-  _mpfr(ver, paths, config)
-  _mpc(ver, paths, config)
+  return [
+    # host meson
+    Step('host.meson', _meson, env),
 
-  # misc. round 1
-  _expat(ver, paths, config)
-  _ffi(ver, paths, config)
+    # toolchain
+    Step('host.gmp', _gmp, env),
+    Step('host.mpfr', _mpfr, env),
+    Step('host.mpc', _mpc, env),
 
-  # misc. round 2
-  _dbus(ver, paths, config)
-  _wayland(ver, paths, config)
+    # misc. round 1
+    Step('host.expat', _expat, env),
+    Step('host.ffi', _ffi, env),
 
-  # host Qt
-  _qtbase(ver, paths, config)
-  _qttools(ver, paths, config)
-  if v_qt < Version('6.10'):
-    _qtwayland(ver, paths, config)
-  else:
-    ensure(paths.layer_host.qtwayland / 'usr/local')
+    # misc. round 2
+    Step('host.dbus', _dbus, env),
+    Step('host.wayland', _wayland, env),
 
-  del os.environ['PKG_CONFIG_PATH']
+    # host Qt
+    Step('host.qtbase', _qtbase, env),
+    Step('host.qttools', _qttools, env),
+    Step('host.qtwayland', _qtwayland if v_qt < Version('6.10') else _qtwayland_merged, env),
+  ]
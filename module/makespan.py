@@ -0,0 +1,72 @@
+import heapq
+from typing import List, NamedTuple, Optional, Tuple
+
+class Node(NamedTuple):
+  name: str
+  # wall time as recorded
+  duration: float
+  # average busy cores while it ran, 1 when unknown
+  cpu_ratio: float
+  deps: List[int]
+
+def _step_time(node: Node, cores: int) -> float:
+  # work-span bound: no faster than recorded, and no more cores than it kept busy
+  return max(node.duration, node.duration * node.cpu_ratio / cores)
+
+def critical_path(nodes: List[Node]) -> Tuple[float, List[int]]:
+  """
+  the longest chain of recorded durations, i.e. the makespan with unlimited cores and concurrency
+  """
+
+  finish: List[float] = []
+  previous: List[Optional[int]] = []
+  # tasks come in an order where dependencies precede dependents
+  for node in nodes:
+    start, before = 0.0, None
+    for dep in node.deps:
+      if finish[dep] > start:
+        start, before = finish[dep], dep
+    finish.append(start + node.duration)
+    previous.append(before)
+
+  if not nodes:
+    return 0.0, []
+  last = max(range(len(nodes)), key = lambda i: finish[i])
+  path = []
+  i: Optional[int] = last
+  while i is not None:
+    path.append(i)
+    i = previous[i]
+  return finish[last], path[::-1]
+
+def makespan(nodes: List[Node], cores: int, concurrency: int) -> float:
+  """
+  replay the scheduler of `run_tasks`: ready tasks start in order while fewer than
+  `concurrency` run, each with its share of `cores` at the time it starts
+  """
+
+  waiting = list(range(len(nodes)))
+  finished = set()
+  running: List[Tuple[float, int]] = []
+  now = 0.0
+  while waiting or running:
+    progress = True
+    while progress:
+      progress = False
+      ready = [i for i in waiting if all(dep in finished for dep in nodes[i].deps)]
+      for n, i in enumerate(ready):
+        if nodes[i].duration == 0.0:
+          waiting.remove(i)
+          finished.add(i)
+          progress = True
+        elif len(running) < concurrency:
+          share = max(1, cores // max(1, min(concurrency, len(running) + len(ready) - n)))
+          heapq.heappush(running, (now + _step_time(nodes[i], share), i))
+          waiting.remove(i)
+    if not running:
+      break
+    now, i = heapq.heappop(running)
+    finished.add(i)
+    while running and running[0][0] <= now:
+      finished.add(heapq.heappop(running)[1])
+  return now
@@ -0,0 +1,154 @@
+import json
+from pathlib import Path
+import sqlite3
+import statistics
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from module import timing
+from module.disk_usage import tree_size
+from module.path import ProjectPaths
+from module.profile import BranchProfile, BranchVersions
+from module.step import Step, step_outputs
+import module.store as store
+
+# previous runs of a step that make up its baseline
+BASELINE_RUNS = 5
+# differences below these are noise
+MIN_DURATION_DELTA = 10.0
+MIN_SIZE_DELTA = 1 << 20
+
+SCHEMA = '''
+create table if not exists runs (
+  id integer primary key,
+  started real not null,
+  branch text not null,
+  arch text not null,
+  versions text not null
+);
+create table if not exists steps (
+  run integer not null references runs(id),
+  step text not null,
+  fingerprint text not null,
+  duration real not null,
+  user real,
+  sys real,
+  max_rss integer,
+  size integer
+);
+create index if not exists steps_step on steps(step, run);
+'''
+
+class _Finished(NamedTuple):
+  ver: BranchProfile
+  paths: ProjectPaths
+  step: Step
+  name: str
+  fingerprint: str
+  duration: float
+
+# steps finished in this process since the last `save`
+_finished: List[_Finished] = []
+_started = time.time()
+
+def add(ver: BranchProfile, paths: ProjectPaths, step: Step, name: str, fingerprint: str, duration: float):
+  _finished.append(_Finished(ver, paths, step, name, fingerprint, duration))
+
+def versions(ver: BranchProfile) -> Dict[str, str]:
+  return {name: getattr(ver, name) for name in BranchVersions.__annotations__}
+
+def _connect(path: Path) -> sqlite3.Connection:
+  path.parent.mkdir(parents = True, exist_ok = True)
+  db = sqlite3.connect(path)
+  db.executescript(SCHEMA)
+  return db
+
+def save():
+  """
+  append the steps built since the last call, one run per branch and arch
+  """
+
+  global _finished, _started
+  if not _finished:
+    return
+  spans = timing.summarize(timing.recorded_events())
+
+  runs: Dict[Tuple[str, str], int] = {}
+  db = _connect(_finished[0].paths.metrics_db)
+  with db:
+    for finished in _finished:
+      key = (finished.ver.branch, finished.ver.arch)
+      if key not in runs:
+        cursor = db.execute(
+          'insert into runs (started, branch, arch, versions) values (?, ?, ?, ?)',
+          (_started, *key, json.dumps(versions(finished.ver), sort_keys = True)),
+        )
+        runs[key] = cursor.lastrowid
+      span = spans.get(finished.name, {})
+      size = tree_size(store.entry_dir(finished.paths, finished.fingerprint))[0] if step_outputs(finished.step) else None
+      db.execute(
+        'insert into steps values (?, ?, ?, ?, ?, ?, ?, ?)',
+        (runs[key], finished.step.name, finished.fingerprint, finished.duration, span.get('user'), span.get('sys'), span.get('max_rss'), size),
+      )
+  db.close()
+  _finished = []
+  _started = time.time()
+
+def _regressed(current: Optional[float], history: List[Optional[float]], threshold: float, min_delta: float) -> Optional[float]:
+  values = [value for value in history if value is not None]
+  if current is None or not values:
+    return None
+  baseline = statistics.median(values)
+  if current > baseline * (1 + threshold) and current - baseline >= min_delta:
+    return baseline
+  return None
+
+def compare(paths: ProjectPaths, ver: BranchProfile, threshold: float) -> int:
+  """
+  print steps of the latest run of a branch and arch that got slower or bigger than the
+  median of their previous runs, return their number
+  """
+
+  if not paths.metrics_db.exists():
+    print(f'{ver.branch}/{ver.arch}: no metrics recorded')
+    return 0
+  db = _connect(paths.metrics_db)
+  latest = db.execute(
+    'select id, versions from runs where branch = ? and arch = ? order by id desc limit 1',
+    (ver.branch, ver.arch),
+  ).fetchone()
+  if latest is None:
+    print(f'{ver.branch}/{ver.arch}: no metrics recorded')
+    return 0
+  run, run_versions = latest
+
+  regressions = 0
+  for step, duration, size in db.execute('select step, duration, size from steps where run = ?', (run,)).fetchall():
+    history = db.execute(
+      '''select steps.duration, steps.size, runs.versions from steps join runs on steps.run = runs.id
+         where runs.branch = ? and runs.arch = ? and steps.step = ? and steps.run < ?
+         order by steps.run desc limit ?''',
+      (ver.branch, ver.arch, step, run, BASELINE_RUNS),
+    ).fetchall()
+    if not history:
+      continue
+    messages = []
+    baseline = _regressed(duration, [h[0] for h in history], threshold, MIN_DURATION_DELTA)
+    if baseline is not None:
+      messages.append(f'duration {baseline:.0f}s -> {duration:.0f}s (+{(duration / baseline - 1) * 100:.0f}%)')
+    baseline = _regressed(size, [h[1] for h in history], threshold, MIN_SIZE_DELTA)
+    if baseline is not None:
+      messages.append(f'size {baseline / 1048576:.1f} -> {size / 1048576:.1f} MiB (+{(size / baseline - 1) * 100:.0f}%)')
+    if not messages:
+      continue
+    regressions += 1
+    before, after = json.loads(history[0][2]), json.loads(run_versions)
+    changed = [f'{k} {before.get(k)} -> {v}' for k, v in sorted(after.items()) if before.get(k) != v]
+    print(f'{ver.branch}/{ver.arch}:{step}: {", ".join(messages)}')
+    if changed:
+      print(f'  versions changed: {", ".join(changed)}')
+  db.close()
+
+  if not regressions:
+    print(f'{ver.branch}/{ver.arch}: no regressions')
+  return regressions
@@ -69,6 +69,7 @@ class LayerPathsX(NamedTuple):
   stub: Path
 
   binutils: Path
+  binutils_multi: Path
   cmake: Path
   gcc: Path
   linux: Path
@@ -114,6 +115,52 @@ class LayerPathsTarget(NamedTuple):
   z: Path
   zstd: Path
 
+def _source_paths(base: Path, ver: BranchProfile) -> SourcePaths:
+  return SourcePaths(
+    appimage_runtime = base / f'type2-runtime-{ver.appimage_runtime}',
+    binutils = base / f'binutils-{ver.binutils}',
+    dbus = base / f'dbus-{ver.dbus}',
+    expat = base / f'expat-{ver.expat}',
+    fcitx_qt = base / f'fcitx5-qt-{ver.fcitx_qt}',
+    ffi = base / f'libffi-{ver.ffi}',
+    fontconfig = base / f'fontconfig-{ver.fontconfig}',
+    freetype = base / f'freetype-{ver.freetype}',
+    fuse = base / f'fuse-{ver.fuse}',
+    gcc = base / f'gcc-{ver.gcc}',
+    gmp = base / f'gmp-{ver.gmp}',
+    harfbuzz = base / f'harfbuzz-{ver.harfbuzz}',
+    linux = base / f'linux-{ver.linux}',
+    mimalloc = base / f'mimalloc-{ver.mimalloc}',
+    mpc = base / f'mpc-{ver.mpc}',
+    mpfr = base / f'mpfr-{ver.mpfr}',
+    musl = base / f'musl-{ver.musl}',
+    pkgconf = base / f'pkgconf-pkgconf-{ver.pkgconf}',
+    png = base / f'libpng-{ver.png}',
+    qtbase = base / f'qtbase-everywhere-src-{ver.qt}',
+    qtsvg = base / f'qtsvg-everywhere-src-{ver.qt}',
+    qttools = base / f'qttools-everywhere-src-{ver.qt}',
+    qttranslations = base / f'qttranslations-everywhere-src-{ver.qt}',
+    qtwayland = base / f'qtwayland-everywhere-src-{ver.qt}',
+    squashfuse = base / f'squashfuse-{ver.squashfuse}',
+    wayland = base / f'wayland-{ver.wayland}',
+    x = base / f'libX11-{ver.x}',
+    xau = base / f'libXau-{ver.xau}',
+    xcb = base / f'libxcb-{ver.xcb}',
+    xcb_proto = base / f'xcb-proto-{ver.xcb_proto}',
+    xcb_util = base / f'xcb-util-{ver.xcb_util}',
+    xcb_util_cursor = base / f'xcb-util-cursor-{ver.xcb_util_cursor}',
+    xcb_util_image = base / f'xcb-util-image-{ver.xcb_util_image}',
+    xcb_util_keysyms = base / f'xcb-util-keysyms-{ver.xcb_util_keysyms}',
+    xcb_util_renderutil = base / f'xcb-util-renderutil-{ver.xcb_util_renderutil}',
+    xcb_util_wm = base / f'xcb-util-wm-{ver.xcb_util_wm}',
+    xkbcommon = base / f'libxkbcommon-xkbcommon-{ver.xkbcommon}',
+    xml = base / f'libxml2-{ver.xml}',
+    xorg_proto = base / f'xorgproto-{ver.xorg_proto}',
+    xtrans = base / f'xtrans-{ver.xtrans}',
+    z = base / f'zlib-{ver.z}',
+    zstd = base / f'zstd-{ver.zstd}',
+  )
+
 class ProjectPaths:
   root_dir: Path
 
@@ -121,14 +168,29 @@ class ProjectPaths:
   dist_dir: Path
   patch_dir: Path
 
+  build_root: Path
   build_dir: Path
+  source_dir: Path
   container_dir: Path
   layer_dir: Path
+  layer_store: Path
+  linux_headers_cache: Path
+  ccache_dir: Path
+  autoconf_cache_dir: Path
+  cmake_cache_dir: Path
+  blob_cache_dir: Path
+  metrics_db: Path
+  log_dir: Path
+
+  package_file: Path
+
+  journal_file: Path
 
   cmake_cross_file: Path
   meson_cross_file: Path
 
   src_dir: SourcePaths
+  src_shared: SourcePaths
   src_arx: SourcePaths
 
   layer_host: LayerPathsHost
@@ -146,57 +208,41 @@ class ProjectPaths:
     self.dist_dir = self.root_dir / 'dist'
     self.patch_dir = self.root_dir / 'patch'
 
-    self.build_dir = Path(f'/tmp/build/{ver.arch}')
-    self.container_dir = self.root_dir / 'container' / ver.arch
-    self.layer_dir = self.root_dir / 'layer' / ver.arch
+    self.build_root = Path(config.build_root)
+    self.build_dir = self.build_root / ver.branch / ver.arch
+    # extracted and patched once, arch source trees are hard-linked clones
+    self.source_dir = self.build_root / ver.branch / 'source'
+    # simulated builds keep their layers and packages apart from real ones
+    output_root = self.root_dir / 'simulate' if config.simulate else self.root_dir
+    self.container_dir = output_root / 'container' / ver.arch
+    self.layer_dir = output_root / 'layer' / ver.branch / ver.arch
+    # layers keyed by input fingerprint, `layer_dir` links into it
+    self.layer_store = output_root / 'layer' / 'store'
+    # shared by all arches and branches
+    self.ccache_dir = output_root / 'layer' / 'cache' / 'ccache'
+    self.autoconf_cache_dir = output_root / 'layer' / 'cache' / 'autoconf'
+    self.cmake_cache_dir = output_root / 'layer' / 'cache' / 'cmake'
+    # step durations and sizes of every run, for `--metrics-compare`
+    self.metrics_db = output_root / 'layer' / 'metrics.sqlite'
+    # compressed output of each step, one directory per run
+    self.log_dir = output_root / 'layer' / 'log'
+    # packed store entries sent to distributed workers
+    self.blob_cache_dir = output_root / 'layer' / 'cache' / 'blob'
+    # installed UAPI headers only depend on the kernel version and arch
+    self.linux_headers_cache = output_root / 'layer' / 'cache' / 'linux-headers' / f'{ver.linux}-{ver.kernel_arch}'
+
+    if len(config.branch) > 1:
+      self.package_file = self.container_dir / f'qt-{ver.branch}.tar'
+    else:
+      self.package_file = self.container_dir / 'qt.tar'
+
+    self.journal_file = self.layer_dir / 'journal.json'
 
     self.cmake_cross_file = self.root_dir / f'support/cmake/{ver.target}.cmake'
     self.meson_cross_file = self.root_dir / f'support/meson/{ver.target}.txt'
 
-    self.src_dir = SourcePaths(
-      appimage_runtime = self.build_dir / f'type2-runtime-{ver.appimage_runtime}',
-      binutils = self.build_dir / f'binutils-{ver.binutils}',
-      dbus = self.build_dir / f'dbus-{ver.dbus}',
-      expat = self.build_dir / f'expat-{ver.expat}',
-      fcitx_qt = self.build_dir / f'fcitx5-qt-{ver.fcitx_qt}',
-      ffi = self.build_dir / f'libffi-{ver.ffi}',
-      fontconfig = self.build_dir / f'fontconfig-{ver.fontconfig}',
-      freetype = self.build_dir / f'freetype-{ver.freetype}',
-      fuse = self.build_dir / f'fuse-{ver.fuse}',
-      gcc = self.build_dir / f'gcc-{ver.gcc}',
-      gmp = self.build_dir / f'gmp-{ver.gmp}',
-      harfbuzz = self.build_dir / f'harfbuzz-{ver.harfbuzz}',
-      linux = self.build_dir / f'linux-{ver.linux}',
-      mimalloc = self.build_dir / f'mimalloc-{ver.mimalloc}',
-      mpc = self.build_dir / f'mpc-{ver.mpc}',
-      mpfr = self.build_dir / f'mpfr-{ver.mpfr}',
-      musl = self.build_dir / f'musl-{ver.musl}',
-      pkgconf = self.build_dir / f'pkgconf-pkgconf-{ver.pkgconf}',
-      png = self.build_dir / f'libpng-{ver.png}',
-      qtbase = self.build_dir / f'qtbase-everywhere-src-{ver.qt}',
-      qtsvg = self.build_dir / f'qtsvg-everywhere-src-{ver.qt}',
-      qttools = self.build_dir / f'qttools-everywhere-src-{ver.qt}',
-      qttranslations = self.build_dir / f'qttranslations-everywhere-src-{ver.qt}',
-      qtwayland = self.build_dir / f'qtwayland-everywhere-src-{ver.qt}',
-      squashfuse = self.build_dir / f'squashfuse-{ver.squashfuse}',
-      wayland = self.build_dir / f'wayland-{ver.wayland}',
-      x = self.build_dir / f'libX11-{ver.x}',
-      xau = self.build_dir / f'libXau-{ver.xau}',
-      xcb = self.build_dir / f'libxcb-{ver.xcb}',
-      xcb_proto = self.build_dir / f'xcb-proto-{ver.xcb_proto}',
-      xcb_util = self.build_dir / f'xcb-util-{ver.xcb_util}',
-      xcb_util_cursor = self.build_dir / f'xcb-util-cursor-{ver.xcb_util_cursor}',
-      xcb_util_image = self.build_dir / f'xcb-util-image-{ver.xcb_util_image}',
-      xcb_util_keysyms = self.build_dir / f'xcb-util-keysyms-{ver.xcb_util_keysyms}',
-      xcb_util_renderutil = self.build_dir / f'xcb-util-renderutil-{ver.xcb_util_renderutil}',
-      xcb_util_wm = self.build_dir / f'xcb-util-wm-{ver.xcb_util_wm}',
-      xkbcommon = self.build_dir / f'libxkbcommon-xkbcommon-{ver.xkbcommon}',
-      xml = self.build_dir / f'libxml2-{ver.xml}',
-      xorg_proto = self.build_dir / f'xorgproto-{ver.xorg_proto}',
-      xtrans = self.build_dir / f'xtrans-{ver.xtrans}',
-      z = self.build_dir / f'zlib-{ver.z}',
-      zstd = self.build_dir / f'zstd-{ver.zstd}',
-    )
+    self.src_dir = _source_paths(self.build_dir, ver)
+    self.src_shared = _source_paths(self.source_dir, ver)
 
     self.src_arx = SourcePaths(
       appimage_runtime = self.assets_dir / f'type2-runtime-{ver.appimage_runtime}.tar.gz',
@@ -267,6 +313,7 @@ class ProjectPaths:
       stub = layer_x_prefix / 'stub',
 
       binutils = layer_x_prefix / 'binutils',
+      binutils_multi = layer_x_prefix / 'binutils-multi',
       cmake = layer_x_prefix / 'cmake',
       gcc = layer_x_prefix / 'gcc',
       linux = layer_x_prefix / 'linux',
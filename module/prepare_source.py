@@ -3,17 +3,24 @@ import logging
 from packaging.version import Version
 from pathlib import Path
 import subprocess
+import time
+from typing import Optional, Set
 from urllib.error import URLError
 from urllib.request import urlopen
 
+from module import hooks
 from module.checksum import CHECKSUMS
-from module.path import ProjectPaths
+from module.path import ProjectPaths, SourcePaths
 from module.profile import BranchProfile
 
+# archives already verified by this process, shared by all arches in a batch
+_verified: Set[Path] = set()
 
 def _validate_and_download(path: Path, url: str):
   MAX_RETRY = 3
   checksum = CHECKSUMS[path.name]
+  if path in _verified:
+    return
   if path.exists():
     with open(path, 'rb') as f:
       body = f.read()
@@ -22,12 +29,16 @@ def _validate_and_download(path: Path, url: str):
         logging.critical(message)
         logging.info('Please delete %s and try again' % path.name)
         raise Exception(message)
+    _verified.add(path)
+    if hooks.active('download_done'):
+      hooks.emit('download_done', **hooks.current(), path = path, url = url, cached = True, size = len(body), duration = 0.0)
   else:
     logging.info('Downloading %s' % path.name)
     retry_count = 0
     while True:
       retry_count += 1
       try:
+        start = time.monotonic()
         response = urlopen(url)
         body = response.read()
         if checksum != sha256(body).hexdigest():
@@ -36,7 +47,10 @@ def _validate_and_download(path: Path, url: str):
           raise Exception(message)
         with open(path, "wb") as f:
           f.write(body)
-          return
+        _verified.add(path)
+        if hooks.active('download_done'):
+          hooks.emit('download_done', **hooks.current(), path = path, url = url, cached = False, size = len(body), duration = time.monotonic() - start)
+        return
       except URLError as e:
         message = 'Download fail: %s for %s (retry %d/3)' % (e.reason, path.name, retry_count)
         if retry_count < MAX_RETRY:
@@ -118,14 +132,40 @@ def _patch_done(path: Path):
   mark = path / '.patched'
   mark.touch()
 
+def _clone(path: Path, shared: Path):
+  """
+  populate an arch's source tree from the shared one with hard links, which costs no data copy
+  """
+
+  if path.exists():
+    mark = path / '.patched'
+    if mark.exists():
+      return
+    else:
+      message = 'Clone fail: %s exists but not marked as fully patched' % path
+      logging.critical(message)
+      logging.info('Please delete %s and try again' % path)
+      raise Exception(message)
+
+  res = subprocess.run([
+    'cp',
+    '-al',
+    shared,
+    path,
+  ])
+  if res.returncode != 0:
+    message = 'Clone fail: cp returned %d cloning %s' % (res.returncode, shared.name)
+    logging.critical(message)
+    raise Exception(message)
+
 def _appimage_runtime(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/AppImage/type2-runtime/archive/{ver.appimage_runtime}.tar.gz'
   _validate_and_download(paths.src_arx.appimage_runtime, url)
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.appimage_runtime, paths.src_arx.appimage_runtime)
-  _patch_done(paths.src_dir.appimage_runtime)
+  _check_and_extract(paths.src_shared.appimage_runtime, paths.src_arx.appimage_runtime)
+  _patch_done(paths.src_shared.appimage_runtime)
 
 def _binutils(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://ftpmirror.gnu.org/gnu/binutils/{paths.src_arx.binutils.name}'
@@ -133,8 +173,8 @@ def _binutils(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.binutils, paths.src_arx.binutils)
-  _patch_done(paths.src_dir.binutils)
+  _check_and_extract(paths.src_shared.binutils, paths.src_arx.binutils)
+  _patch_done(paths.src_shared.binutils)
 
 def _dbus(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://dbus.freedesktop.org/releases/dbus/{paths.src_arx.dbus.name}'
@@ -142,8 +182,8 @@ def _dbus(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.dbus, paths.src_arx.dbus)
-  _patch_done(paths.src_dir.dbus)
+  _check_and_extract(paths.src_shared.dbus, paths.src_arx.dbus)
+  _patch_done(paths.src_shared.dbus)
 
 def _expat(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   tag = 'R_' + ver.expat.replace('.', '_')
@@ -152,8 +192,8 @@ def _expat(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.expat, paths.src_arx.expat)
-  _patch_done(paths.src_dir.expat)
+  _check_and_extract(paths.src_shared.expat, paths.src_arx.expat)
+  _patch_done(paths.src_shared.expat)
 
 def _fcitx_qt(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/fcitx/fcitx5-qt/archive/refs/tags/{ver.fcitx_qt}.tar.gz'
@@ -161,8 +201,8 @@ def _fcitx_qt(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.fcitx_qt, paths.src_arx.fcitx_qt)
-  _patch_done(paths.src_dir.fcitx_qt)
+  _check_and_extract(paths.src_shared.fcitx_qt, paths.src_arx.fcitx_qt)
+  _patch_done(paths.src_shared.fcitx_qt)
 
 def _ffi(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/libffi/libffi/releases/download/v{ver.ffi}/{paths.src_arx.ffi.name}'
@@ -170,8 +210,8 @@ def _ffi(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.ffi, paths.src_arx.ffi)
-  _patch_done(paths.src_dir.ffi)
+  _check_and_extract(paths.src_shared.ffi, paths.src_arx.ffi)
+  _patch_done(paths.src_shared.ffi)
 
 def _fontconfig(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://gitlab.freedesktop.org/api/v4/projects/890/packages/generic/fontconfig/{ver.fontconfig}/{paths.src_arx.fontconfig.name}'
@@ -179,8 +219,8 @@ def _fontconfig(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.fontconfig, paths.src_arx.fontconfig)
-  _patch_done(paths.src_dir.fontconfig)
+  _check_and_extract(paths.src_shared.fontconfig, paths.src_arx.fontconfig)
+  _patch_done(paths.src_shared.fontconfig)
 
 def _freetype(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   # download.savannah.gnu.org limits concurrent connections
@@ -189,8 +229,8 @@ def _freetype(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.freetype, paths.src_arx.freetype)
-  _patch_done(paths.src_dir.freetype)
+  _check_and_extract(paths.src_shared.freetype, paths.src_arx.freetype)
+  _patch_done(paths.src_shared.freetype)
 
 def _fuse(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/libfuse/libfuse/releases/download/fuse-{ver.fuse}/{paths.src_arx.fuse.name}'
@@ -198,9 +238,9 @@ def _fuse(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  if _check_and_extract(paths.src_dir.fuse, paths.src_arx.fuse):
-    _patch(paths.src_dir.fuse, paths.patch_dir / 'libfuse-try-extra-fusermount.patch')
-    _patch_done(paths.src_dir.fuse)
+  if _check_and_extract(paths.src_shared.fuse, paths.src_arx.fuse):
+    _patch(paths.src_shared.fuse, paths.patch_dir / 'libfuse-try-extra-fusermount.patch')
+    _patch_done(paths.src_shared.fuse)
 
 def _gcc(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://ftpmirror.gnu.org/gcc/gcc-{ver.gcc}/{paths.src_arx.gcc.name}'
@@ -208,12 +248,12 @@ def _gcc(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  if _check_and_extract(paths.src_dir.gcc, paths.src_arx.gcc):
+  if _check_and_extract(paths.src_shared.gcc, paths.src_arx.gcc):
     v_musl = Version(ver.musl)
     if v_musl < Version('1.2'):
-      _patch(paths.src_dir.gcc, paths.patch_dir / 'gcc-revert-sanitizer-musl-time64.patch')
-    _sed(paths.src_dir.gcc / 'gcc/config/i386/t-linux64', '/m64=/s/lib64/lib/')
-    _patch_done(paths.src_dir.gcc)
+      _patch(paths.src_shared.gcc, paths.patch_dir / 'gcc-revert-sanitizer-musl-time64.patch')
+    _sed(paths.src_shared.gcc / 'gcc/config/i386/t-linux64', '/m64=/s/lib64/lib/')
+    _patch_done(paths.src_shared.gcc)
 
 def _gmp(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://ftpmirror.gnu.org/gmp/{paths.src_arx.gmp.name}'
@@ -221,8 +261,8 @@ def _gmp(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.gmp, paths.src_arx.gmp)
-  _patch_done(paths.src_dir.gmp)
+  _check_and_extract(paths.src_shared.gmp, paths.src_arx.gmp)
+  _patch_done(paths.src_shared.gmp)
 
 def _harfbuzz(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/harfbuzz/harfbuzz/releases/download/{ver.harfbuzz}/{paths.src_arx.harfbuzz.name}'
@@ -230,8 +270,8 @@ def _harfbuzz(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.harfbuzz, paths.src_arx.harfbuzz)
-  _patch_done(paths.src_dir.harfbuzz)
+  _check_and_extract(paths.src_shared.harfbuzz, paths.src_arx.harfbuzz)
+  _patch_done(paths.src_shared.harfbuzz)
 
 def _linux(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   v = Version(ver.linux)
@@ -240,8 +280,12 @@ def _linux(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.linux, paths.src_arx.linux)
-  _patch_done(paths.src_dir.linux)
+  # headers are installed from the cache, the kernel tree is not needed
+  if (paths.linux_headers_cache / '.complete').exists():
+    return
+
+  _check_and_extract(paths.src_shared.linux, paths.src_arx.linux)
+  _patch_done(paths.src_shared.linux)
 
 def _mimalloc(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/microsoft/mimalloc/archive/refs/tags/v{ver.mimalloc}.tar.gz'
@@ -249,8 +293,8 @@ def _mimalloc(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.mimalloc, paths.src_arx.mimalloc)
-  _patch_done(paths.src_dir.mimalloc)
+  _check_and_extract(paths.src_shared.mimalloc, paths.src_arx.mimalloc)
+  _patch_done(paths.src_shared.mimalloc)
 
 def _mpc(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://ftpmirror.gnu.org/mpc/{paths.src_arx.mpc.name}'
@@ -258,8 +302,8 @@ def _mpc(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.mpc, paths.src_arx.mpc)
-  _patch_done(paths.src_dir.mpc)
+  _check_and_extract(paths.src_shared.mpc, paths.src_arx.mpc)
+  _patch_done(paths.src_shared.mpc)
 
 def _mpfr(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://ftpmirror.gnu.org/mpfr/{paths.src_arx.mpfr.name}'
@@ -267,8 +311,8 @@ def _mpfr(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.mpfr, paths.src_arx.mpfr)
-  _patch_done(paths.src_dir.mpfr)
+  _check_and_extract(paths.src_shared.mpfr, paths.src_arx.mpfr)
+  _patch_done(paths.src_shared.mpfr)
 
 def _musl(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://www.musl-libc.org/releases/{paths.src_arx.musl.name}'
@@ -276,11 +320,11 @@ def _musl(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  if _check_and_extract(paths.src_dir.musl, paths.src_arx.musl):
+  if _check_and_extract(paths.src_shared.musl, paths.src_arx.musl):
     v = Version(ver.musl)
     if v < Version('1.2'):
-      _patch(paths.src_dir.musl, paths.patch_dir / 'musl-remove-non-proto-decl.patch')
-    _patch_done(paths.src_dir.musl)
+      _patch(paths.src_shared.musl, paths.patch_dir / 'musl-remove-non-proto-decl.patch')
+    _patch_done(paths.src_shared.musl)
 
 def _pkgconf(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/pkgconf/pkgconf/archive/refs/tags/pkgconf-{ver.pkgconf}.tar.gz'
@@ -288,8 +332,8 @@ def _pkgconf(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.pkgconf, paths.src_arx.pkgconf)
-  _patch_done(paths.src_dir.pkgconf)
+  _check_and_extract(paths.src_shared.pkgconf, paths.src_arx.pkgconf)
+  _patch_done(paths.src_shared.pkgconf)
 
 def _png(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://download.sourceforge.net/libpng/{paths.src_arx.png.name}'
@@ -297,8 +341,8 @@ def _png(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.png, paths.src_arx.png)
-  _patch_done(paths.src_dir.png)
+  _check_and_extract(paths.src_shared.png, paths.src_arx.png)
+  _patch_done(paths.src_shared.png)
 
 def _qtbase(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   v = Version(ver.qt)
@@ -308,10 +352,10 @@ def _qtbase(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  if _check_and_extract(paths.src_dir.qtbase, paths.src_arx.qtbase):
+  if _check_and_extract(paths.src_shared.qtbase, paths.src_arx.qtbase):
     if v >= Version('6.9.0'):
-      _patch(paths.src_dir.qtbase, paths.patch_dir / 'qtbase-define-loong-hwcap-flags.patch')
-    _patch_done(paths.src_dir.qtbase)
+      _patch(paths.src_shared.qtbase, paths.patch_dir / 'qtbase-define-loong-hwcap-flags.patch')
+    _patch_done(paths.src_shared.qtbase)
 
 def _qtsvg(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   v = Version(ver.qt)
@@ -321,8 +365,8 @@ def _qtsvg(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.qtsvg, paths.src_arx.qtsvg)
-  _patch_done(paths.src_dir.qtsvg)
+  _check_and_extract(paths.src_shared.qtsvg, paths.src_arx.qtsvg)
+  _patch_done(paths.src_shared.qtsvg)
 
 def _qttools(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   v = Version(ver.qt)
@@ -332,8 +376,8 @@ def _qttools(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.qttools, paths.src_arx.qttools)
-  _patch_done(paths.src_dir.qttools)
+  _check_and_extract(paths.src_shared.qttools, paths.src_arx.qttools)
+  _patch_done(paths.src_shared.qttools)
 
 def _qttranslations(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   v = Version(ver.qt)
@@ -343,8 +387,8 @@ def _qttranslations(ver: BranchProfile, paths: ProjectPaths, download_only: bool
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.qttranslations, paths.src_arx.qttranslations)
-  _patch_done(paths.src_dir.qttranslations)
+  _check_and_extract(paths.src_shared.qttranslations, paths.src_arx.qttranslations)
+  _patch_done(paths.src_shared.qttranslations)
 
 def _qtwayland(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   v = Version(ver.qt)
@@ -354,8 +398,8 @@ def _qtwayland(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.qtwayland, paths.src_arx.qtwayland)
-  _patch_done(paths.src_dir.qtwayland)
+  _check_and_extract(paths.src_shared.qtwayland, paths.src_arx.qtwayland)
+  _patch_done(paths.src_shared.qtwayland)
 
 def _squashfuse(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/vasi/squashfuse/releases/download/{ver.squashfuse}/{paths.src_arx.squashfuse.name}'
@@ -363,9 +407,9 @@ def _squashfuse(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  if _check_and_extract(paths.src_dir.squashfuse, paths.src_arx.squashfuse):
-    _autoreconf(paths.src_dir.squashfuse)
-    _patch_done(paths.src_dir.squashfuse)
+  if _check_and_extract(paths.src_shared.squashfuse, paths.src_arx.squashfuse):
+    _autoreconf(paths.src_shared.squashfuse)
+    _patch_done(paths.src_shared.squashfuse)
 
 def _wayland(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://gitlab.freedesktop.org/wayland/wayland/-/releases/{ver.wayland}/downloads/{paths.src_arx.wayland.name}'
@@ -373,8 +417,8 @@ def _wayland(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.wayland, paths.src_arx.wayland)
-  _patch_done(paths.src_dir.wayland)
+  _check_and_extract(paths.src_shared.wayland, paths.src_arx.wayland)
+  _patch_done(paths.src_shared.wayland)
 
 def _x(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xorg.freedesktop.org/releases/individual/lib/{paths.src_arx.x.name}'
@@ -382,8 +426,8 @@ def _x(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.x, paths.src_arx.x)
-  _patch_done(paths.src_dir.x)
+  _check_and_extract(paths.src_shared.x, paths.src_arx.x)
+  _patch_done(paths.src_shared.x)
 
 def _xau(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xorg.freedesktop.org/releases/individual/lib/{paths.src_arx.xau.name}'
@@ -391,8 +435,8 @@ def _xau(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xau, paths.src_arx.xau)
-  _patch_done(paths.src_dir.xau)
+  _check_and_extract(paths.src_shared.xau, paths.src_arx.xau)
+  _patch_done(paths.src_shared.xau)
 
 def _xcb(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xcb.freedesktop.org/dist/{paths.src_arx.xcb.name}'
@@ -400,8 +444,8 @@ def _xcb(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xcb, paths.src_arx.xcb)
-  _patch_done(paths.src_dir.xcb)
+  _check_and_extract(paths.src_shared.xcb, paths.src_arx.xcb)
+  _patch_done(paths.src_shared.xcb)
 
 def _xcb_proto(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xcb.freedesktop.org/dist/{paths.src_arx.xcb_proto.name}'
@@ -409,8 +453,8 @@ def _xcb_proto(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xcb_proto, paths.src_arx.xcb_proto)
-  _patch_done(paths.src_dir.xcb_proto)
+  _check_and_extract(paths.src_shared.xcb_proto, paths.src_arx.xcb_proto)
+  _patch_done(paths.src_shared.xcb_proto)
 
 def _xcb_util(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xcb.freedesktop.org/dist/{paths.src_arx.xcb_util.name}'
@@ -418,8 +462,8 @@ def _xcb_util(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xcb_util, paths.src_arx.xcb_util)
-  _patch_done(paths.src_dir.xcb_util)
+  _check_and_extract(paths.src_shared.xcb_util, paths.src_arx.xcb_util)
+  _patch_done(paths.src_shared.xcb_util)
 
 def _xcb_util_cursor(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xcb.freedesktop.org/dist/{paths.src_arx.xcb_util_cursor.name}'
@@ -427,8 +471,8 @@ def _xcb_util_cursor(ver: BranchProfile, paths: ProjectPaths, download_only: boo
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xcb_util_cursor, paths.src_arx.xcb_util_cursor)
-  _patch_done(paths.src_dir.xcb_util_cursor)
+  _check_and_extract(paths.src_shared.xcb_util_cursor, paths.src_arx.xcb_util_cursor)
+  _patch_done(paths.src_shared.xcb_util_cursor)
 
 def _xcb_util_image(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xcb.freedesktop.org/dist/{paths.src_arx.xcb_util_image.name}'
@@ -436,8 +480,8 @@ def _xcb_util_image(ver: BranchProfile, paths: ProjectPaths, download_only: bool
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xcb_util_image, paths.src_arx.xcb_util_image)
-  _patch_done(paths.src_dir.xcb_util_image)
+  _check_and_extract(paths.src_shared.xcb_util_image, paths.src_arx.xcb_util_image)
+  _patch_done(paths.src_shared.xcb_util_image)
 
 def _xcb_util_keysyms(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xcb.freedesktop.org/dist/{paths.src_arx.xcb_util_keysyms.name}'
@@ -445,8 +489,8 @@ def _xcb_util_keysyms(ver: BranchProfile, paths: ProjectPaths, download_only: bo
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xcb_util_keysyms, paths.src_arx.xcb_util_keysyms)
-  _patch_done(paths.src_dir.xcb_util_keysyms)
+  _check_and_extract(paths.src_shared.xcb_util_keysyms, paths.src_arx.xcb_util_keysyms)
+  _patch_done(paths.src_shared.xcb_util_keysyms)
 
 def _xcb_util_renderutil(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xcb.freedesktop.org/dist/{paths.src_arx.xcb_util_renderutil.name}'
@@ -454,8 +498,8 @@ def _xcb_util_renderutil(ver: BranchProfile, paths: ProjectPaths, download_only:
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xcb_util_renderutil, paths.src_arx.xcb_util_renderutil)
-  _patch_done(paths.src_dir.xcb_util_renderutil)
+  _check_and_extract(paths.src_shared.xcb_util_renderutil, paths.src_arx.xcb_util_renderutil)
+  _patch_done(paths.src_shared.xcb_util_renderutil)
 
 def _xcb_util_wm(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xcb.freedesktop.org/dist/{paths.src_arx.xcb_util_wm.name}'
@@ -463,8 +507,8 @@ def _xcb_util_wm(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xcb_util_wm, paths.src_arx.xcb_util_wm)
-  _patch_done(paths.src_dir.xcb_util_wm)
+  _check_and_extract(paths.src_shared.xcb_util_wm, paths.src_arx.xcb_util_wm)
+  _patch_done(paths.src_shared.xcb_util_wm)
 
 def _xkbcommon(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/xkbcommon/libxkbcommon/archive/refs/tags/xkbcommon-{ver.xkbcommon}.tar.gz'
@@ -472,8 +516,8 @@ def _xkbcommon(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xkbcommon, paths.src_arx.xkbcommon)
-  _patch_done(paths.src_dir.xkbcommon)
+  _check_and_extract(paths.src_shared.xkbcommon, paths.src_arx.xkbcommon)
+  _patch_done(paths.src_shared.xkbcommon)
 
 def _xml(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   v = Version(ver.xml)
@@ -483,8 +527,8 @@ def _xml(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xml, paths.src_arx.xml)
-  _patch_done(paths.src_dir.xml)
+  _check_and_extract(paths.src_shared.xml, paths.src_arx.xml)
+  _patch_done(paths.src_shared.xml)
 
 def _xorg_proto(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xorg.freedesktop.org/releases/individual/proto/{paths.src_arx.xorg_proto.name}'
@@ -492,8 +536,8 @@ def _xorg_proto(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xorg_proto, paths.src_arx.xorg_proto)
-  _patch_done(paths.src_dir.xorg_proto)
+  _check_and_extract(paths.src_shared.xorg_proto, paths.src_arx.xorg_proto)
+  _patch_done(paths.src_shared.xorg_proto)
 
 def _xtrans(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://xorg.freedesktop.org/releases/individual/lib/{paths.src_arx.xtrans.name}'
@@ -501,8 +545,8 @@ def _xtrans(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.xtrans, paths.src_arx.xtrans)
-  _patch_done(paths.src_dir.xtrans)
+  _check_and_extract(paths.src_shared.xtrans, paths.src_arx.xtrans)
+  _patch_done(paths.src_shared.xtrans)
 
 def _z(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://zlib.net/fossils/{paths.src_arx.z.name}'
@@ -510,8 +554,8 @@ def _z(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  _check_and_extract(paths.src_dir.z, paths.src_arx.z)
-  _patch_done(paths.src_dir.z)
+  _check_and_extract(paths.src_shared.z, paths.src_arx.z)
+  _patch_done(paths.src_shared.z)
 
 def _zstd(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   url = f'https://github.com/facebook/zstd/releases/download/v{ver.zstd}/{paths.src_arx.zstd.name}'
@@ -519,53 +563,72 @@ def _zstd(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   if download_only:
     return
 
-  if _check_and_extract(paths.src_dir.zstd, paths.src_arx.zstd):
-    _patch(paths.src_dir.zstd, paths.patch_dir / 'zstd-add-switch-for-qsort.patch')
-    _patch_done(paths.src_dir.zstd)
+  if _check_and_extract(paths.src_shared.zstd, paths.src_arx.zstd):
+    _patch(paths.src_shared.zstd, paths.patch_dir / 'zstd-add-switch-for-qsort.patch')
+    _patch_done(paths.src_shared.zstd)
+
+def prepare_source(ver: BranchProfile, paths: ProjectPaths, download_only: bool, sources: Optional[Set[str]] = None):
+  """
+  download every archive, extract and clone only `sources` (default: all), the trees the steps
+  to run read
+  """
 
-def prepare_source(ver: BranchProfile, paths: ProjectPaths, download_only: bool):
   v_qt = Version(ver.qt)
 
-  _appimage_runtime(ver, paths, download_only)
-  _binutils(ver, paths, download_only)
-  _dbus(ver, paths, download_only)
-  _expat(ver, paths, download_only)
-  _ffi(ver, paths, download_only)
-  _fcitx_qt(ver, paths, download_only)
-  _fontconfig(ver, paths, download_only)
-  _freetype(ver, paths, download_only)
-  _fuse(ver, paths, download_only)
-  _gcc(ver, paths, download_only)
-  _gmp(ver, paths, download_only)
-  _harfbuzz(ver, paths, download_only)
-  _linux(ver, paths, download_only)
-  _mimalloc(ver, paths, download_only)
-  _mpc(ver, paths, download_only)
-  _mpfr(ver, paths, download_only)
-  _musl(ver, paths, download_only)
-  _pkgconf(ver, paths, download_only)
-  _png(ver, paths, download_only)
-  _qtbase(ver, paths, download_only)
-  _qtsvg(ver, paths, download_only)
-  _qttools(ver, paths, download_only)
-  _qttranslations(ver, paths, download_only)
+  def only_download(name: str) -> bool:
+    return download_only or (sources is not None and name not in sources)
+
+  _appimage_runtime(ver, paths, only_download('appimage_runtime'))
+  _binutils(ver, paths, only_download('binutils'))
+  _dbus(ver, paths, only_download('dbus'))
+  _expat(ver, paths, only_download('expat'))
+  _ffi(ver, paths, only_download('ffi'))
+  _fcitx_qt(ver, paths, only_download('fcitx_qt'))
+  _fontconfig(ver, paths, only_download('fontconfig'))
+  _freetype(ver, paths, only_download('freetype'))
+  _fuse(ver, paths, only_download('fuse'))
+  _gcc(ver, paths, only_download('gcc'))
+  _gmp(ver, paths, only_download('gmp'))
+  _harfbuzz(ver, paths, only_download('harfbuzz'))
+  _linux(ver, paths, only_download('linux'))
+  _mimalloc(ver, paths, only_download('mimalloc'))
+  _mpc(ver, paths, only_download('mpc'))
+  _mpfr(ver, paths, only_download('mpfr'))
+  _musl(ver, paths, only_download('musl'))
+  _pkgconf(ver, paths, only_download('pkgconf'))
+  _png(ver, paths, only_download('png'))
+  _qtbase(ver, paths, only_download('qtbase'))
+  _qtsvg(ver, paths, only_download('qtsvg'))
+  _qttools(ver, paths, only_download('qttools'))
+  _qttranslations(ver, paths, only_download('qttranslations'))
   if v_qt < Version('6.10'):
-    _qtwayland(ver, paths, download_only)
-  _squashfuse(ver, paths, download_only)
-  _wayland(ver, paths, download_only)
-  _x(ver, paths, download_only)
-  _xau(ver, paths, download_only)
-  _xcb(ver, paths, download_only)
-  _xcb_proto(ver, paths, download_only)
-  _xcb_util(ver, paths, download_only)
-  _xcb_util_cursor(ver, paths, download_only)
-  _xcb_util_image(ver, paths, download_only)
-  _xcb_util_keysyms(ver, paths, download_only)
-  _xcb_util_renderutil(ver, paths, download_only)
-  _xcb_util_wm(ver, paths, download_only)
-  _xkbcommon(ver, paths, download_only)
-  _xml(ver, paths, download_only)
-  _xorg_proto(ver, paths, download_only)
-  _xtrans(ver, paths, download_only)
-  _z(ver, paths, download_only)
-  _zstd(ver, paths, download_only)
+    _qtwayland(ver, paths, only_download('qtwayland'))
+  _squashfuse(ver, paths, only_download('squashfuse'))
+  _wayland(ver, paths, only_download('wayland'))
+  _x(ver, paths, only_download('x'))
+  _xau(ver, paths, only_download('xau'))
+  _xcb(ver, paths, only_download('xcb'))
+  _xcb_proto(ver, paths, only_download('xcb_proto'))
+  _xcb_util(ver, paths, only_download('xcb_util'))
+  _xcb_util_cursor(ver, paths, only_download('xcb_util_cursor'))
+  _xcb_util_image(ver, paths, only_download('xcb_util_image'))
+  _xcb_util_keysyms(ver, paths, only_download('xcb_util_keysyms'))
+  _xcb_util_renderutil(ver, paths, only_download('xcb_util_renderutil'))
+  _xcb_util_wm(ver, paths, only_download('xcb_util_wm'))
+  _xkbcommon(ver, paths, only_download('xkbcommon'))
+  _xml(ver, paths, only_download('xml'))
+  _xorg_proto(ver, paths, only_download('xorg_proto'))
+  _xtrans(ver, paths, only_download('xtrans'))
+  _z(ver, paths, only_download('z'))
+  _zstd(ver, paths, only_download('zstd'))
+
+  if download_only:
+    return
+
+  for name, path, shared in zip(SourcePaths._fields, paths.src_dir, paths.src_shared):
+    if sources is not None and name not in sources:
+      continue
+    if path == paths.src_dir.linux and (paths.linux_headers_cache / '.complete').exists():
+      continue
+    if shared.exists():
+      _clone(path, shared)
@@ -1,4 +1,3 @@
-import argparse
 from typing import Optional
 
 class BranchVersions:
@@ -73,6 +72,7 @@ class ProfileInfo:
     self.with_arch = with_arch
 
 class BranchProfile(BranchVersions):
+  branch: str
   arch: str
   kernel_arch: str
   target: str
@@ -80,11 +80,13 @@ class BranchProfile(BranchVersions):
 
   def __init__(
     self,
+    branch: str,
     ver: BranchVersions,
     info: ProfileInfo,
   ):
     BranchVersions.__init__(self, **ver.__dict__)
 
+    self.branch = branch
     self.arch = info.arch
     self.kernel_arch = info.kernel_arch
     self.target = info.target
@@ -138,8 +140,9 @@ PROFILES = {
   ),
 }
 
-def resolve_profile(config: argparse.Namespace) -> BranchProfile:
+def resolve_profile(branch: str, arch: str) -> BranchProfile:
   return BranchProfile(
-    ver = BRANCHES[config.branch],
-    info = PROFILES[config.arch],
+    branch = branch,
+    ver = BRANCHES[branch],
+    info = PROFILES[arch],
   )
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+import json
+import os
+from pathlib import Path
+import time
+from typing import Dict, List, Optional
+
+from module.makespan import Node, makespan
+
+def _format_duration(seconds: float) -> str:
+  return str(timedelta(seconds = round(seconds)))
+
+class Progress:
+  """
+  counts of done, running and pending steps, with an ETA from the durations of past runs
+
+  the ETA replays the scheduler over the steps left (see `makespan`), with expected
+  durations scaled by how this run compares so far: a run where finished steps took 20%
+  longer than recorded expects the same of the rest.
+  """
+
+  names: List[str]
+  deps: List[List[int]]
+  expected: List[Optional[float]]
+
+  def __init__(
+    self,
+    names: List[str],
+    deps: List[List[int]],
+    expected: List[Optional[float]],
+    cores: int,
+    concurrency: int,
+    status_file: Optional[Path],
+  ):
+    self.names = names
+    self.deps = deps
+    self.expected = expected
+    self.cores = cores
+    self.concurrency = max(1, concurrency)
+    self.status_file = status_file
+    self.begin = time.time()
+    self.started: Dict[int, float] = {}
+    self.done: Dict[int, float] = {}
+    self.failed: List[int] = []
+    # actual and expected durations of finished steps with a recorded duration
+    self.actual_total = 0.0
+    self.expected_total = 0.0
+    self._write_status()
+
+  def factor(self) -> float:
+    if self.expected_total <= 0:
+      return 1.0
+    return self.actual_total / self.expected_total
+
+  def eta(self) -> float:
+    """
+    seconds until all steps are done
+    """
+
+    now = time.time()
+    factor = self.factor()
+    # running steps first, so that the replay keeps them on their slots
+    order = [*self.started, *(i for i in range(len(self.names)) if i not in self.started)]
+    position = {i: n for n, i in enumerate(order)}
+    nodes = []
+    for i in order:
+      expected = (self.expected[i] or 0.0) * factor
+      if i in self.done:
+        remaining = 0.0
+      elif i in self.started:
+        remaining = max(0.0, expected - (now - self.started[i]))
+      else:
+        remaining = expected
+      nodes.append(Node(self.names[i], remaining, 1.0, [position[dep] for dep in self.deps[i]]))
+    return makespan(nodes, self.cores, self.concurrency)
+
+  def start(self, i: int):
+    self.started[i] = time.time()
+    self._write_status()
+
+  def reuse(self, i: int):
+    # shows with the next update, reuses come in bursts
+    self.done[i] = 0.0
+
+  def retry(self, i: int):
+    self.started.pop(i, None)
+    self._write_status()
+
+  def finish(self, i: int, duration: float):
+    self.started.pop(i, None)
+    self.done[i] = duration
+    if self.expected[i]:
+      self.actual_total += duration
+      self.expected_total += self.expected[i]
+    self._print(f'{self.names[i]} {_format_duration(duration)}')
+    self._write_status()
+
+  def fail(self, i: int, message: str = ''):
+    self.started.pop(i, None)
+    self.failed.append(i)
+    self._print(f'{self.names[i]} failed{message}')
+    self._write_status()
+
+  def _print(self, event: str):
+    eta = self.eta()
+    finish = datetime.fromtimestamp(time.time() + eta).strftime('%H:%M')
+    print(f'[{len(self.done):3}/{len(self.names)} done, {len(self.started)} running] {event}, ETA {_format_duration(eta)} ({finish})', flush = True)
+
+  def _write_status(self):
+    if self.status_file is None:
+      return
+    now = time.time()
+    eta = self.eta()
+    pending = [i for i in range(len(self.names)) if i not in self.done and i not in self.started and i not in self.failed]
+    status = {
+      'updated': now,
+      'started': self.begin,
+      'elapsed': now - self.begin,
+      'eta': eta,
+      'finish': now + eta,
+      # how much slower (>1) or faster this run is than recorded
+      'pace': self.factor(),
+      'total': len(self.names),
+      'done': [{'name': self.names[i], 'duration': duration} for i, duration in self.done.items()],
+      'running': [
+        {'name': self.names[i], 'started': started, 'expected': self.expected[i]}
+        for i, started in self.started.items()
+      ],
+      'pending': [self.names[i] for i in pending],
+      'failed': [self.names[i] for i in self.failed],
+    }
+    self.status_file.parent.mkdir(parents = True, exist_ok = True)
+    temp = self.status_file.with_name(f'{self.status_file.name}.{os.getpid()}')
+    with open(temp, 'w') as f:
+      json.dump(status, f, indent = 2)
+    os.replace(temp, self.status_file)
@@ -0,0 +1,158 @@
+import argparse
+import os
+from pathlib import Path
+import resource
+import time
+from typing import Dict, List, Optional, Tuple
+
+from module import ccache, hooks, timing
+
+PREFIX = 'redpanda_build'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# set by `setup`
+_file: Optional[Path] = None
+_started = time.time()
+# step durations, successes and package sizes of this run
+_steps: Dict[Labels, Tuple[float, bool]] = {}
+_packages: Dict[Labels, int] = {}
+# layers linked from the store and built, per branch and arch
+_layer_hits: Dict[Labels, int] = {}
+_layer_misses: Dict[Labels, int] = {}
+# archives found and downloaded, with bytes and seconds of the downloads
+_download_hits: Dict[Labels, int] = {}
+_download_misses: Dict[Labels, int] = {}
+_download_bytes: Dict[Labels, int] = {}
+_download_seconds: Dict[Labels, float] = {}
+_ccache_before: Optional[Dict[str, int]] = None
+
+def _labels(**labels: str) -> Labels:
+  return tuple(labels.items())
+
+def _add(counts: dict, labels: Labels, value = 1):
+  counts[labels] = counts.get(labels, 0) + value
+
+def _on_step_start(**_):
+  global _ccache_before
+  if _ccache_before is None and ccache.enabled():
+    _ccache_before = ccache.stats()
+
+def _on_step_end(branch: str, arch: str, step: str, duration: float, ok: bool, **_):
+  _steps[_labels(branch = branch, arch = arch, step = step)] = (duration, ok)
+  write()
+
+def _on_layer_installed(branch: str, arch: str, reused: bool, **_):
+  _add(_layer_hits if reused else _layer_misses, _labels(branch = branch, arch = arch))
+
+def _on_package_done(branch: str, arch: str, size: int, **_):
+  _packages[_labels(branch = branch, arch = arch)] = size
+
+def _on_download_done(branch: str, arch: str, cached: bool, size: int, duration: float, **_):
+  labels = _labels(branch = branch, arch = arch)
+  if cached:
+    _add(_download_hits, labels)
+    return
+  _add(_download_misses, labels)
+  _add(_download_bytes, labels, size)
+  _add(_download_seconds, labels, duration)
+
+def setup(config: argparse.Namespace):
+  """
+  keep a Prometheus text file of step durations, cache hits and misses, downloads, peak RSS
+  and package sizes, rewritten after each step, for the node exporter textfile collector
+  """
+
+  global _file
+  if config.prometheus_textfile is None:
+    raise Exception('the prometheus plugin needs --prometheus-textfile FILE')
+  _file = config.prometheus_textfile
+  hooks.register('step_start', _on_step_start)
+  hooks.register('step_end', _on_step_end)
+  hooks.register('layer_installed', _on_layer_installed)
+  hooks.register('package_done', _on_package_done)
+  hooks.register('download_done', _on_download_done)
+  hooks.register('run_end', write)
+
+def _escape(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _escape_help(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('\n', '\\n')
+
+def _format(value: float) -> str:
+  return str(value) if isinstance(value, int) else repr(float(value))
+
+class _Exposition:
+  """
+  metrics in the Prometheus text format (version 0.0.4) that the textfile collector parses
+  """
+
+  lines: List[str]
+
+  def __init__(self):
+    self.lines = []
+
+  def family(self, name: str, type: str, help: str, samples: Dict[Labels, float]):
+    if not samples:
+      return
+    name = f'{PREFIX}_{name}'
+    self.lines.append(f'# HELP {name} {_escape_help(help)}')
+    self.lines.append(f'# TYPE {name} {type}')
+    for labels, value in sorted(samples.items()):
+      text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+      self.lines.append(f'{name}{{{text}}} {_format(value)}' if text else f'{name} {_format(value)}')
+
+  def text(self) -> str:
+    return '\n'.join([*self.lines, ''])
+
+def _peak_rss() -> Dict[Labels, float]:
+  """
+  per step, as recorded by --timing in the process that ran it
+  """
+
+  result = {}
+  for name, step in timing.summarize(timing.recorded_events()).items():
+    build, _, step_name = name.partition(':')
+    branch, _, arch = build.partition('/')
+    if step_name and step_name != 'prepare' and step['max_rss'] is not None:
+      result[_labels(branch = branch, arch = arch, step = step_name)] = step['max_rss']
+  return result
+
+def write(**_):
+  if _file is None:
+    return
+  metrics = _Exposition()
+  metrics.family('step_duration_seconds', 'gauge', 'Wall time of the last run of a step', {labels: duration for labels, (duration, _) in _steps.items()})
+  metrics.family('step_success', 'gauge', 'Whether the last run of a step succeeded', {labels: int(ok) for labels, (_, ok) in _steps.items()})
+  metrics.family('step_peak_rss_bytes', 'gauge', 'Peak RSS of the largest process of a step (with --timing)', _peak_rss())
+  metrics.family('layer_cache_hits_total', 'counter', 'Layers linked from the store', _layer_hits)
+  metrics.family('layer_cache_misses_total', 'counter', 'Layers built', _layer_misses)
+  metrics.family('download_cache_hits_total', 'counter', 'Source archives already downloaded', _download_hits)
+  metrics.family('download_cache_misses_total', 'counter', 'Source archives downloaded', _download_misses)
+  metrics.family('download_bytes_total', 'counter', 'Bytes of downloaded source archives', _download_bytes)
+  metrics.family('download_seconds_total', 'counter', 'Time spent downloading source archives', _download_seconds)
+  metrics.family('download_throughput_bytes_per_second', 'gauge', 'Average download throughput of this run', {
+    labels: _download_bytes[labels] / seconds for labels, seconds in _download_seconds.items() if seconds > 0
+  })
+  if _ccache_before is not None:
+    after = ccache.stats()
+    metrics.family('ccache_hits_total', 'counter', 'Compilations served by ccache in this run', {
+      (): sum(after.get(key, 0) - _ccache_before.get(key, 0) for key in ccache.STATS_HIT),
+    })
+    metrics.family('ccache_misses_total', 'counter', 'Compilations missing ccache in this run', {
+      (): sum(after.get(key, 0) - _ccache_before.get(key, 0) for key in ccache.STATS_MISS),
+    })
+  metrics.family('package_size_bytes', 'gauge', 'Size of the package file', _packages)
+  metrics.family('peak_rss_bytes', 'gauge', 'Peak RSS of the largest finished process of this run', {
+    (): resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+  })
+  metrics.family('run_start_timestamp_seconds', 'gauge', 'Start of this run', {(): _started})
+  metrics.family('run_duration_seconds', 'gauge', 'Wall time of this run so far', {(): time.time() - _started})
+
+  _file.parent.mkdir(parents = True, exist_ok = True)
+  # the textfile collector only reads *.prom
+  temp = _file.with_name(f'{_file.name}.{os.getpid()}.tmp')
+  with open(temp, 'w') as f:
+    f.write(metrics.text())
+  os.replace(temp, _file)
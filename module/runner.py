@@ -0,0 +1,587 @@
+import argparse
+from copy import copy
+from datetime import timedelta
+import json
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+from pathlib import Path
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from module import autoconf_cache, cmake_cache, disk_usage, hooks, metrics, simulate, steplog, timing
+from module.fingerprint import configure_cache_key, function_facts, toolchain_fingerprint
+from module.path import ProjectPaths
+from module.profile import BranchProfile
+from module.progress import Progress
+from module.step import Step, dependency_closure, dependents, function_inputs, step_dependencies, step_outputs
+from module.util import private_mount_namespace
+import module.store as store
+from module.workspace import release_sources
+
+class Journal:
+  """
+  persisted record of completed steps, so that a failed build resumes from the failing step
+  """
+
+  path: Path
+  entries: Dict[str, dict]
+
+  def __init__(self, path: Path):
+    self.path = path
+    self.entries = {}
+    if path.exists():
+      with open(path, 'r') as f:
+        self.entries = json.load(f)
+
+  def is_done(self, name: str, fingerprint: Optional[str] = None) -> bool:
+    entry = self.entries.get(name, {})
+    if fingerprint is not None and entry.get('fingerprint') != fingerprint:
+      return False
+    return entry.get('done', False)
+
+  def duration(self, name: str) -> Optional[float]:
+    return self.entries.get(name, {}).get('duration')
+
+  def mark_done(self, name: str, fingerprint: str, duration: Optional[float] = None):
+    entry = self.entries.setdefault(name, {})
+    entry['done'] = True
+    entry['fingerprint'] = fingerprint
+    entry['finished'] = time.time()
+    if duration is not None:
+      entry['duration'] = duration
+    self.save()
+
+  def disk(self, name: str) -> Optional[dict]:
+    return self.entries.get(name, {}).get('disk')
+
+  def record_disk(self, name: str, disk: dict):
+    self.entries.setdefault(name, {})['disk'] = disk
+    self.save()
+
+  def invalidate(self, names: List[str]):
+    # keep the recorded duration for estimates
+    for name in names:
+      if name in self.entries:
+        self.entries[name]['done'] = False
+    self.save()
+
+  def save(self):
+    self.path.parent.mkdir(parents = True, exist_ok = True)
+    temp = self.path.with_name(self.path.name + '.tmp')
+    with open(temp, 'w') as f:
+      json.dump(self.entries, f, indent = 2)
+    os.replace(temp, self.path)
+
+class Build(NamedTuple):
+  ver: BranchProfile
+  paths: ProjectPaths
+  steps: List[Step]
+  journal: Journal
+  fingerprints: Dict[str, str]
+  # arch-independent steps only
+  templates: Dict[str, str]
+
+  def is_done(self, step: Step) -> bool:
+    fingerprint = self.fingerprints[step.name]
+    if not self.journal.is_done(step.name, fingerprint):
+      return False
+    if step_outputs(step):
+      return store.is_complete(self.paths, fingerprint) and store.is_linked(step, self.paths, fingerprint)
+    return True
+
+class Task(NamedTuple):
+  build: Build
+  step: Step
+  # rebuild even if the layers are in the store
+  forced: bool
+
+  @property
+  def name(self) -> str:
+    return f'{self.build.ver.branch}/{self.build.ver.arch}:{self.step.name}'
+
+  @property
+  def fingerprint(self) -> str:
+    return self.build.fingerprints[self.step.name]
+
+  @property
+  def template(self) -> Optional[str]:
+    return self.build.templates.get(self.step.name)
+
+  @property
+  def share_key(self) -> str:
+    """
+    tasks with the same key are built once, arch-independent steps are shared by every arch
+    """
+    return self.template or self.fingerprint
+
+  @property
+  def prefix(self) -> str:
+    return f'/usr/local/{self.build.ver.target}'
+
+def find_step(steps: List[Step], name: str) -> int:
+  for i, step in enumerate(steps):
+    if step.name == name:
+      return i
+  raise Exception(f'unknown step: {name} (see --list-steps)')
+
+def _step_names(steps: List[Step], values: List[str]) -> Set[str]:
+  result = set()
+  for names in values:
+    for name in names.split(','):
+      result.add(steps[find_step(steps, name)].name)
+  return result
+
+def select_steps(build: Build, config: argparse.Namespace) -> List[Tuple[Step, bool]]:
+  """
+  steps to run, each with whether it is forced to rebuild
+  """
+
+  steps = build.steps
+
+  if config.only:
+    selected = _step_names(steps, config.only)
+    return [(step, True) for step in steps if step.name in selected]
+
+  forced = set()
+  if config.from_step:
+    start = steps[find_step(steps, config.from_step)].name
+    forced.update([start, *dependents(steps, start)])
+
+  candidates = steps
+  if config.package:
+    requested = _step_names(steps, config.package)
+    forced.update(requested)
+    closure = dependency_closure(steps, requested)
+    candidates = [step for step in steps if step.name in closure]
+
+  return [
+    (step, step.name in forced)
+    for step in candidates
+    if step.name in forced or not build.is_done(step)
+  ]
+
+def list_steps(build: Build):
+  for step in build.steps:
+    fingerprint = build.fingerprints[step.name]
+    if build.is_done(step):
+      status = 'done'
+    elif step_outputs(step) and store.is_complete(build.paths, fingerprint):
+      status = 'shared'
+    elif step.name in build.templates and store.has_template(build.paths, build.templates[step.name]):
+      status = 'shared'
+    else:
+      status = 'pending'
+    print(f'{step.name:32} {status:8} {fingerprint[:12]}')
+
+def _format_duration(seconds: float) -> str:
+  return str(timedelta(seconds = round(seconds)))
+
+def _reusable(task: Task) -> bool:
+  if task.forced or not step_outputs(task.step):
+    return False
+  if store.is_complete(task.build.paths, task.fingerprint):
+    return True
+  return task.template is not None and store.has_template(task.build.paths, task.template)
+
+def print_plan(tasks: List[Task]):
+  total = 0.0
+  unknown = 0
+  planned: Set[str] = set()
+  for task in tasks:
+    duration = task.build.journal.duration(task.step.name)
+    if _reusable(task) or (task.share_key in planned and step_outputs(task.step) and not task.forced):
+      estimate = 'shared'
+    elif duration is None:
+      unknown += 1
+      estimate = '?'
+    else:
+      total += duration
+      estimate = _format_duration(duration)
+    planned.add(task.share_key)
+    print(f'{task.name:48} {estimate:>10}')
+
+  message = f'{len(tasks)} steps, estimated {_format_duration(total)}'
+  if unknown:
+    message += f' (+{unknown} steps without recorded duration)'
+  print(message)
+
+def make_tasks(builds: List[Build], config: argparse.Namespace) -> List[Task]:
+  """
+  select steps of every build, interleaved so that a batch makes progress on all builds
+  """
+
+  return interleave(builds, [select_steps(build, config) for build in builds])
+
+def interleave(builds: List[Build], selected: List[List[Tuple[Step, bool]]]) -> List[Task]:
+  tasks = []
+  for i in range(max(map(len, selected), default = 0)):
+    for build, steps in zip(builds, selected):
+      if i < len(steps):
+        step, forced = steps[i]
+        tasks.append(Task(build, step, forced))
+  return tasks
+
+def _execute(task: Task, config: argparse.Namespace):
+  ver = task.build.ver
+  with steplog.capture(ver.branch, ver.arch, task.step.name), timing.span(task.name, 'step'), hooks.running(ver.branch, ver.arch, task.step.name):
+    _execute_step(task, config)
+
+def _execute_step(task: Task, config: argparse.Namespace):
+  step = task.step
+  if config.simulate:
+    simulate.run_step(step, task.build.steps, task.build.ver, task.build.paths, config)
+    return
+  autoconf_cache.select(task.build.ver.target, toolchain_fingerprint(task.build.steps, task.build.fingerprints))
+  cmake_cache.select(configure_cache_key(step, task.build.steps, task.build.fingerprints))
+  saved_env = {k: os.environ.get(k) for k in step.env}
+  os.environ.update(step.env)
+  try:
+    step.func(task.build.ver, task.build.paths, config)
+  finally:
+    for k, v in saved_env.items():
+      if v is None:
+        del os.environ[k]
+      else:
+        os.environ[k] = v
+
+def _execute_isolated(task: Task, config: argparse.Namespace):
+  if not config.simulate:
+    private_mount_namespace()
+  _execute(task, config)
+
+class LocalRun:
+  """
+  a task running in a forked process, waitable on the process sentinel
+  """
+
+  _context = multiprocessing.get_context('fork')
+
+  def __init__(self, task: Task, config: argparse.Namespace):
+    self.task = task
+    self.start = time.monotonic()
+    self.process = self._context.Process(target = _execute_isolated, args = (task, config))
+    self.process.start()
+
+  def fileno(self) -> int:
+    return self.process.sentinel
+
+  def result(self) -> Optional[bool]:
+    self.process.join()
+    if self.process.exitcode != 0:
+      logging.critical('Step %s failed with exit code %d' % (self.task.name, self.process.exitcode))
+    return self.process.exitcode == 0
+
+def execute_process(task: Task, config: argparse.Namespace) -> bool:
+  return bool(LocalRun(task, config).result())
+
+def _start(task: Task):
+  if step_outputs(task.step):
+    store.prepare(task.step, task.build.paths, task.fingerprint)
+
+def _finish(task: Task, duration: float):
+  if step_outputs(task.step):
+    store.complete(task.build.paths, task.fingerprint)
+    if task.template is not None:
+      store.register_template(task.build.paths, task.template, task.fingerprint, task.prefix)
+  task.build.journal.mark_done(task.step.name, task.fingerprint, duration)
+  metrics.add(task.build.ver, task.build.paths, task.step, task.name, task.fingerprint, duration)
+  _account_disk(task)
+  _emit_installed(task, False)
+  _emit_package(task)
+  _emit_end(task, duration, True)
+
+def _step_fields(task: Task) -> dict:
+  return {'branch': task.build.ver.branch, 'arch': task.build.ver.arch, 'step': task.step.name}
+
+def _emit_start(task: Task):
+  if hooks.active('step_start'):
+    hooks.emit('step_start', **_step_fields(task), time = time.time())
+
+def _emit_end(task: Task, duration: float, ok: bool):
+  if hooks.active('step_end'):
+    hooks.emit('step_end', **_step_fields(task), time = time.time(), duration = duration, ok = ok)
+
+def _emit_installed(task: Task, reused: bool):
+  if hooks.active('layer_installed'):
+    for layer in store.layer_paths(task.step, task.build.paths):
+      hooks.emit('layer_installed', **_step_fields(task), path = layer, fingerprint = task.fingerprint, reused = reused)
+
+def _emit_package(task: Task):
+  if not hooks.active('package_done') or 'package_file' not in function_facts(task.step.func).paths_attrs:
+    return
+  package = task.build.paths.package_file
+  if package.exists():
+    hooks.emit('package_done', **_step_fields(task), path = package, size = package.stat().st_size)
+
+def _account_disk(task: Task):
+  """
+  measure the trees the step wrote to, before its sources are released
+  """
+
+  paths = task.build.paths
+  sources = {name: getattr(paths.src_dir, name) for name in sorted(function_inputs(task.step.func).sources)}
+  layers = store.entry_dir(paths, task.fingerprint) if step_outputs(task.step) else None
+  package = paths.package_file if 'package_file' in function_facts(task.step.func).paths_attrs else None
+  trees = {tree: '' for tree in sources.values()}
+  if layers is not None:
+    trees[layers] = f'{task.name} layers'
+  if package is not None:
+    trees[package] = ''
+  disk_usage.account(trees)
+  task.build.journal.record_disk(task.step.name, {
+    'sources': {name: disk_usage.allocated(tree) for name, tree in sources.items()},
+    'layers': disk_usage.allocated(layers) if layers else 0,
+    'package': disk_usage.allocated(package) if package else 0,
+  })
+
+def _check_free(tasks: List[Task], duplicates: Set[int], config: argparse.Namespace):
+  """
+  fail before building if the sizes recorded by the previous run do not fit
+
+  source trees are counted at the size they grow to, less what is already there. when
+  trees are released, only the largest trees of concurrently running steps count.
+  """
+
+  layers = 0
+  package = 0
+  sources: Dict[Path, int] = {}
+  for i, task in enumerate(tasks):
+    disk = task.build.journal.disk(task.step.name)
+    if disk is None or i in duplicates or _reusable(task):
+      continue
+    layers += disk['layers']
+    package += disk['package']
+    for name, size in disk['sources'].items():
+      tree = getattr(task.build.paths.src_dir, name)
+      sources[tree] = max(sources.get(tree, 0), size)
+
+  growth = sorted((max(0, size - disk_usage.tree_size(tree)[1]) for tree, size in sources.items()), reverse = True)
+  if _releasing(config):
+    growth = growth[:max(1, config.parallel_steps)]
+  paths = tasks[0].build.paths
+  disk_usage.check_free([
+    (paths.build_root, sum(growth), 'source trees and build dirs'),
+    (paths.layer_store, layers, 'layers'),
+    (paths.container_dir, package, 'packages'),
+  ])
+
+def _make_progress(tasks: List[Task], task_deps: List[List[int]], duplicates: Set[int], config: argparse.Namespace) -> Progress:
+  expected = [
+    None if i in duplicates or _reusable(task) else task.build.journal.duration(task.step.name)
+    for i, task in enumerate(tasks)
+  ]
+  concurrency = config.parallel_steps if config.parallel_steps > 1 else 1
+  return Progress([task.name for task in tasks], task_deps, expected, config.jobs, concurrency, config.status_file)
+
+def _failure_note(task: Task) -> str:
+  log = steplog.log_file(task.build.ver.branch, task.build.ver.arch, task.step.name)
+  return f', log: {log}' if log is not None else ''
+
+def _reuse(task: Task):
+  if store.is_complete(task.build.paths, task.fingerprint):
+    store.link(task.step, task.build.paths, task.fingerprint)
+  else:
+    store.retarget(task.step, task.build.paths, task.template, task.fingerprint, task.prefix)
+  task.build.journal.mark_done(task.step.name, task.fingerprint)
+  _emit_installed(task, True)
+  logging.info('Reusing layer of %s (%s)' % (task.name, task.fingerprint[:12]))
+
+def _releasing(config: argparse.Namespace) -> bool:
+  return bool(config.tmpfs or config.gc)
+
+def _release_sources(task: Task, remaining: List[Task], config: argparse.Namespace):
+  """
+  take the task's source trees off the build root once no remaining task uses them
+  """
+
+  def needed(build: Build, name: str) -> bool:
+    return any(name in function_inputs(t.step.func).sources for t in remaining if t.build is build)
+
+  build = task.build
+  unused = [name for name in sorted(function_inputs(task.step.func).sources) if not needed(build, name)]
+  for name in unused:
+    siblings = [t.build for t in remaining if t.build.paths.source_dir == build.paths.source_dir]
+    shared = not any(needed(sibling, name) for sibling in siblings)
+    release_sources([name], build.paths, config.spill_dir, shared)
+
+def needed_sources(tasks: List[Task], build: Build) -> Set[str]:
+  """
+  source trees the build's tasks read, tasks linking their layers from the store read none
+  """
+
+  _, duplicates = task_graph(tasks)
+  result: Set[str] = set()
+  for i, task in enumerate(tasks):
+    if task.build is build and i not in duplicates and not _reusable(task):
+      result.update(function_inputs(task.step.func).sources)
+  return result
+
+def _report_shared(shared: List[Task]):
+  if shared:
+    print(f'{len(shared)} layers shared from the store:')
+    for task in shared:
+      print(f'  {task.name:48} {task.fingerprint[:12]}')
+
+def _job_share(config: argparse.Namespace, concurrent: int) -> int:
+  return max(1, config.jobs // max(1, min(config.parallel_steps, concurrent)))
+
+def task_graph(tasks: List[Task]) -> Tuple[List[List[int]], Set[int]]:
+  """
+  indices of the tasks each task waits for, and the tasks that link a layer built by another
+
+  identical layers are built once, other builds wait for the first and link it.
+  """
+
+  owner: Dict[str, int] = {}
+  duplicates: Set[int] = set()
+  for i, task in enumerate(tasks):
+    if step_outputs(task.step):
+      if task.share_key in owner:
+        duplicates.add(i)
+      else:
+        owner[task.share_key] = i
+
+  index = {(id(task.build), task.step.name): i for i, task in enumerate(tasks)}
+  build_deps = {id(task.build): step_dependencies(task.build.steps) for task in tasks}
+  task_deps = [
+    [index[(id(task.build), dep)] for dep in build_deps[id(task.build)][task.step.name] if (id(task.build), dep) in index]
+    for task in tasks
+  ]
+
+  for i in duplicates:
+    task_deps[i].append(owner[tasks[i].share_key])
+  return task_deps, duplicates
+
+def run_tasks(tasks: List[Task], config: argparse.Namespace, coordinator = None):
+  """
+  run tasks of all builds through one scheduler
+
+  a task whose layers are already in the store (built by another arch or branch, or by an
+  earlier task of this run) is linked instead of built, arch-independent layers are copied
+  with the prefix rewritten. with `--parallel-steps 1` steps run
+  in order in this process (in a forked one each with `--timing`). otherwise independent steps run concurrently in forked processes,
+  each with a private mount namespace, sharing the `--jobs` budget. with a coordinator, steps
+  installing layers run on workers instead (see `module.distributed`).
+  """
+
+  for build in {id(task.build): task.build for task in tasks}.values():
+    build.journal.invalidate([task.step.name for task in tasks if task.build is build])
+
+  task_deps, duplicates = task_graph(tasks)
+  shared: List[Task] = []
+  if config.check_free and tasks:
+    _check_free(tasks, duplicates, config)
+  progress = _make_progress(tasks, task_deps, duplicates, config)
+
+  if config.parallel_steps <= 1 and coordinator is None:
+    for i, task in enumerate(tasks):
+      if i in duplicates or _reusable(task):
+        _reuse(task)
+        shared.append(task)
+        progress.reuse(i)
+        if _releasing(config):
+          _release_sources(task, tasks[i + 1:], config)
+        continue
+      logging.info('Running step %s' % task.name)
+      start = time.monotonic()
+      _start(task)
+      progress.start(i)
+      _emit_start(task)
+      try:
+        if timing.enabled():
+          # a process of its own, for the peak RSS of the step's children alone
+          if not execute_process(task, config):
+            raise Exception(f'step {task.name} failed')
+        else:
+          _execute(task, config)
+      except BaseException:
+        progress.fail(i, _failure_note(task))
+        _emit_end(task, time.monotonic() - start, False)
+        raise
+      _finish(task, time.monotonic() - start)
+      progress.finish(i, time.monotonic() - start)
+      if _releasing(config):
+        _release_sources(task, tasks[i + 1:], config)
+    _report_shared(shared)
+    return
+
+  waiting = list(range(len(tasks)))
+  finished: Set[int] = set()
+  running: Dict[int, Tuple[int, object]] = {}
+  failed: List[Task] = []
+
+  def local_count() -> int:
+    return sum(isinstance(run, LocalRun) for _, run in running.values())
+
+  while waiting or running:
+    changed = True
+    while changed and not failed:
+      changed = False
+      ready = [i for i in waiting if all(dep in finished for dep in task_deps[i])]
+      for n, i in enumerate(ready):
+        task = tasks[i]
+        if i in duplicates or _reusable(task):
+          _reuse(task)
+          shared.append(task)
+          progress.reuse(i)
+          waiting.remove(i)
+          finished.add(i)
+          changed = True
+          if _releasing(config):
+            _release_sources(task, [tasks[j] for j in range(len(tasks)) if j not in finished], config)
+        elif coordinator is not None and step_outputs(task.step):
+          # layer steps go to workers, the coordinator only links and packages
+          if coordinator.idle:
+            _start(task)
+            run = coordinator.dispatch(task, config)
+            if run is not None:
+              progress.start(i)
+              _emit_start(task)
+              waiting.remove(i)
+              running[run.fileno()] = (i, run)
+            changed = True
+        elif local_count() < config.parallel_steps:
+          task_config = copy(config)
+          task_config.jobs = _job_share(config, local_count() + len(ready) - n)
+          logging.info('Running step %s (%d jobs)' % (task.name, task_config.jobs))
+          _start(task)
+          run = LocalRun(task, task_config)
+          progress.start(i)
+          _emit_start(task)
+          waiting.remove(i)
+          running[run.fileno()] = (i, run)
+
+    # without running tasks, only a coordinator waiting for workers can make progress
+    if not running and (coordinator is None or failed or not waiting):
+      break
+
+    waitables = [*running, *(coordinator.waitables() if coordinator is not None else [])]
+    for ready_object in wait(waitables):
+      if ready_object not in running:
+        coordinator.handle(ready_object)
+        continue
+      i, run = running.pop(ready_object)
+      result = run.result()
+      if result is None:
+        # lost worker, hand the task out again
+        progress.retry(i)
+        waiting.append(i)
+      elif result:
+        _finish(tasks[i], time.monotonic() - run.start)
+        finished.add(i)
+        progress.finish(i, time.monotonic() - run.start)
+        if _releasing(config):
+          _release_sources(tasks[i], [tasks[j] for j in range(len(tasks)) if j not in finished], config)
+      else:
+        failed.append(tasks[i])
+        progress.fail(i, _failure_note(tasks[i]))
+        _emit_end(tasks[i], time.monotonic() - run.start, False)
+
+  _report_shared(shared)
+
+  if failed:
+    raise Exception('failed steps: ' + ', '.join(task.name for task in failed))
+  if waiting:
+    raise Exception('unscheduled steps: ' + ', '.join(tasks[i].name for i in waiting))
@@ -0,0 +1,149 @@
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+SAMPLES_FILE = 'samples.jsonl'
+
+# processes doing the actual compiling and linking, below make, ninja and the drivers
+COMPILERS = {'as', 'cc1', 'cc1plus', 'collect2', 'ld', 'ld.bfd', 'ld.gold', 'lto1', 'lto-wrapper', 'moc', 'rcc', 'uic'}
+
+def _cpu_times() -> Tuple[int, int, int]:
+  """
+  busy, iowait and total jiffies of all cores
+  """
+
+  with open('/proc/stat', 'r') as f:
+    values = [int(value) for value in f.readline().split()[1:]]
+  user, nice, system, idle, iowait, irq, softirq, steal = values[:8]
+  busy = user + nice + system + irq + softirq + steal
+  return busy, iowait, busy + idle + iowait
+
+def _running() -> int:
+  with open('/proc/loadavg', 'r') as f:
+    return int(f.read().split()[3].split('/')[0])
+
+def _memory() -> Dict[str, int]:
+  result = {}
+  with open('/proc/meminfo', 'r') as f:
+    for line in f:
+      name, value = line.split(':', 1)
+      result[name] = int(value.split()[0]) * 1024
+  return result
+
+def _paged() -> Tuple[int, int]:
+  """
+  KiB read from and written to block devices since boot
+  """
+
+  values = {}
+  with open('/proc/vmstat', 'r') as f:
+    for line in f:
+      name, value = line.split()
+      values[name] = int(value)
+  return values['pgpgin'], values['pgpgout']
+
+def _compilers() -> int:
+  count = 0
+  for pid in os.listdir('/proc'):
+    if not pid.isdigit():
+      continue
+    try:
+      with open(f'/proc/{pid}/comm', 'r') as f:
+        if f.read().strip() in COMPILERS:
+          count += 1
+    except OSError:
+      # exited meanwhile
+      pass
+  return count
+
+class ResourceSampler:
+  """
+  sample system-wide CPU, run queue, memory, disk I/O and compiler processes in the background
+  """
+
+  dir: Path
+  interval: float
+  samples: List[dict]
+
+  def __init__(self, dir: Path, interval: float):
+    self.dir = dir
+    self.interval = interval
+    self.samples = []
+    self._cores = os.cpu_count() or 1
+    self._previous: Optional[Tuple[float, Tuple[int, int, int], Tuple[int, int]]] = None
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target = self._run, daemon = True)
+
+  def sample(self):
+    now = time.time()
+    cpu = _cpu_times()
+    paged = _paged()
+    if self._previous is not None:
+      then, cpu_before, paged_before = self._previous
+      elapsed = max(now - then, 1e-3)
+      total = max(cpu[2] - cpu_before[2], 1)
+      memory = _memory()
+      self.samples.append({
+        'time': now,
+        'busy_cores': (cpu[0] - cpu_before[0]) / total * self._cores,
+        'iowait_cores': (cpu[1] - cpu_before[1]) / total * self._cores,
+        'running': _running(),
+        'memory_used': memory['MemTotal'] - memory['MemAvailable'],
+        'read_bytes_per_second': (paged[0] - paged_before[0]) * 1024 / elapsed,
+        'write_bytes_per_second': (paged[1] - paged_before[1]) * 1024 / elapsed,
+        'compilers': _compilers(),
+      })
+    self._previous = (now, cpu, paged)
+
+  def _run(self):
+    self.sample()
+    while not self._stop.wait(self.interval):
+      self.sample()
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    """
+    stop sampling and write the samples next to the timing events
+    """
+
+    self._stop.set()
+    self._thread.join()
+    with open(self.dir / SAMPLES_FILE, 'w') as f:
+      for sample in self.samples:
+        f.write(json.dumps(sample) + '\n')
+
+def load_samples(dir: Path) -> List[dict]:
+  path = dir / SAMPLES_FILE
+  if not path.exists():
+    return []
+  with open(path, 'r') as f:
+    return [json.loads(line) for line in f if line.strip()]
+
+def counter_events(samples: List[dict], origin: float) -> List[dict]:
+  """
+  Chrome trace counter tracks, drawn above the step spans on the same time axis
+  """
+
+  tracks = {
+    'cpu': ['busy_cores', 'iowait_cores'],
+    'run queue': ['running'],
+    'memory': ['memory_used'],
+    'disk I/O': ['read_bytes_per_second', 'write_bytes_per_second'],
+    'compilers': ['compilers'],
+  }
+  events = []
+  for sample in samples:
+    for name, keys in tracks.items():
+      events.append({
+        'name': name,
+        'ph': 'C',
+        'pid': 1,
+        'ts': (sample['time'] - origin) * 1e6,
+        'args': {key: round(sample[key], 2) for key in keys},
+      })
+  return events
@@ -0,0 +1,71 @@
+import argparse
+import json
+import logging
+from pathlib import Path
+import time
+from typing import List, Optional
+
+from module.path import ProjectPaths
+from module.profile import BranchProfile
+from module.step import Step, function_inputs, step_outputs
+from module.util import package_layers
+
+# marker written into each synthetic layer, checked by the steps depending on it
+MARKER = 'usr/local/share/simulate'
+
+def recorded_duration(step: Step, ver: BranchProfile, paths: ProjectPaths) -> Optional[float]:
+  """
+  duration of the step's last real build, from the journal outside `simulate/`
+  """
+
+  journal = paths.root_dir / 'layer' / ver.branch / ver.arch / 'journal.json'
+  if not journal.exists():
+    return None
+  with open(journal, 'r') as f:
+    return json.load(f).get(step.name, {}).get('duration')
+
+def _check_inputs(step: Step, steps: List[Step], paths: ProjectPaths):
+  """
+  fail if a layer the step mounts was not written yet, i.e. the scheduler got the order wrong
+  """
+
+  produced = {output for other in steps if other is not step for output in step_outputs(other)}
+  for group, field in sorted(function_inputs(step.func).layers, key = str):
+    if (group, field) not in produced:
+      continue
+    layer = getattr(getattr(paths, f'layer_{group}'), field)
+    if not (layer / MARKER / layer.name).exists():
+      raise Exception(f'{step.name} started before its input layer {group}.{field} was built')
+
+def _check_package(steps: List[Step], paths: ProjectPaths):
+  """
+  fail if a layer the package step would mount is missing
+  """
+
+  for layer in package_layers(paths, steps):
+    if not (layer / MARKER / layer.name).exists():
+      raise Exception(f'package would mount {layer}, which no step wrote')
+
+def run_step(step: Step, steps: List[Step], ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
+  """
+  stand in for a step: sleep for its recorded (or the configured) duration, then write a
+  synthetic layer for each of its outputs
+  """
+
+  _check_inputs(step, steps, paths)
+  if step.name == 'package':
+    _check_package(steps, paths)
+
+  duration = recorded_duration(step, ver, paths)
+  if duration is None:
+    duration = config.simulate_duration
+  else:
+    duration *= config.simulate_scale
+  logging.info('Simulating %s for %.2fs' % (step.name, duration))
+  time.sleep(duration)
+
+  for group, field in step_outputs(step):
+    layer: Path = getattr(getattr(paths, f'layer_{group}'), field)
+    marker = layer / MARKER / layer.name
+    marker.parent.mkdir(parents = True, exist_ok = True)
+    marker.write_text(json.dumps({'step': step.name, 'duration': duration}))
@@ -0,0 +1,118 @@
+import argparse
+import ast
+import inspect
+import textwrap
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from module.path import ProjectPaths
+from module.profile import BranchProfile
+
+class Step(NamedTuple):
+  name: str
+  func: Callable[[BranchProfile, ProjectPaths, argparse.Namespace], None]
+  env: Dict[str, str] = {}
+  # layers installed besides the one named after the step
+  outputs: Tuple[str, ...] = ()
+  # layers are identical for every arch except for the `/usr/local/{triplet}` prefix
+  arch_independent: bool = False
+
+LAYER_GROUPS = {
+  'layer_host': 'host',
+  'layer_x': 'x',
+  'layer_target': 'target',
+}
+
+class StepInputs(NamedTuple):
+  # (group, field), field is None when the whole group is referenced
+  layers: Set[Tuple[str, Optional[str]]]
+  sources: Set[str]
+
+_inputs_cache: Dict[Callable, StepInputs] = {}
+
+def _is_paths(node: ast.AST) -> bool:
+  return isinstance(node, ast.Name) and node.id == 'paths'
+
+def function_inputs(func: Callable) -> StepInputs:
+  """
+  find the layers and sources a build function refers to, by walking its syntax tree
+
+  helpers that are passed `paths` (e.g. `toolchain_layers(paths)`) are followed.
+  """
+
+  if func in _inputs_cache:
+    return _inputs_cache[func]
+
+  result = StepInputs(set(), set())
+  _inputs_cache[func] = result
+
+  tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+  field_nodes = set()
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Attribute) and _is_paths(node.value.value):
+      group = node.value.attr
+      if group in LAYER_GROUPS:
+        result.layers.add((LAYER_GROUPS[group], node.attr))
+        field_nodes.add(id(node.value))
+      elif group == 'src_dir':
+        result.sources.add(node.attr)
+
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Attribute) and _is_paths(node.value) and node.attr in LAYER_GROUPS:
+      if id(node) not in field_nodes:
+        result.layers.add((LAYER_GROUPS[node.attr], None))
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+      if any(_is_paths(arg) for arg in node.args):
+        callee = func.__globals__.get(node.func.id)
+        if inspect.isfunction(callee) and callee.__module__.startswith('module.'):
+          inner = function_inputs(callee)
+          result.layers.update(inner.layers)
+          result.sources.update(inner.sources)
+
+  return result
+
+def step_outputs(step: Step) -> List[Tuple[str, str]]:
+  if '.' not in step.name:
+    return []
+  group, field = step.name.split('.', 1)
+  return [(group, field), *(tuple(o.split('.', 1)) for o in step.outputs)]
+
+def step_dependencies(steps: List[Step]) -> Dict[str, List[str]]:
+  producers: Dict[Tuple[str, str], str] = {}
+  for step in steps:
+    for output in step_outputs(step):
+      producers[output] = step.name
+
+  deps: Dict[str, List[str]] = {}
+  for step in steps:
+    names = set()
+    for group, field in function_inputs(step.func).layers:
+      if field is None:
+        names.update(name for (g, _), name in producers.items() if g == group)
+      elif (group, field) in producers:
+        names.add(producers[(group, field)])
+    names.discard(step.name)
+    deps[step.name] = [s.name for s in steps if s.name in names]
+  return deps
+
+def dependency_closure(steps: List[Step], names: Iterable[str]) -> Set[str]:
+  deps = step_dependencies(steps)
+  result: Set[str] = set()
+  pending = list(names)
+  while pending:
+    name = pending.pop()
+    if name not in result:
+      result.add(name)
+      pending.extend(deps[name])
+  return result
+
+def dependents(steps: List[Step], name: str) -> Set[str]:
+  deps = step_dependencies(steps)
+  result: Set[str] = set()
+  pending = [name]
+  while pending:
+    current = pending.pop()
+    for step in steps:
+      if current in deps[step.name] and step.name not in result:
+        result.add(step.name)
+        pending.append(step.name)
+  return result
@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+import itertools
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import time
+from typing import Iterator, List, Optional
+
+# set by `enable`
+_run_dir: Optional[Path] = None
+_tail_lines = 0
+
+SUFFIX = '.log.zst'
+FAILED_SUFFIX = '.failed'
+
+def new_run_dir(log_dir: Path) -> Path:
+  """
+  create the log directory of a run, named by its start time, with a counter for runs
+  starting in the same second (created atomically, so concurrent runs never share one)
+  """
+
+  log_dir.mkdir(parents = True, exist_ok = True)
+  name = time.strftime('%Y%m%d-%H%M%S')
+  for n in itertools.count(1):
+    run_dir = log_dir / (name if n == 1 else f'{name}-{n}')
+    try:
+      run_dir.mkdir()
+      return run_dir
+    except FileExistsError:
+      continue
+
+def enable(run_dir: Path, tail_lines: int):
+  """
+  capture the output of each step to `run_dir/<branch>/<arch>/<step>.log.zst`
+  """
+
+  global _run_dir, _tail_lines
+  if shutil.which('zstd') is None:
+    raise Exception('zstd not found, install it or drop --step-logs')
+  _run_dir = run_dir
+  _tail_lines = tail_lines
+
+def enabled() -> bool:
+  return _run_dir is not None
+
+def log_file(branch: str, arch: str, step: str) -> Optional[Path]:
+  if _run_dir is None:
+    return None
+  return _run_dir / branch / arch / f'{step}{SUFFIX}'
+
+def read_log(path: Path) -> str:
+  res = subprocess.run(['zstd', '-q', '-d', '-c', path], capture_output = True, check = True)
+  return res.stdout.decode(errors = 'replace')
+
+def _print_tail(path: Path):
+  lines = read_log(path).splitlines()[-_tail_lines:]
+  print(f'--- last {len(lines)} lines of {path} ---', file = sys.stderr)
+  for line in lines:
+    print(line, file = sys.stderr)
+  print('---', file = sys.stderr)
+
+@contextmanager
+def capture(branch: str, arch: str, step: str) -> Iterator[None]:
+  """
+  send stdout and stderr of this process and its children to the step's log
+
+  a zstd process compresses the output as it comes. on failure, the last lines of the log
+  are printed to the console.
+  """
+
+  path = log_file(branch, arch, step)
+  if path is None:
+    yield
+    return
+
+  path.parent.mkdir(parents = True, exist_ok = True)
+  sys.stdout.flush()
+  sys.stderr.flush()
+  compressor = subprocess.Popen(['zstd', '-q', '-f', '-3', '-o', path], stdin = subprocess.PIPE)
+  saved = [os.dup(1), os.dup(2)]
+  os.dup2(compressor.stdin.fileno(), 1)
+  os.dup2(compressor.stdin.fileno(), 2)
+  compressor.stdin.close()
+
+  def restore():
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for fd, copy in zip((1, 2), saved):
+      os.dup2(copy, fd)
+      os.close(copy)
+    compressor.wait()
+
+  try:
+    yield
+  except BaseException:
+    restore()
+    path.with_name(path.name[:-len(SUFFIX)] + FAILED_SUFFIX).touch()
+    if _tail_lines:
+      _print_tail(path)
+    raise
+  restore()
+
+def list_runs(log_dir: Path, branch: str, arch: str) -> List[str]:
+  """
+  print the runs with step logs of a branch and arch, and return them, oldest first
+  """
+
+  runs = []
+  for run_dir in sorted(log_dir.glob('*')):
+    logs = sorted((run_dir / branch / arch).glob(f'*{SUFFIX}'))
+    if not logs:
+      continue
+    runs.append(run_dir.name)
+    failed = [log.name[:-len(FAILED_SUFFIX)] for log in sorted((run_dir / branch / arch).glob(f'*{FAILED_SUFFIX}'))]
+    size = sum(log.stat().st_size for log in logs)
+    message = f'{run_dir.name}  {branch}/{arch}  {len(logs)} steps, {size // 1024} KiB'
+    if failed:
+      message += f', failed: {", ".join(failed)}'
+    print(message)
+  return runs
+
+def find_log(log_dir: Path, branch: str, arch: str, spec: str) -> Optional[Path]:
+  """
+  the log named by `RUN/STEP`, or by `STEP` in the latest run that has it
+  """
+
+  run, _, step = spec.rpartition('/')
+  if run:
+    path = log_dir / run / branch / arch / f'{step}{SUFFIX}'
+    return path if path.exists() else None
+  for run_dir in sorted(log_dir.glob('*'), reverse = True):
+    path = run_dir / branch / arch / f'{step}{SUFFIX}'
+    if path.exists():
+      return path
+  return None
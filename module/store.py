@@ -0,0 +1,142 @@
+import os
+from pathlib import Path
+import shutil
+from typing import List, Set
+
+from module.path import ProjectPaths
+from module.step import Step, step_outputs
+
+def layer_paths(step: Step, paths: ProjectPaths) -> List[Path]:
+  return [getattr(getattr(paths, f'layer_{group}'), field) for group, field in step_outputs(step)]
+
+def entry_dir(paths: ProjectPaths, fingerprint: str) -> Path:
+  return paths.layer_store / fingerprint
+
+def is_complete(paths: ProjectPaths, fingerprint: str) -> bool:
+  return (entry_dir(paths, fingerprint) / '.complete').exists()
+
+def is_linked(step: Step, paths: ProjectPaths, fingerprint: str) -> bool:
+  entry = entry_dir(paths, fingerprint)
+  for layer in layer_paths(step, paths):
+    if not layer.is_symlink() or layer.resolve() != (entry / layer.name).resolve():
+      return False
+  return True
+
+def link(step: Step, paths: ProjectPaths, fingerprint: str):
+  entry = entry_dir(paths, fingerprint)
+  for layer in layer_paths(step, paths):
+    layer.parent.mkdir(parents = True, exist_ok = True)
+    if layer.is_symlink():
+      layer.unlink()
+    elif layer.exists():
+      shutil.rmtree(layer)
+    os.symlink(os.path.relpath(entry / layer.name, layer.parent), layer)
+
+def prepare(step: Step, paths: ProjectPaths, fingerprint: str):
+  """
+  create an empty store entry for the step's layers and link them in place
+  """
+
+  entry = entry_dir(paths, fingerprint)
+  if entry.exists():
+    shutil.rmtree(entry)
+  for layer in layer_paths(step, paths):
+    (entry / layer.name).mkdir(parents = True)
+  link(step, paths, fingerprint)
+
+def complete(paths: ProjectPaths, fingerprint: str):
+  (entry_dir(paths, fingerprint) / '.complete').touch()
+
+def _template_link(paths: ProjectPaths, template: str) -> Path:
+  return paths.layer_store / 'template' / template
+
+def register_template(paths: ProjectPaths, template: str, fingerprint: str, prefix: str):
+  """
+  record a complete entry of an arch-independent step, and the prefix it was installed to
+  """
+
+  (entry_dir(paths, fingerprint) / '.prefix').write_text(prefix)
+  link = _template_link(paths, template)
+  link.parent.mkdir(parents = True, exist_ok = True)
+  if link.is_symlink():
+    link.unlink()
+  os.symlink(os.path.relpath(entry_dir(paths, fingerprint), link.parent), link)
+
+def has_template(paths: ProjectPaths, template: str) -> bool:
+  link = _template_link(paths, template)
+  return link.is_symlink() and (link / '.complete').exists()
+
+def _rewrite(path: Path, old: bytes, new: bytes):
+  with open(path, 'rb') as f:
+    content = f.read()
+  # binary files (e.g. .qm) are copied as is
+  if b'\0' in content or old not in content:
+    return
+  with open(path, 'wb') as f:
+    f.write(content.replace(old, new))
+
+def retarget(step: Step, paths: ProjectPaths, template: str, fingerprint: str, prefix: str):
+  """
+  create the entry of an arch-independent step from the one built for another arch,
+  moving `usr/local/{triplet}` and rewriting the prefix in text files and symlinks
+  """
+
+  source = _template_link(paths, template).resolve()
+  old_prefix = (source / '.prefix').read_text()
+  old_rel = old_prefix.lstrip('/')
+  new_rel = prefix.lstrip('/')
+
+  entry = entry_dir(paths, fingerprint)
+  temp = entry.with_name(entry.name + '.tmp')
+  if temp.exists():
+    shutil.rmtree(temp)
+  for layer in layer_paths(step, paths):
+    for root, dirs, files in os.walk(source / layer.name):
+      rel = Path(root).relative_to(source).as_posix()
+      if rel == f'{layer.name}/{old_rel}' or rel.startswith(f'{layer.name}/{old_rel}/'):
+        rel = rel.replace(old_rel, new_rel, 1)
+      target_dir = temp / rel
+      target_dir.mkdir(parents = True, exist_ok = True)
+      for name in [*dirs, *files]:
+        item = Path(root) / name
+        if item.is_symlink():
+          os.symlink(os.readlink(item).replace(old_prefix, prefix), target_dir / name)
+        elif name in files:
+          shutil.copy2(item, target_dir / name)
+          _rewrite(target_dir / name, old_prefix.encode(), prefix.encode())
+      dirs[:] = [name for name in dirs if not (Path(root) / name).is_symlink()]
+
+  if entry.exists():
+    shutil.rmtree(entry)
+  os.rename(temp, entry)
+  complete(paths, fingerprint)
+  (entry / '.prefix').write_text(prefix)
+  link(step, paths, fingerprint)
+
+def _linked_entries(layer_dir: Path, store: Path) -> Set[Path]:
+  return {
+    layer.resolve().parent
+    for layer in layer_dir.glob('*/*')
+    if layer.is_symlink() and layer.resolve().parent.parent == store
+  }
+
+def remove_linked(paths: ProjectPaths):
+  """
+  drop store entries the build's layers link to, keeping those other branches or arches
+  link to as well, and the templates of dropped entries
+  """
+
+  if not paths.layer_dir.exists():
+    return
+  store = paths.layer_store.resolve()
+  shared: Set[Path] = set()
+  # layer/<branch>/<arch> of the other builds
+  for layer_dir in paths.layer_dir.parent.parent.glob('*/*'):
+    if layer_dir != paths.layer_dir and layer_dir.parent != paths.layer_store:
+      shared.update(_linked_entries(layer_dir, store))
+  for entry in _linked_entries(paths.layer_dir, store) - shared:
+    if entry.exists():
+      shutil.rmtree(entry)
+  for template in paths.layer_store.glob('template/*'):
+    if template.is_symlink() and not template.exists():
+      template.unlink()
@@ -5,10 +5,12 @@ from packaging.version import Version
 from pathlib import Path
 from shutil import copyfile
 import subprocess
+from typing import List
 
 from module.debug import shell_here
 from module.path import ProjectPaths
 from module.profile import BranchProfile
+from module.step import Step
 from module.util import ensure, merge_libs, overlayfs_ro, pkgconf_remove_flags, toolchain_layers, qt_dependent_layers
 from module.util import cflags_target, configure, make_default, make_destdir_install
 from module.util import cmake_build, cmake_config, cmake_destdir_install, qt_configure_module
@@ -798,58 +800,61 @@ def _appimage_runtime(ver: BranchProfile, paths: ProjectPaths, config: argparse.
     ensure(bin_dir)
     copyfile(build_dir / 'appimage-runtime', bin_dir / 'appimage-runtime')
 
-def build_target_lib(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
+def _qtwayland_merged(ver: BranchProfile, paths: ProjectPaths, config: argparse.Namespace):
+  # merged into qtbase since Qt 6.10, keep an empty layer
+  ensure(paths.layer_target.qtwayland / 'usr/local')
+
+def target_lib_steps(ver: BranchProfile) -> List[Step]:
   v_qt = Version(ver.qt)
 
-  # misc: round 1
-  _expat(ver, paths, config)
-  _ffi(ver, paths, config)
-  _fuse(ver, paths, config)
-  _xml(ver, paths, config)
-  _xcb_proto(ver, paths, config)
-  _xorg_proto(ver, paths, config)
-  _xtrans(ver, paths, config)
-  _z(ver, paths, config)
-  _zstd(ver, paths, config)
-
-  # misc: round 2
-  _dbus(ver, paths, config)
-  _png(ver, paths, config)
-  _squashfuse(ver, paths, config)
-  _wayland(ver, paths, config)
-  _xau(ver, paths, config)
-
-  # misc: round 3
-  _freetype_decycle(ver, paths, config)
-  _xcb(ver, paths, config)
-
-  # misc: round 4
-  _harfbuzz(ver, paths, config)
-  _x(ver, paths, config)
-  _xcb_util(ver, paths, config)
-  _xcb_util_keysyms(ver, paths, config)
-  _xcb_util_renderutil(ver, paths, config)
-  _xcb_util_wm(ver, paths, config)
-  _xkbcommon(ver, paths, config)
-
-  # misc: round 5
-  _freetype(ver, paths, config)
-  _xcb_util_image(ver, paths, config)
-
-  # misc: round 6
-  _fontconfig(ver, paths, config)
-  _xcb_util_cursor(ver, paths, config)
-
-  # target Qt
-  _qtbase(ver, paths, config)
-  _qtsvg(ver, paths, config)
-  _qttools(ver, paths, config)
-  _qttranslations(ver, paths, config)
-  if v_qt < Version('6.10'):
-    _qtwayland(ver, paths, config)
-  else:
-    ensure(paths.layer_target.qtwayland / 'usr/local')
-  _fcitx_qt(ver, paths, config)
-
-  # appimage
-  _appimage_runtime(ver, paths, config)
+  return [
+    # misc: round 1
+    Step('target.expat', _expat),
+    Step('target.ffi', _ffi),
+    Step('target.fuse', _fuse),
+    Step('target.xml', _xml),
+    Step('target.xcb_proto', _xcb_proto, arch_independent = True),
+    Step('target.xorg_proto', _xorg_proto, arch_independent = True),
+    Step('target.xtrans', _xtrans, arch_independent = True),
+    Step('target.z', _z),
+    Step('target.zstd', _zstd),
+
+    # misc: round 2
+    Step('target.dbus', _dbus),
+    Step('target.png', _png),
+    Step('target.squashfuse', _squashfuse),
+    Step('target.wayland', _wayland),
+    Step('target.xau', _xau),
+
+    # misc: round 3
+    Step('target.freetype_decycle', _freetype_decycle),
+    Step('target.xcb', _xcb),
+
+    # misc: round 4
+    Step('target.harfbuzz', _harfbuzz),
+    Step('target.x', _x),
+    Step('target.xcb_util', _xcb_util),
+    Step('target.xcb_util_keysyms', _xcb_util_keysyms),
+    Step('target.xcb_util_renderutil', _xcb_util_renderutil),
+    Step('target.xcb_util_wm', _xcb_util_wm),
+    Step('target.xkbcommon', _xkbcommon),
+
+    # misc: round 5
+    Step('target.freetype', _freetype),
+    Step('target.xcb_util_image', _xcb_util_image),
+
+    # misc: round 6
+    Step('target.fontconfig', _fontconfig),
+    Step('target.xcb_util_cursor', _xcb_util_cursor),
+
+    # target Qt
+    Step('target.qtbase', _qtbase),
+    Step('target.qtsvg', _qtsvg),
+    Step('target.qttools', _qttools),
+    Step('target.qttranslations', _qttranslations, arch_independent = True),
+    Step('target.qtwayland', _qtwayland if v_qt < Version('6.10') else _qtwayland_merged),
+    Step('target.fcitx_qt', _fcitx_qt),
+
+    # appimage
+    Step('target.appimage_runtime', _appimage_runtime),
+  ]
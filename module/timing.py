@@ -0,0 +1,172 @@
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import resource
+import time
+from typing import Dict, Iterator, List, Optional
+
+from module.sampler import SAMPLES_FILE, counter_events, load_samples
+
+# set by `enable`
+_dir: Optional[Path] = None
+# name of the step running in this process, set by `span`
+_step: Optional[str] = None
+
+EVENTS_FILE = 'events.jsonl'
+SUMMARY_FILE = 'timing.json'
+TRACE_FILE = 'trace.json'
+
+def enable(dir: Path):
+  """
+  record spans to `dir`, starting over
+  """
+
+  global _dir
+  _dir = dir
+  _dir.mkdir(parents = True, exist_ok = True)
+  for name in (EVENTS_FILE, SAMPLES_FILE):
+    if (_dir / name).exists():
+      (_dir / name).unlink()
+
+def enabled() -> bool:
+  return _dir is not None
+
+def _append(event: dict):
+  # one short write per line, appends of concurrent step processes do not interleave
+  line = (json.dumps(event) + '\n').encode()
+  fd = os.open(_dir / EVENTS_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+  try:
+    os.write(fd, line)
+  finally:
+    os.close(fd)
+
+@contextmanager
+def span(name: str, category: str = 'phase') -> Iterator[None]:
+  """
+  record wall time, CPU time of waited-for children and their peak RSS over a block
+
+  `category` is 'step' for whole steps (phases inside are attributed to it), 'phase' for
+  tool runs (configure, build, install, merge_libs, package) and 'prepare' for sources.
+  child CPU time is only known for children that were waited for, i.e. tool runs. the
+  kernel only keeps the peak RSS of the largest child so far, so it is known for a span
+  only if a child of the span set a new peak, and None otherwise. steps run in processes
+  of their own when timing (see `run_tasks`), where their first child always does.
+  """
+
+  global _step
+  if _dir is None:
+    yield
+    return
+
+  outer_step = _step
+  if category == 'step':
+    _step = name
+  before = resource.getrusage(resource.RUSAGE_CHILDREN)
+  start = time.time()
+  wall_start = time.monotonic()
+  ok = False
+  try:
+    yield
+    ok = True
+  finally:
+    wall = time.monotonic() - wall_start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    _step = outer_step
+    _append({
+      'name': name,
+      'category': category,
+      'step': _step if category == 'phase' else name,
+      'pid': os.getpid(),
+      'start': start,
+      'wall': wall,
+      'user': after.ru_utime - before.ru_utime,
+      'sys': after.ru_stime - before.ru_stime,
+      'max_rss': after.ru_maxrss * 1024 if after.ru_maxrss > before.ru_maxrss else None,
+      'ok': ok,
+    })
+
+def load_events(dir: Path) -> List[dict]:
+  path = dir / EVENTS_FILE
+  if not path.exists():
+    return []
+  with open(path, 'r') as f:
+    return [json.loads(line) for line in f if line.strip()]
+
+def recorded_events() -> List[dict]:
+  return load_events(_dir) if _dir is not None else []
+
+def summarize(events: List[dict], samples: List[dict] = []) -> Dict[str, dict]:
+  """
+  per step and source preparation: wall and CPU time, peak RSS, CPU utilization, and the
+  time spent in each phase
+
+  with resource samples, also the average number of busy cores of the whole system while
+  the step ran, well below the core count where concurrent steps left cores idle.
+  """
+
+  result: Dict[str, dict] = {}
+  for event in events:
+    if event['category'] != 'phase':
+      cpu = event['user'] + event['sys']
+      result[event['name']] = {
+        'start': event['start'],
+        'wall': event['wall'],
+        'user': event['user'],
+        'sys': event['sys'],
+        'max_rss': event['max_rss'],
+        # average number of busy cores, ~1 for serial steps
+        'cpu_ratio': cpu / event['wall'] if event['wall'] > 0 else 0.0,
+        'ok': event['ok'],
+        'phases': {},
+      }
+      during = [sample['busy_cores'] for sample in samples if event['start'] <= sample['time'] <= event['start'] + event['wall']]
+      if during:
+        result[event['name']]['system_busy_cores'] = sum(during) / len(during)
+  for event in events:
+    if event['category'] == 'phase' and event['step'] in result:
+      phases = result[event['step']]['phases']
+      phases[event['name']] = phases.get(event['name'], 0.0) + event['wall']
+  return result
+
+def chrome_trace(events: List[dict], samples: List[dict] = []) -> dict:
+  """
+  trace events for chrome://tracing and Perfetto, one track per step process, and counter
+  tracks of resource samples
+  """
+
+  origin = min([*(event['start'] for event in events), *(sample['time'] for sample in samples)], default = 0.0)
+  trace = []
+  for event in events:
+    trace.append({
+      'name': event['name'],
+      'cat': event['category'],
+      'ph': 'X',
+      'pid': 1,
+      'tid': event['pid'],
+      'ts': (event['start'] - origin) * 1e6,
+      'dur': event['wall'] * 1e6,
+      'args': {
+        'step': event['step'],
+        'user': round(event['user'], 3),
+        'sys': round(event['sys'], 3),
+        'max_rss': event['max_rss'],
+      },
+    })
+  trace += counter_events(samples, origin)
+  return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+def write_report():
+  """
+  write the summary and the trace of recorded spans
+  """
+
+  if _dir is None:
+    return
+  events = recorded_events()
+  samples = load_samples(_dir)
+  with open(_dir / SUMMARY_FILE, 'w') as f:
+    json.dump({'steps': summarize(events, samples), 'events': events, 'samples': samples}, f, indent = 2)
+  with open(_dir / TRACE_FILE, 'w') as f:
+    json.dump(chrome_trace(events, samples), f)
+  print(f'timing written to {_dir / SUMMARY_FILE}, trace to {_dir / TRACE_FILE}')
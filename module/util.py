@@ -1,12 +1,18 @@
 from contextlib import contextmanager
+import ctypes
 import logging
 import os
 from pathlib import Path
 import subprocess
 from typing import Dict, List, Optional, Union
 
+from module import autoconf_cache, ccache, cmake_cache, timing
 from module.path import ProjectPaths
 from module.profile import ProfileInfo
+from module.step import Step, step_outputs
+
+# layers only other steps build with, not part of the package
+INTERMEDIATE_LAYERS = ('stub', 'freetype_decycle', 'binutils_multi')
 
 def cflags_host(
   suffix: str = '',
@@ -44,15 +50,18 @@ def cflags_target(
   ]
 
 def cmake_build(build_dir: Path, jobs: int):
-  cmake_custom(['--build', build_dir, '--parallel', str(jobs)])
+  with timing.span('build'):
+    cmake_custom(['--build', build_dir, '--parallel', str(jobs)])
 
 def cmake_config(source_dir: Path, build_dir: Path, args: List[str]):
-  cmake_custom([
-    '-S', source_dir,
-    '-B', build_dir,
-    '-DCMAKE_BUILD_TYPE=Release',
-    *args,
-  ])
+  with timing.span('configure'):
+    cmake_custom([
+      '-S', source_dir,
+      '-B', build_dir,
+      '-DCMAKE_BUILD_TYPE=Release',
+      *ccache.cmake_args(),
+      *args,
+    ])
 
 def cmake_custom(args: List[str], env: Dict[str, str] = {}):
   subprocess.run(
@@ -62,27 +71,42 @@ def cmake_custom(args: List[str], env: Dict[str, str] = {}):
   )
 
 def cmake_destdir_install(build_dir: Path, destdir: Path):
-  cmake_custom(['--install', build_dir, '--strip'], env = {'DESTDIR': destdir})
+  with timing.span('install'):
+    cmake_custom(['--install', build_dir, '--strip'], env = {'DESTDIR': destdir})
 
 def cmake_install(build_dir: Path):
-  cmake_custom(['--install', build_dir, '--strip'])
+  with timing.span('install'):
+    cmake_custom(['--install', build_dir, '--strip'])
 
-def configure(cwd: Path, args: List[str]):
-  subprocess.run(
-    ['../configure', *args],
-    cwd = cwd,
-    check = True,
-  )
+def configure(cwd: Path, args: List[str], script: Union[Path, str] = '../configure'):
+  qt = cmake_cache.is_qt_configure(cwd)
+  if qt:
+    args = [*args, *cmake_cache.configure_args()]
+  else:
+    args = [*args, *autoconf_cache.configure_args(cwd, args)]
+  with timing.span('configure'):
+    subprocess.run(
+      [script, *args],
+      cwd = cwd,
+      env = {**os.environ, **ccache.configure_env(cwd, args)},
+      check = True,
+    )
+  if qt:
+    cmake_cache.capture(cwd)
+  else:
+    autoconf_cache.merge(cwd, args)
 
 def ensure(path: Path):
   path.mkdir(parents = True, exist_ok = True)
 
 def make_custom(cwd: Path, extra_args: List[str], jobs: int):
-  subprocess.run(
-    ['make', *extra_args, f'-j{jobs}'],
-    cwd = cwd,
-    check = True,
-  )
+  installing = any(arg.startswith('install') or arg.endswith('_install') for arg in extra_args)
+  with timing.span('install' if installing else 'build'):
+    subprocess.run(
+      ['make', *extra_args, f'-j{jobs}'],
+      cwd = cwd,
+      check = True,
+    )
 
 def make_default(cwd: Path, jobs: int):
   make_custom(cwd, [], jobs)
@@ -103,50 +127,56 @@ def merge_libs(triplet: str, merged: Path, libs: List[Union[Path, str]]):
     input += f'addlib {lib}\n'
   input += 'save\nend\n'
 
-  subprocess.run(
-    [f'{triplet}-gcc-ar', '-M'],
-    input = input.encode(),
-    check = True,
-  )
+  with timing.span('merge_libs'):
+    subprocess.run(
+      [f'{triplet}-gcc-ar', '-M'],
+      input = input.encode(),
+      check = True,
+    )
 
 def meson_build(
   build_dir: str,
   jobs: int,
   targets: List[str] = [],
 ):
-  subprocess.run(
-    ['meson', 'compile', '-C', build_dir, f'-j{jobs}', *targets],
-    check = True,
-  )
+  with timing.span('build'):
+    subprocess.run(
+      ['meson', 'compile', '-C', build_dir, f'-j{jobs}', *targets],
+      check = True,
+    )
 
 def meson_config(
   source_dir: Path,
   build_dir: str,
   extra_args: List[str],
 ):
-  subprocess.run(
-    [
-      'meson',
-      'setup',
-      '--default-library', 'static',
-      '--prefer-static',
-      '--buildtype', 'release',
-      '--strip',
-      *extra_args,
-      build_dir
-    ],
-    cwd = source_dir,
-    check = True,
-  )
+  with timing.span('configure'):
+    subprocess.run(
+      [
+        'meson',
+        'setup',
+        '--default-library', 'static',
+        '--prefer-static',
+        '--buildtype', 'release',
+        '--strip',
+        *extra_args,
+        *ccache.meson_args(extra_args),
+        build_dir
+      ],
+      cwd = source_dir,
+      env = {**os.environ, **ccache.meson_env()},
+      check = True,
+    )
 
 def meson_destdir_install(
   build_dir: str,
   destdir: Path,
 ):
-  subprocess.run(
-    ['meson', 'install', '-C', build_dir, '--destdir', destdir],
-    check = True,
-  )
+  with timing.span('install'):
+    subprocess.run(
+      ['meson', 'install', '-C', build_dir, '--destdir', destdir],
+      check = True,
+    )
 
 @contextmanager
 def overlayfs_ro(merged: Union[Path, str], lower: list[Path]):
@@ -172,6 +202,19 @@ def overlayfs_ro(merged: Union[Path, str], lower: list[Path]):
   finally:
     subprocess.run(['umount', merged], check = False)
 
+def package_layers(paths: ProjectPaths, steps: List[Step]) -> List[Path]:
+  """
+  layers the package is made of: those some step of the build produces, without intermediates
+  """
+
+  produced = {output for step in steps for output in step_outputs(step)}
+  layers = []
+  for group, layer_group in (('host', paths.layer_host), ('x', paths.layer_x), ('target', paths.layer_target)):
+    for k, v in layer_group._asdict().items():
+      if (group, k) in produced and k not in INTERMEDIATE_LAYERS:
+        layers.append(v)
+  return layers
+
 def pkgconf_remove_flags(pc: Path, keyword: str, flags: List[str]):
   lines = open(pc, 'r').readlines()
   result = []
@@ -184,16 +227,35 @@ def pkgconf_remove_flags(pc: Path, keyword: str, flags: List[str]):
   with open(pc, 'w') as f:
     f.writelines(result)
 
+def private_mount_namespace():
+  """
+  detach the calling process from the shared mount table, so that concurrent steps
+  can each mount their own layers on /usr/local
+  """
+
+  CLONE_NEWNS = 0x00020000
+  if hasattr(os, 'unshare'):
+    os.unshare(CLONE_NEWNS)
+  else:
+    libc = ctypes.CDLL(None, use_errno = True)
+    if libc.unshare(CLONE_NEWNS) != 0:
+      errno = ctypes.get_errno()
+      raise OSError(errno, os.strerror(errno))
+  subprocess.run(['mount', '--make-rprivate', '/'], check = True)
+
 def qt_configure_module(source_dir: Path, build_dir: Path, args: List[str], triplet: Optional[str] = None):
   qt_configure_module = 'qt-configure-module'
   if triplet:
     qt_configure_module = f'/usr/local/{triplet}/bin/qt-configure-module'
 
-  subprocess.run(
-    [qt_configure_module, source_dir, *args],
-    cwd = build_dir,
-    check = True,
-  )
+  with timing.span('configure'):
+    subprocess.run(
+      [qt_configure_module, source_dir, *args, *cmake_cache.configure_args()],
+      cwd = build_dir,
+      env = {**os.environ, **ccache.cmake_launcher_env()},
+      check = True,
+    )
+  cmake_cache.capture(build_dir)
 
 def qt_dependent_layers(paths: ProjectPaths):
   return [
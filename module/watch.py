@@ -0,0 +1,111 @@
+import argparse
+from copy import copy
+import logging
+from pathlib import Path
+import shutil
+import time
+from typing import Callable, Dict, List, Tuple
+
+from module import metrics
+from module.fingerprint import source_fingerprint
+from module.prepare_source import prepare_source
+from module.runner import Build, Task, make_tasks, needed_sources, run_tasks
+from module.step import function_inputs
+
+WATCH_INTERVAL = 2.0
+
+def _snapshot(roots: List[Path]) -> Dict[Path, Tuple[int, int]]:
+  result = {}
+  for root in roots:
+    for path in root.glob('**/*'):
+      if path.is_file():
+        stat = path.stat()
+        result[path] = (stat.st_mtime_ns, stat.st_size)
+  return result
+
+def _source_fingerprints(build: Build) -> Dict[str, str]:
+  names = set()
+  for step in build.steps:
+    names.update(function_inputs(step.func).sources)
+  return {name: source_fingerprint(name, build.ver, build.paths) for name in sorted(names)}
+
+def _reset_sources(before: Dict[str, str], build: Build) -> Dict[str, str]:
+  """
+  drop trees whose patches changed, `prepare_source` extracts and patches them again
+  """
+
+  after = _source_fingerprints(build)
+  for name, fingerprint in after.items():
+    if before.get(name) != fingerprint:
+      logging.info('Source %s changed, extracting again' % name)
+      for tree in (getattr(build.paths.src_shared, name), getattr(build.paths.src_dir, name)):
+        if tree.exists():
+          shutil.rmtree(tree)
+  return after
+
+def _report_changes(files: List[Path], old: Build, new: Build):
+  changed = [step.name for step in new.steps if old.fingerprints.get(step.name) != new.fingerprints[step.name]]
+  print(f'{new.ver.branch}/{new.ver.arch}: {", ".join(str(f.relative_to(new.paths.root_dir)) for f in files)} changed, {len(changed)} steps affected')
+  for name in changed:
+    print(f'  {name}')
+
+def _changed_tasks(builds: List[Build], config: argparse.Namespace) -> List[Task]:
+  """
+  the steps whose fingerprint changed, within the --package closure. --package forces its
+  steps, which only the first round should do
+  """
+
+  return [task._replace(forced = False) for task in make_tasks(builds, config) if not task.build.is_done(task.step)]
+
+def watch(builds: List[Build], make_builds: Callable[[argparse.Namespace], List[Build]], config: argparse.Namespace):
+  """
+  rebuild the steps affected by changes to patch/ and support/, until interrupted
+
+  watched files are part of step fingerprints (see `step_fingerprints`), so reloading the
+  builds finds the steps consuming a changed file, and their dependents, as not done.
+  """
+
+  # later rounds only rebuild what changed
+  config = copy(config)
+  config.only = None
+  config.from_step = None
+
+  paths = builds[0].paths
+  roots = [paths.patch_dir, paths.root_dir / 'support']
+  snapshot = _snapshot(roots)
+  sources = [_source_fingerprints(build) for build in builds]
+  print(f'Watching {", ".join(str(root.relative_to(paths.root_dir)) for root in roots)} for changes')
+
+  while True:
+    time.sleep(WATCH_INTERVAL)
+    current = _snapshot(roots)
+    if current == snapshot:
+      continue
+    # let editors finish writing
+    while True:
+      time.sleep(WATCH_INTERVAL)
+      settled = _snapshot(roots)
+      if settled == current:
+        break
+      current = settled
+
+    files = sorted(path for path in {*snapshot, *current} if snapshot.get(path) != current.get(path))
+    snapshot = current
+
+    new_builds = make_builds(config)
+    for old, new in zip(builds, new_builds):
+      _report_changes(files, old, new)
+    sources = [_reset_sources(before, build) for before, build in zip(sources, new_builds)]
+    builds = new_builds
+
+    try:
+      tasks = _changed_tasks(builds, config)
+      for build in builds:
+        prepare_source(build.ver, build.paths, False, needed_sources(tasks, build))
+      run_tasks(tasks, config)
+      print('Rebuild done, watching for changes')
+    except Exception as e:
+      logging.critical('Rebuild failed: %s' % e)
+      print('Rebuild failed, watching for changes')
+    finally:
+      metrics.save()
@@ -0,0 +1,82 @@
+import argparse
+from datetime import timedelta
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from module.makespan import Node, critical_path, makespan
+from module.runner import Build, Task, interleave, task_graph
+from module.timing import SUMMARY_FILE
+
+# steps shown in the speedup ranking
+TOP_STEPS = 10
+# speedup assumed for each step in the ranking
+SPEEDUP = 2.0
+
+def _format_duration(seconds: float) -> str:
+  return str(timedelta(seconds = round(seconds)))
+
+def _cpu_ratios(timing_dir: Optional[Path]) -> Dict[str, float]:
+  if timing_dir is None or not (timing_dir / SUMMARY_FILE).exists():
+    return {}
+  with open(timing_dir / SUMMARY_FILE, 'r') as f:
+    steps = json.load(f)['steps']
+  return {name: max(1.0, step['cpu_ratio']) for name, step in steps.items()}
+
+def make_nodes(tasks: List[Task], timing_dir: Optional[Path]) -> Tuple[List[Node], int]:
+  """
+  the task graph with recorded durations, and the number of tasks without one
+
+  tasks linking a layer built by another build take no time, as in `run_tasks`.
+  """
+
+  task_deps, duplicates = task_graph(tasks)
+  ratios = _cpu_ratios(timing_dir)
+  nodes = []
+  unknown = 0
+  for i, task in enumerate(tasks):
+    duration = task.build.journal.duration(task.step.name)
+    if i in duplicates:
+      duration = 0.0
+    elif duration is None:
+      unknown += 1
+      duration = 0.0
+    nodes.append(Node(task.name, duration, ratios.get(task.name, 1.0), task_deps[i]))
+  return nodes, unknown
+
+def report_what_if(builds: List[Build], config: argparse.Namespace):
+  """
+  simulate a build of every step, whether done or not, so that a finished build can be analyzed
+  """
+
+  cores = config.cores or config.jobs
+  concurrency = max(1, config.parallel_steps)
+  tasks = interleave(builds, [[(step, False) for step in build.steps] for build in builds])
+  nodes, unknown = make_nodes(tasks, config.timing)
+
+  length, path = critical_path(nodes)
+  print(f'critical path ({_format_duration(length)}):')
+  for i in path:
+    if nodes[i].duration:
+      print(f'  {nodes[i].name:48} {_format_duration(nodes[i].duration):>10}')
+
+  base = makespan(nodes, cores, concurrency)
+  total = sum(node.duration for node in nodes)
+  print(f'makespan with {cores} cores, {concurrency} concurrent steps: {_format_duration(base)} (sum of steps {_format_duration(total)}, critical path {_format_duration(length)})')
+
+  gains = []
+  for i, node in enumerate(nodes):
+    if node.duration:
+      faster = [*nodes[:i], node._replace(duration = node.duration / SPEEDUP), *nodes[i + 1:]]
+      gains.append((base - makespan(faster, cores, concurrency), i))
+  gains.sort(key = lambda gain: -gain[0])
+  print(f'steps whose {SPEEDUP:g}x speedup shortens the build most:')
+  for gain, i in gains[:TOP_STEPS]:
+    if gain <= 0:
+      break
+    print(f'  {nodes[i].name:48} {"-" + _format_duration(gain):>10}')
+
+  if unknown:
+    print(f'{unknown} steps without recorded duration are counted as 0')
+  if not config.timing:
+    print('steps are assumed serial, pass --timing DIR of a recorded run for their CPU utilization')
@@ -0,0 +1,94 @@
+import logging
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import threading
+from typing import Iterable, Optional
+
+from module.path import ProjectPaths
+
+def mount_tmpfs(root: Path, size: str):
+  """
+  back the build root with RAM, limited to `size` (as accepted by tmpfs, e.g. `48G`)
+
+  an existing tmpfs is kept, so that a failed build resumes with its trees in place.
+  """
+
+  root.mkdir(parents = True, exist_ok = True)
+  if os.path.ismount(root):
+    subprocess.run(['mount', '-o', f'remount,size={size}', root], check = True)
+    return
+  if any(root.iterdir()):
+    logging.warning('%s is not empty, its content is hidden by the tmpfs' % root)
+  subprocess.run(['mount', '-t', 'tmpfs', '-o', f'size={size}', 'tmpfs', root], check = True)
+  logging.info('Mounted tmpfs on %s (%s)' % (root, size))
+
+def release(tree: Path, paths: ProjectPaths, spill_dir: Optional[Path]):
+  """
+  take a source tree (with its build dirs) off the build root, moved to `spill_dir` if given
+  """
+
+  if not tree.exists():
+    return
+  if spill_dir is None:
+    logging.info('Freeing %s' % tree)
+    shutil.rmtree(tree)
+    return
+  target = spill_dir / tree.relative_to(paths.build_root)
+  logging.info('Spilling %s to %s' % (tree, target))
+  if target.exists():
+    shutil.rmtree(target)
+  target.parent.mkdir(parents = True, exist_ok = True)
+  shutil.move(str(tree), str(target))
+
+def release_sources(names: Iterable[str], paths: ProjectPaths, spill_dir: Optional[Path], shared: bool):
+  for name in names:
+    release(getattr(paths.src_dir, name), paths, spill_dir)
+    if shared:
+      # the pristine tree is not needed once its clones are gone
+      release(getattr(paths.src_shared, name), paths, None)
+
+def format_size(size: int) -> str:
+  value = float(size)
+  for unit in ['B', 'KiB', 'MiB', 'GiB']:
+    if abs(value) < 1024:
+      return f'{value:.1f} {unit}'
+    value /= 1024
+  return f'{value:.1f} TiB'
+
+class DiskMonitor:
+  """
+  sample the used space of the build root's filesystem in the background, keeping the peak
+  """
+
+  root: Path
+  interval: float
+  start_used: int
+  peak_used: int
+
+  def __init__(self, root: Path, interval: float = 2.0):
+    self.root = root
+    self.interval = interval
+    self.start_used = shutil.disk_usage(root).used
+    self.peak_used = self.start_used
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target = self._run, daemon = True)
+
+  def sample(self):
+    self.peak_used = max(self.peak_used, shutil.disk_usage(self.root).used)
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      self.sample()
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    self._thread.join()
+    self.sample()
+
+  def report(self):
+    print(f'peak disk usage on {self.root}: {format_size(self.peak_used)} ({format_size(self.peak_used - self.start_used)} above start)')
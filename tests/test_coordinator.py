@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+import subprocess
+import sys
+from typing import List
+
+def _start(cwd: Path, args: List[str]) -> subprocess.Popen:
+  return subprocess.Popen(
+    [sys.executable, '-u', 'main.py', *args],
+    cwd = cwd,
+    stdout = subprocess.PIPE,
+    stderr = subprocess.STDOUT,
+    text = True,
+  )
+
+def _run(tmp_path: Path, coordinator_dir: Path, coordinator_args: List[str], workers: List[Path]) -> subprocess.CompletedProcess:
+  coordinator = _start(coordinator_dir, [
+    '-a', 'x86_64', '--simulate', '--simulate-duration', '0',
+    '--build-root', str(tmp_path / 'build-coordinator'),
+    '--coordinator', '127.0.0.1:0',
+    *coordinator_args,
+  ])
+  line = coordinator.stdout.readline()
+  assert line.startswith('Coordinator listening on'), line
+  port = line.strip().rsplit(':', 1)[1]
+
+  processes = [
+    _start(worker, ['--worker', f'127.0.0.1:{port}', '--build-root', str(tmp_path / f'build-{worker.name}')])
+    for worker in workers
+  ]
+  output, _ = coordinator.communicate(timeout = 300)
+  for process in processes:
+    worker_output, _ = process.communicate(timeout = 60)
+    # a failed task does not end the worker, the coordinator does
+    assert process.returncode == 0, worker_output
+    assert 'Coordinator closed the connection' in worker_output
+  return subprocess.CompletedProcess(coordinator.args, coordinator.returncode, output)
+
+def test_two_workers(tmp_path, checkout):
+  workers = [checkout('worker-1'), checkout('worker-2')]
+  result = _run(tmp_path, checkout('coordinator'), [], workers)
+  assert result.returncode == 0, result.stdout
+
+  coordinator = tmp_path / 'coordinator' / 'simulate' / 'layer'
+  journal = json.loads((coordinator / 'main' / 'x86_64' / 'journal.json').read_text())
+  assert journal and all(entry['done'] for entry in journal.values())
+
+  # every layer was built on a worker and collected into the coordinator's store
+  built = {entry.name for worker in workers for entry in (worker / 'simulate' / 'layer' / 'store').iterdir() if (entry / '.complete').exists()}
+  collected = {entry.name for entry in (coordinator / 'store').iterdir() if (entry / '.complete').exists()}
+  assert collected and collected <= built
+  linked = [layer for layer in (coordinator / 'main' / 'x86_64').glob('*/*') if layer.is_symlink()]
+  assert linked
+  for layer in linked:
+    assert (layer / 'usr' / 'local' / 'share' / 'simulate' / layer.name).exists()
+
+  # dependency layers were shipped to workers as blobs
+  assert any((coordinator / 'cache' / 'blob').iterdir())
+
+def test_failed_task(tmp_path, checkout):
+  worker = checkout('worker')
+  # different support files, so the worker computes a different fingerprint
+  for cross_file in (worker / 'support' / 'cmake').iterdir():
+    cross_file.write_text(cross_file.read_text() + '\n# changed\n')
+  result = _run(tmp_path, checkout('coordinator'), ['--only', 'x.cmake'], [worker])
+
+  assert result.returncode != 0
+  assert 'failed on' in result.stdout
+  assert 'failed steps: main/x86_64:x.cmake' in result.stdout
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from module import disk_usage
+
+@pytest.fixture(autouse = True)
+def _fresh_state(monkeypatch):
+  monkeypatch.setattr(disk_usage, '_trees', {})
+  monkeypatch.setattr(disk_usage, '_labels', {})
+  monkeypatch.setattr(disk_usage, '_peak_total', 0)
+  monkeypatch.setattr(disk_usage, '_peak_sizes', {})
+
+def _write(path, size: int):
+  path.parent.mkdir(parents = True, exist_ok = True)
+  path.write_bytes(os.urandom(size))
+
+def test_tree_size_counts_hard_links_once(tmp_path):
+  _write(tmp_path / 'tree' / 'a', 10000)
+  os.link(tmp_path / 'tree' / 'a', tmp_path / 'tree' / 'b')
+  _write(tmp_path / 'tree' / 'sub' / 'c', 5000)
+  apparent, allocated = disk_usage.tree_size(tmp_path / 'tree')
+  assert apparent == 15000 + os.lstat(tmp_path / 'tree' / 'sub').st_size
+  assert allocated >= 15000
+
+def test_tree_size_of_missing_path_and_file(tmp_path):
+  assert disk_usage.tree_size(tmp_path / 'missing') == (0, 0)
+  _write(tmp_path / 'file', 1234)
+  assert disk_usage.tree_size(tmp_path / 'file')[0] == 1234
+
+def test_clones_only_count_what_they_add(tmp_path):
+  source = tmp_path / 'source'
+  _write(source / 'big', 1 << 20)
+  clone = tmp_path / 'clone'
+  clone.mkdir()
+  os.link(source / 'big', clone / 'big')
+  _write(clone / 'generated', 1 << 16)
+
+  # measured in separate passes, as steps of different arches are
+  disk_usage.account({source: ''})
+  disk_usage.account({clone: 'clone'})
+
+  source_size = disk_usage.tree_size(source)[1]
+  generated = disk_usage.tree_size(clone / 'generated')[1]
+  assert disk_usage._peak_total == source_size + generated
+  assert disk_usage._peak_sizes[source][1] == source_size
+  # the clone's full size is still what the journal records
+  assert disk_usage.allocated(clone) == disk_usage.tree_size(clone)[1]
+
+def test_removed_trees_are_forgotten(tmp_path):
+  _write(tmp_path / 'a' / 'file', 1 << 16)
+  _write(tmp_path / 'b' / 'file', 1 << 16)
+  disk_usage.account({tmp_path / 'a': ''})
+  peak = disk_usage._peak_total
+  (tmp_path / 'a' / 'file').unlink()
+  (tmp_path / 'a').rmdir()
+  disk_usage.account({tmp_path / 'b': ''})
+  assert disk_usage.allocated(tmp_path / 'a') == 0
+  # b replaced a, the peak did not grow
+  assert disk_usage._peak_total == peak
+
+def test_files_removed_while_walking(tmp_path, monkeypatch):
+  _write(tmp_path / 'tree' / 'kept', 1000)
+  walk = os.walk
+
+  def racing_walk(path):
+    for root, dirs, files in walk(path):
+      # listed, then deleted by a concurrent step before it is measured
+      yield root, dirs, files + ['conftest.c']
+
+  monkeypatch.setattr(disk_usage.os, 'walk', racing_walk)
+  assert disk_usage.tree_size(tmp_path / 'tree')[0] == 1000
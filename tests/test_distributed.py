@@ -0,0 +1,69 @@
+import socket
+import threading
+
+from module.distributed import pack_entry, parse_address, recv_message, send_message, unpack_entry
+
+def test_parse_address():
+  assert parse_address('7777') == ('0.0.0.0', 7777)
+  assert parse_address(':7777') == ('0.0.0.0', 7777)
+  assert parse_address('build-1:7777') == ('build-1', 7777)
+
+def test_message_without_blob():
+  a, b = socket.socketpair()
+  with a, b:
+    send_message(a, {'type': 'need', 'need': ['abc']})
+    header, blob = recv_message(b)
+  assert header == {'type': 'need', 'need': ['abc'], 'blob': 0}
+  assert blob is None
+
+def test_message_with_blob(tmp_path):
+  payload = bytes(range(256)) * 8192
+  source = tmp_path / 'source.tar.gz'
+  source.write_bytes(payload)
+  received = tmp_path / 'received'
+  received.mkdir()
+
+  a, b = socket.socketpair()
+  with a, b:
+    # larger than the socket buffer, so send from another thread
+    sender = threading.Thread(target = lambda: (send_message(a, {'type': 'done'}, source), send_message(a, {'type': 'next'})))
+    sender.start()
+    header, blob = recv_message(b, received)
+    following, _ = recv_message(b)
+    sender.join()
+
+  assert header == {'type': 'done', 'blob': len(payload)}
+  assert blob.parent == received
+  assert blob.read_bytes() == payload
+  # the payload ends where the next message starts
+  assert following['type'] == 'next'
+
+def test_closed_connection():
+  a, b = socket.socketpair()
+  with b:
+    a.sendall(b'\0\0')
+    a.close()
+    try:
+      recv_message(b)
+    except ConnectionError:
+      return
+  raise AssertionError('expected ConnectionError')
+
+def test_entry_round_trip(tmp_path):
+  entry = tmp_path / 'store' / 'fingerprint'
+  (entry / 'layer' / 'usr' / 'local' / 'bin').mkdir(parents = True)
+  (entry / 'layer' / 'usr' / 'local' / 'bin' / 'tool').write_text('#!/bin/sh\n')
+  (entry / 'layer' / 'usr' / 'local' / 'bin' / 'alias').symlink_to('tool')
+  (entry / '.complete').touch()
+
+  blob = tmp_path / 'entry.tar.gz'
+  pack_entry(entry, blob)
+  target = tmp_path / 'other' / 'fingerprint'
+  target.mkdir(parents = True)
+  (target / 'stale').touch()
+  unpack_entry(blob, target)
+
+  assert (target / 'layer' / 'usr' / 'local' / 'bin' / 'tool').read_text() == '#!/bin/sh\n'
+  assert (target / 'layer' / 'usr' / 'local' / 'bin' / 'alias').readlink().as_posix() == 'tool'
+  assert (target / '.complete').exists()
+  assert not (target / 'stale').exists()
@@ -0,0 +1,42 @@
+from module.makespan import Node, critical_path, makespan
+
+def _node(name: str, duration: float, deps = [], cpu_ratio: float = 1.0) -> Node:
+  return Node(name, duration, cpu_ratio, list(deps))
+
+def test_critical_path_follows_longest_chain():
+  nodes = [
+    _node('a', 10),
+    _node('b', 5, [0]),
+    _node('c', 30),
+    _node('d', 1, [1, 2]),
+  ]
+  length, path = critical_path(nodes)
+  assert length == 31
+  assert path == [2, 3]
+
+def test_critical_path_empty():
+  assert critical_path([]) == (0.0, [])
+
+def test_makespan_serial_and_parallel():
+  nodes = [_node('a', 10), _node('b', 20), _node('c', 5, [0, 1])]
+  # one at a time: the sum
+  assert makespan(nodes, cores = 8, concurrency = 1) == 35
+  # a and b together, then c
+  assert makespan(nodes, cores = 8, concurrency = 2) == 25
+
+def test_makespan_equals_critical_path_without_limits():
+  nodes = [_node('a', 3), _node('b', 4, [0]), _node('c', 2), _node('d', 6, [2]), _node('e', 1, [1, 3])]
+  assert makespan(nodes, cores = 64, concurrency = 64) == critical_path(nodes)[0]
+
+def test_makespan_skips_shared_steps():
+  nodes = [_node('a', 10), _node('a-linked', 0.0, [0]), _node('b', 5, [1])]
+  assert makespan(nodes, cores = 4, concurrency = 2) == 15
+
+def test_makespan_scales_parallel_steps_with_cores():
+  # kept 8 cores busy for 100s: with 2 cores per step, 400s
+  nodes = [_node('a', 100, cpu_ratio = 8), _node('b', 100, cpu_ratio = 8)]
+  assert makespan(nodes, cores = 4, concurrency = 2) == 400
+  assert makespan(nodes, cores = 16, concurrency = 2) == 100
+
+def test_makespan_empty():
+  assert makespan([], cores = 4, concurrency = 2) == 0.0
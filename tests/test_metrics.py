@@ -0,0 +1,22 @@
+from module.metrics import _regressed
+
+def test_regression_against_median():
+  # median 100, 30% slower and 30s more
+  assert _regressed(130.0, [90.0, 100.0, 400.0], threshold = 0.2, min_delta = 10.0) == 100.0
+
+def test_within_threshold():
+  assert _regressed(115.0, [100.0, 100.0, 100.0], threshold = 0.2, min_delta = 10.0) is None
+
+def test_small_absolute_change_is_noise():
+  # 50% slower, but only 2 seconds
+  assert _regressed(6.0, [4.0], threshold = 0.2, min_delta = 10.0) is None
+
+def test_faster_is_not_a_regression():
+  assert _regressed(50.0, [100.0], threshold = 0.2, min_delta = 10.0) is None
+
+def test_missing_values():
+  assert _regressed(None, [100.0], threshold = 0.2, min_delta = 10.0) is None
+  assert _regressed(100.0, [], threshold = 0.2, min_delta = 10.0) is None
+  # runs without --timing have no peak RSS
+  assert _regressed(100.0, [None, None], threshold = 0.2, min_delta = 10.0) is None
+  assert _regressed(200.0, [None, 100.0], threshold = 0.2, min_delta = 10.0) == 100.0
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from module import progress as progress_module
+from module.progress import Progress
+
+class _Clock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def time(self) -> float:
+    return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = _Clock()
+  monkeypatch.setattr(progress_module, 'time', clock)
+  return clock
+
+def _chain(expected, status_file = None) -> Progress:
+  # each step depends on the one before
+  names = [f'step{i}' for i in range(len(expected))]
+  deps = [[i - 1] if i else [] for i in range(len(expected))]
+  return Progress(names, deps, expected, cores = 4, concurrency = 1, status_file = status_file)
+
+def test_eta_from_recorded_durations(clock):
+  assert _chain([10.0, 20.0, 30.0]).eta() == 60.0
+
+def test_unknown_and_shared_steps_take_no_time(clock):
+  assert _chain([10.0, None, 30.0]).eta() == 40.0
+
+def test_running_step_counts_its_remaining_time(clock):
+  progress = _chain([10.0, 20.0])
+  progress.start(0)
+  clock.now += 4
+  assert progress.eta() == 26.0
+  # overdue steps are expected to finish any moment
+  clock.now += 20
+  assert progress.eta() == 20.0
+
+def test_eta_follows_the_pace_of_the_run(clock, capsys):
+  progress = _chain([10.0, 20.0, 30.0])
+  progress.start(0)
+  clock.now += 15
+  progress.finish(0, 15.0)
+  assert progress.factor() == 1.5
+  assert progress.eta() == 75.0
+  assert 'step0 0:00:15, ETA 0:01:15' in capsys.readouterr().out
+
+def test_reused_steps_do_not_change_the_pace(clock):
+  progress = _chain([10.0, 20.0])
+  progress.reuse(0)
+  assert progress.factor() == 1.0
+  assert progress.eta() == 20.0
+
+def test_status_file(clock, tmp_path):
+  status_file = tmp_path / 'status.json'
+  progress = _chain([10.0, 20.0, 30.0], status_file)
+  progress.start(0)
+  clock.now += 10
+  progress.finish(0, 10.0)
+  progress.start(1)
+  status = json.loads(status_file.read_text())
+  assert status['total'] == 3
+  assert [step['name'] for step in status['done']] == ['step0']
+  assert [step['name'] for step in status['running']] == ['step1']
+  assert status['pending'] == ['step2']
+  assert status['eta'] == 50.0
+  assert status['finish'] == clock.now + 50.0
+  progress.fail(1)
+  assert json.loads(status_file.read_text())['failed'] == ['step1']
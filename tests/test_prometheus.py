@@ -0,0 +1,61 @@
+import pytest
+
+from module import prometheus
+
+@pytest.fixture(autouse = True)
+def _fresh_state(monkeypatch):
+  for name in ['_steps', '_packages', '_layer_hits', '_layer_misses', '_download_hits', '_download_misses', '_download_bytes', '_download_seconds']:
+    monkeypatch.setattr(prometheus, name, {})
+  monkeypatch.setattr(prometheus, '_ccache_before', None)
+  monkeypatch.setattr(prometheus, '_file', None)
+
+def test_label_escaping():
+  assert prometheus._escape('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+  assert prometheus._escape_help('a\\b"c\nd') == 'a\\\\b"c\\nd'
+
+def test_family_format():
+  metrics = prometheus._Exposition()
+  metrics.family('layer_cache_hits_total', 'counter', 'Layers linked\nfrom the store', {
+    prometheus._labels(branch = 'main', arch = 'x86_64'): 3,
+    prometheus._labels(branch = 'main', arch = 'aarch64'): 1,
+  })
+  metrics.family('empty', 'gauge', 'Left out', {})
+  metrics.family('run_duration_seconds', 'gauge', 'Wall time', {(): 1.5})
+  assert metrics.text() == (
+    '# HELP redpanda_build_layer_cache_hits_total Layers linked\\nfrom the store\n'
+    '# TYPE redpanda_build_layer_cache_hits_total counter\n'
+    'redpanda_build_layer_cache_hits_total{branch="main",arch="aarch64"} 1\n'
+    'redpanda_build_layer_cache_hits_total{branch="main",arch="x86_64"} 3\n'
+    '# HELP redpanda_build_run_duration_seconds Wall time\n'
+    '# TYPE redpanda_build_run_duration_seconds gauge\n'
+    'redpanda_build_run_duration_seconds 1.5\n'
+  )
+
+def test_textfile_from_events(monkeypatch, tmp_path):
+  textfile = tmp_path / 'redpanda_build.prom'
+  monkeypatch.setattr(prometheus, '_file', textfile)
+  prometheus._on_layer_installed(branch = 'main', arch = 'x86_64', reused = True)
+  prometheus._on_layer_installed(branch = 'main', arch = 'x86_64', reused = False)
+  prometheus._on_download_done(branch = 'main', arch = 'x86_64', cached = False, size = 1000, duration = 2.0)
+  prometheus._on_download_done(branch = 'main', arch = 'x86_64', cached = True, size = 500, duration = 0.0)
+  prometheus._on_package_done(branch = 'main', arch = 'x86_64', size = 4096)
+  prometheus._on_step_end(branch = 'main', arch = 'x86_64', step = 'package', duration = 12.5, ok = True)
+
+  lines = textfile.read_text().splitlines()
+  labels = '{branch="main",arch="x86_64"}'
+  assert 'redpanda_build_step_duration_seconds{branch="main",arch="x86_64",step="package"} 12.5' in lines
+  assert 'redpanda_build_step_success{branch="main",arch="x86_64",step="package"} 1' in lines
+  assert f'redpanda_build_layer_cache_hits_total{labels} 1' in lines
+  assert f'redpanda_build_layer_cache_misses_total{labels} 1' in lines
+  assert f'redpanda_build_download_cache_hits_total{labels} 1' in lines
+  assert f'redpanda_build_download_bytes_total{labels} 1000' in lines
+  assert f'redpanda_build_download_throughput_bytes_per_second{labels} 500.0' in lines
+  assert f'redpanda_build_package_size_bytes{labels} 4096' in lines
+  # every sample belongs to a family declared before it
+  declared = set()
+  for line in lines:
+    if line.startswith('# TYPE '):
+      declared.add(line.split()[2])
+    elif not line.startswith('#'):
+      assert line.split('{')[0].split(' ')[0] in declared
+  assert not list(tmp_path.glob('*.tmp'))
@@ -0,0 +1,104 @@
+import argparse
+
+import pytest
+
+from module.path import ProjectPaths
+from module.profile import resolve_profile
+from module.runner import Build, Journal, select_steps
+from module.step import Step, step_outputs
+import module.store as store
+
+# host.gmp <- host.mpfr <- x.gcc <- package, x.binutils <- x.gcc
+
+def _gmp(ver, paths, config):
+  pass
+
+def _mpfr(ver, paths, config):
+  paths.layer_host.gmp
+
+def _binutils(ver, paths, config):
+  pass
+
+def _gcc(ver, paths, config):
+  paths.layer_host.mpfr, paths.layer_x.binutils
+
+def _package(ver, paths, config):
+  paths.layer_x.gcc
+
+STEPS = [
+  Step('host.gmp', _gmp),
+  Step('host.mpfr', _mpfr),
+  Step('x.binutils', _binutils),
+  Step('x.gcc', _gcc),
+  Step('package', _package),
+]
+
+def _config(**options) -> argparse.Namespace:
+  return argparse.Namespace(**{'only': None, 'from_step': None, 'package': None, **options})
+
+@pytest.fixture
+def build(tmp_path, monkeypatch) -> Build:
+  monkeypatch.chdir(tmp_path)
+  ver = resolve_profile('main', 'x86_64')
+  paths = ProjectPaths(argparse.Namespace(build_root = tmp_path / 'build', simulate = False, branch = ['main']), ver)
+  fingerprints = {step.name: f'{step.name}-fingerprint' for step in STEPS}
+  return Build(ver, paths, STEPS, Journal(paths.journal_file), fingerprints, {})
+
+def _done(build: Build, *names: str):
+  for step in build.steps:
+    if step.name in names:
+      fingerprint = build.fingerprints[step.name]
+      if step_outputs(step):
+        store.prepare(step, build.paths, fingerprint)
+        store.complete(build.paths, fingerprint)
+      build.journal.mark_done(step.name, fingerprint, 10.0)
+
+def _selected(build: Build, config: argparse.Namespace):
+  return [(step.name, forced) for step, forced in select_steps(build, config)]
+
+def test_journal_persists(tmp_path):
+  journal = Journal(tmp_path / 'journal.json')
+  journal.mark_done('x.gcc', 'abc', 12.5)
+  reloaded = Journal(tmp_path / 'journal.json')
+  assert reloaded.is_done('x.gcc', 'abc')
+  assert reloaded.duration('x.gcc') == 12.5
+  # changed inputs
+  assert not reloaded.is_done('x.gcc', 'def')
+  assert not reloaded.is_done('host.gmp')
+
+def test_journal_invalidate_keeps_duration(tmp_path):
+  journal = Journal(tmp_path / 'journal.json')
+  journal.mark_done('x.gcc', 'abc', 12.5)
+  journal.invalidate(['x.gcc'])
+  reloaded = Journal(tmp_path / 'journal.json')
+  assert not reloaded.is_done('x.gcc', 'abc')
+  assert reloaded.duration('x.gcc') == 12.5
+
+def test_fresh_build_runs_everything(build):
+  assert _selected(build, _config()) == [(step.name, False) for step in STEPS]
+
+def test_resume_after_failure(build):
+  # x.gcc failed, its dependencies are done
+  _done(build, 'host.gmp', 'host.mpfr', 'x.binutils')
+  assert _selected(build, _config()) == [('x.gcc', False), ('package', False)]
+
+def test_missing_layer_is_not_done(build):
+  _done(build, 'host.gmp', 'host.mpfr', 'x.binutils')
+  build.paths.layer_x.binutils.unlink()
+  assert _selected(build, _config())[0] == ('x.binutils', False)
+
+def test_from_step_forces_only_its_dependents(build):
+  _done(build, 'host.gmp', 'host.mpfr', 'x.binutils', 'x.gcc', 'package')
+  assert _selected(build, _config(from_step = 'host.mpfr')) == [('host.mpfr', True), ('x.gcc', True), ('package', True)]
+
+def test_only(build):
+  _done(build, 'host.gmp', 'x.binutils')
+  assert _selected(build, _config(only = ['x.binutils,host.gmp'])) == [('host.gmp', True), ('x.binutils', True)]
+
+def test_package_builds_the_closure(build):
+  _done(build, 'host.gmp')
+  assert _selected(build, _config(package = ['x.gcc'])) == [('host.mpfr', False), ('x.binutils', False), ('x.gcc', True)]
+
+def test_unknown_step(build):
+  with pytest.raises(Exception, match = 'unknown step: x.nope'):
+    select_steps(build, _config(only = ['x.nope']))
@@ -0,0 +1,37 @@
+from pathlib import Path
+import subprocess
+import sys
+from typing import List
+
+def _simulate(cwd: Path, args: List[str]) -> subprocess.CompletedProcess:
+  return subprocess.run(
+    [sys.executable, 'main.py', '-a', 'x86_64', '--simulate', '--simulate-duration', '0', '--build-root', str(cwd / 'build'), *args],
+    cwd = cwd,
+    stdout = subprocess.PIPE,
+    stderr = subprocess.STDOUT,
+    text = True,
+    timeout = 300,
+  )
+
+def test_full_build_and_package(checkout):
+  project = checkout('project')
+  result = _simulate(project, [])
+  assert result.returncode == 0, result.stdout
+
+  layers = project / 'simulate' / 'layer' / 'main' / 'x86_64'
+  linked = [layer for layer in layers.glob('*/*') if layer.is_symlink()]
+  assert linked
+  for layer in linked:
+    assert (layer / 'usr' / 'local' / 'share' / 'simulate' / layer.name).exists()
+
+  # a layer the package mounts went missing
+  (layers / 'target' / 'qtbase').unlink()
+  result = _simulate(project, ['--only', 'package'])
+  assert result.returncode != 0
+  assert f'package would mount {layers / "target" / "qtbase"}, which no step wrote' in result.stdout
+
+def test_step_before_its_inputs(checkout):
+  project = checkout('project')
+  result = _simulate(project, ['--only', 'x.gcc'])
+  assert result.returncode != 0
+  assert 'x.gcc started before its input layer' in result.stdout
@@ -0,0 +1,14 @@
+from types import SimpleNamespace
+
+from module import steplog
+
+def test_runs_in_the_same_second_get_their_own_directory(tmp_path, monkeypatch):
+  monkeypatch.setattr(steplog, 'time', SimpleNamespace(strftime = lambda format: '20260101-120000'))
+  first = steplog.new_run_dir(tmp_path / 'log')
+  second = steplog.new_run_dir(tmp_path / 'log')
+  third = steplog.new_run_dir(tmp_path / 'log')
+
+  assert [first.name, second.name, third.name] == ['20260101-120000', '20260101-120000-2', '20260101-120000-3']
+  assert all(run_dir.is_dir() for run_dir in (first, second, third))
+  # listed in the order they started
+  assert sorted([third.name, first.name, second.name]) == [first.name, second.name, third.name]
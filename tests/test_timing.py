@@ -0,0 +1,32 @@
+import multiprocessing
+import subprocess
+import sys
+
+from module import timing
+
+def _allocate(megabytes: int):
+  subprocess.run([sys.executable, '-c', f'x = bytearray({megabytes} << 20)'], check = True)
+
+def _spans(dir):
+  # a fresh process has no waited-for children, like a step
+  timing.enable(dir)
+  with timing.span('step', 'step'):
+    with timing.span('big'):
+      _allocate(200)
+    with timing.span('small'):
+      _allocate(1)
+  with timing.span('idle', 'step'):
+    pass
+
+def test_peak_rss_only_when_known(tmp_path):
+  process = multiprocessing.get_context('fork').Process(target = _spans, args = (tmp_path,))
+  process.start()
+  process.join()
+  assert process.exitcode == 0
+
+  events = {event['name']: event for event in timing.load_events(tmp_path)}
+  assert events['big']['max_rss'] >= 200 << 20
+  assert events['step']['max_rss'] == events['big']['max_rss']
+  # below the peak of an earlier phase, its own peak is unknown
+  assert events['small']['max_rss'] is None
+  assert events['idle']['max_rss'] is None